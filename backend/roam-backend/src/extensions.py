@@ -1,3 +1,49 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import Engine
+import sqlite3
 
 db = SQLAlchemy()
+
+# SQLite ignores ON DELETE CASCADE unless foreign keys are enabled per connection
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+def create_missing_indexes():
+    # create_all() skips tables that already exist, so indexes added to existing models
+    # are created here; checkfirst makes this a no-op once they are in place
+    bind = db.engine
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def create_missing_columns():
+    # The same for columns added to existing models. A new column needs to be nullable or have a
+    # server default, so rows already in the table get a value.
+    bind = db.engine
+    inspector = inspect(bind)
+    preparer = bind.dialect.identifier_preparer
+    with bind.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    definition = CreateColumn(column).compile(dialect=bind.dialect)
+                    connection.execute(text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}'))
+
+def dialect_insert(model, bind=None):
+    # INSERT with ON CONFLICT support where the dialect has it, otherwise None. bind is a
+    # connection to use instead of the session's.
+    dialect = (bind or db.session.get_bind()).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
@@ -1,8 +1,10 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from src.extensions import db
+import click
+from src.extensions import db, create_missing_columns, create_missing_indexes
 import os
+import shutil
 import sys
 from dotenv import load_dotenv
 
@@ -14,16 +16,36 @@ load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'Content-Range', 'Accept-Ranges', 'X-Clip-Duration-Ms'])
 
 # Configure database
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# In-process cache of versioned page reads, bounded by body size; 0 disables it
+app.config['RESPONSE_CACHE_BYTES'] = int(os.getenv('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024))
+
+# Largest chunk a recording upload accepts in one request
+app.config['AUDIO_CHUNK_MAX_BYTES'] = int(os.getenv('AUDIO_CHUNK_MAX_BYTES', 16 * 1024 * 1024))
+
+# Audio file transfers can be handed to the web server: 'x-accel-redirect' (nginx, with the
+# internal location in AUDIO_ACCEL_PREFIX) or 'x-sendfile'; unset serves them from Python
+app.config['AUDIO_SENDFILE_MODE'] = os.getenv('AUDIO_SENDFILE_MODE') or None
+app.config['AUDIO_ACCEL_PREFIX'] = os.getenv('AUDIO_ACCEL_PREFIX', '/protected-audio/')
+
+# Decoder for non-WAV recordings, used for peaks, mixing and transcoding (ffmpeg by default, when installed)
+app.config['AUDIO_DECODER'] = os.getenv('AUDIO_DECODER') or shutil.which('ffmpeg')
+
+# Set to 'webm' to transcode every other recording format to WebM/Opus with the decoder
+app.config['AUDIO_TRANSCODE'] = os.getenv('AUDIO_TRANSCODE') or None
+
+# Background job processes per app process (peaks, mixing, probing, transcoding)
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+
 db.init_app(app)
 
 # Import models
-from src.models.models import Page, Block, Link, BlockReference, AudioRecording, AudioTimestamp
+from src.models.models import Page, Block, Link, LinkEvent, PageVersion, Counter, BlockMention, BlockClosure, BlockReference, AudioRecording, AudioUpload, AudioMix, AudioBlob, AudioTimestamp, Job
 
 # Import routes
 from src.routes.page_routes import page_bp
@@ -31,6 +53,13 @@ from src.routes.block_routes import block_bp
 from src.routes.link_routes import link_bp
 from src.routes.block_reference_routes import block_reference_bp
 from src.routes.audio_routes import audio_bp
+from src.routes.search_routes import search_bp
+from src.routes.export_routes import export_bp
+from src.routes.import_routes import import_bp
+from src.routes.graph_routes import graph_bp
+from src.routes.job_routes import job_bp
+from src.services.search import ensure_search_schema
+from src.services.jobs import init_jobs
 
 # Register blueprints
 app.register_blueprint(page_bp, url_prefix='/api/pages')
@@ -38,10 +67,86 @@ app.register_blueprint(block_bp, url_prefix='/api/blocks')
 app.register_blueprint(link_bp, url_prefix='/api/links')
 app.register_blueprint(block_reference_bp, url_prefix='/api/block_references')
 app.register_blueprint(audio_bp, url_prefix='/api/audio')
+app.register_blueprint(search_bp, url_prefix='/api/search')
+app.register_blueprint(export_bp, url_prefix='/api/export')
+app.register_blueprint(import_bp, url_prefix='/api/import')
+app.register_blueprint(graph_bp, url_prefix='/api/graph')
+app.register_blueprint(job_bp, url_prefix='/api/jobs')
+
+# Background jobs are dispatched from a thread in each app process
+init_jobs(app)
 
 # Initialize database tables
 with app.app_context():
     db.create_all()
+    create_missing_columns()
+    create_missing_indexes()
+    
+    # Full-text search columns and indexes (PostgreSQL only)
+    ensure_search_schema()
+
+# CLI commands
+@app.cli.command('rebuild-mentions')
+def rebuild_mentions_command():
+    from src.services.links import rebuild_mentions
+    rebuild_mentions()
+    print('Mention index and block references rebuilt')
+
+@app.cli.command('migrate-order-keys')
+def migrate_order_keys_command():
+    from src.services.ordering import migrate_order_keys
+    count = migrate_order_keys()
+    print(f'Assigned fractional order keys to {count} blocks')
+
+@app.cli.command('rebuild-closure')
+def rebuild_closure_command():
+    from src.services.ancestry import rebuild_closure
+    count = rebuild_closure()
+    print(f'Rebuilt the ancestry index for {count} blocks')
+
+@app.cli.command('export')
+@click.option('--format', 'export_format', type=click.Choice(['ndjson', 'roam']), default='ndjson')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip')
+@click.option('--output', type=click.Path(dir_okay=False), required=True)
+def export_command(export_format, compress, output):
+    from src.services.export import export_graph
+    with open(output, 'wb') as file:
+        for chunk in export_graph(export_format, compress):
+            file.write(chunk)
+    print(f'Exported the graph to {output}')
+
+@app.cli.command('import')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--workers', type=int, default=None, help='Parser processes (default: one per CPU)')
+def import_command(paths, workers):
+    from src.services.importer import import_files
+    stats = import_files(paths, workers=workers)
+    db.session.commit()
+    print(f"Imported {stats['pages']} pages, {stats['blocks']} blocks, {stats['links']} links and "
+          f"{stats['block_references']} block references from {stats['files']} files "
+          f"in {stats['seconds']}s ({stats['rows_per_second']} rows/s)")
+
+@app.cli.command('trim-link-events')
+@click.option('--keep', type=int, default=100000, help='Most recent events to keep')
+def trim_link_events_command(keep):
+    from src.services.link_graph import trim_link_events
+    count = trim_link_events(keep)
+    print(f'Deleted {count} link events')
+
+@app.cli.command('migrate-audio-storage')
+def migrate_audio_storage_command():
+    from src.services.audio_storage import migrate_storage
+    stats = migrate_storage()
+    print(f"Moved {stats['files']} audio files into the content-addressed store "
+          f"({stats['duplicates']} duplicates, {stats['missing']} missing)")
+
+@app.cli.command('gc-audio')
+@click.option('--grace', type=int, default=None, help='Seconds a blob must have been unreferenced (default: one hour)')
+def gc_audio_command(grace):
+    from src.services.audio_storage import collect_garbage, GARBAGE_GRACE_SECONDS
+    stats = collect_garbage(GARBAGE_GRACE_SECONDS if grace is None else grace)
+    print(f"Deleted {stats['blobs']} unreferenced blobs ({stats['bytes']} bytes), {stats['orphans']} orphaned "
+          f"files and {stats['incoming']} abandoned temporary files")
 
 # Routes
 @app.route('/')
@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, JSON, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from src.extensions import db
 
@@ -16,11 +16,13 @@ class Page(db.Model):
     blocks = relationship("Block", back_populates="page", cascade="all, delete-orphan")
     source_links = relationship("Link", foreign_keys="Link.source_page_id", back_populates="source_page", cascade="all, delete-orphan")
     target_links = relationship("Link", foreign_keys="Link.target_page_id", back_populates="target_page", cascade="all, delete-orphan")
+    target_mentions = relationship("BlockMention", foreign_keys="BlockMention.target_page_id", cascade="all, delete-orphan")
     audio_recordings = relationship("AudioRecording", back_populates="page", cascade="all, delete-orphan")
     
     # Indexes
     __table_args__ = (
         Index('idx_page_title', 'title'),
+        Index('idx_page_updated_at', 'updated_at', 'id'),
     )
 
 class Block(db.Model):
@@ -31,7 +33,8 @@ class Block(db.Model):
     content = Column(String, nullable=False)
     page_id = Column(Integer, ForeignKey('pages.id', ondelete='CASCADE'), nullable=False)
     parent_block_uuid = Column(String, ForeignKey('blocks.block_uuid', ondelete='CASCADE'), nullable=True)
-    order = Column(Integer, nullable=False, default=0)
+    # Fractional index key (see src/services/ordering.py); byte-order collation so keys sort as written
+    order = Column(String().with_variant(String(collation='C'), 'postgresql'), nullable=False, default='a0')
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -41,12 +44,14 @@ class Block(db.Model):
     source_references = relationship("BlockReference", foreign_keys="BlockReference.source_block_uuid", back_populates="source_block", cascade="all, delete-orphan")
     target_references = relationship("BlockReference", foreign_keys="BlockReference.target_block_uuid", back_populates="target_block", cascade="all, delete-orphan")
     audio_timestamps = relationship("AudioTimestamp", back_populates="block", cascade="all, delete-orphan")
+    mentions = relationship("BlockMention", back_populates="block", cascade="all, delete-orphan")
     
     # Indexes
     __table_args__ = (
         Index('idx_block_page_id', 'page_id'),
         Index('idx_block_parent_block_uuid', 'parent_block_uuid'),
         Index('idx_block_hierarchy', 'page_id', 'parent_block_uuid', 'order'),
+        Index('idx_block_created_at', 'created_at', 'id'),
     )
 
 class Link(db.Model):
@@ -69,12 +74,74 @@ class Link(db.Model):
         Index('idx_link_target_page_id', 'target_page_id'),
     )
 
+class PageVersion(db.Model):
+    __tablename__ = 'page_versions'
+    
+    # Bumped by every write that changes what a page's reads return; the ETags of those reads.
+    # No foreign key: a counter outlives its page, so a reused page id never repeats a version.
+    page_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class Counter(db.Model):
+    __tablename__ = 'counters'
+    
+    # Named version counters, e.g. 'titles' for renames and deletions of pages
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class LinkEvent(db.Model):
+    __tablename__ = 'link_events'
+    
+    # Append-only log of link changes; in-memory graph snapshots replay it to stay current.
+    # No foreign keys, since events outlive the pages they mention.
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # 'add', 'remove', 'remove_page' or 'rebuild'
+    source_page_id = Column(Integer, nullable=True)
+    target_page_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BlockMention(db.Model):
+    __tablename__ = 'block_mentions'
+    
+    # One row per [[Page]] mentioned in a block; source_page_id is denormalized from the block
+    id = Column(Integer, primary_key=True)
+    block_uuid = Column(String, ForeignKey('blocks.block_uuid', ondelete='CASCADE'), nullable=False)
+    source_page_id = Column(Integer, ForeignKey('pages.id', ondelete='CASCADE'), nullable=False)
+    target_page_id = Column(Integer, ForeignKey('pages.id', ondelete='CASCADE'), nullable=False)
+    
+    # Relationships
+    block = relationship("Block", back_populates="mentions")
+    
+    # Constraints and Indexes
+    __table_args__ = (
+        UniqueConstraint('block_uuid', 'target_page_id', name='uq_block_mention_block_target'),
+        Index('idx_block_mention_target_source', 'target_page_id', 'source_page_id', 'block_uuid'),
+        Index('idx_block_mention_source_page_id', 'source_page_id'),
+    )
+
+class BlockClosure(db.Model):
+    __tablename__ = 'block_closure'
+    
+    # Ancestry index: one row per (ancestor, descendant) pair, each block paired with itself at depth 0
+    ancestor_uuid = Column(String, ForeignKey('blocks.block_uuid', ondelete='CASCADE'), primary_key=True)
+    descendant_uuid = Column(String, ForeignKey('blocks.block_uuid', ondelete='CASCADE'), primary_key=True)
+    depth = Column(Integer, nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_block_closure_ancestor_depth', 'ancestor_uuid', 'depth'),
+        Index('idx_block_closure_descendant_depth', 'descendant_uuid', 'depth'),
+    )
+
 class BlockReference(db.Model):
     __tablename__ = 'block_references'
     
     id = Column(Integer, primary_key=True)
     source_block_uuid = Column(String, ForeignKey('blocks.block_uuid', ondelete='CASCADE'), nullable=False)
     target_block_uuid = Column(String, ForeignKey('blocks.block_uuid', ondelete='CASCADE'), nullable=False)
+    # 'content' for ((uuid)) refs kept in step with the source block's text; anything else was
+    # created through the API and is left alone when the block is edited
+    ref_type = Column(String, nullable=False, default='explicit', server_default='explicit')
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -116,6 +183,53 @@ class AudioRecording(db.Model):
         Index('idx_audio_recording_page_id', 'page_id'),
         Index('idx_audio_recording_block_id_context', 'block_id_context_start'),
         Index('idx_audio_recording_start_timestamp', 'start_timestamp'),
+        Index('idx_audio_recording_created_at', 'created_at', 'id'),
+        Index('idx_audio_recording_file_name', 'file_name'),
+    )
+
+class AudioUpload(db.Model):
+    __tablename__ = 'audio_uploads'
+    
+    # Progress of a chunked upload into a recording's file; chunks are appended in order, so
+    # the next chunk number and the byte count are all a client needs to resume
+    recording_id = Column(Integer, ForeignKey('audio_recordings.id', ondelete='CASCADE'), primary_key=True)
+    next_chunk = Column(Integer, nullable=False, default=0)
+    received_bytes = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+class AudioMix(db.Model):
+    __tablename__ = 'audio_mixes'
+    
+    # Mixing a recording's system audio track into its microphone track. Both source files are
+    # kept; when the mix is done the recording's file fields point at the mixed file.
+    recording_id = Column(Integer, ForeignKey('audio_recordings.id', ondelete='CASCADE'), primary_key=True)
+    mic_file_path = Column(String, nullable=False)
+    system_file_path = Column(String, nullable=False)
+    system_offset_ms = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default='queued')  # queued, mixing, done or failed
+    progress = Column(Float, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+class AudioBlob(db.Model):
+    __tablename__ = 'audio_blobs'
+    
+    # An audio file in the content-addressed store (see services/audio_storage.py). Every row
+    # that points at the file holds one reference; unreferenced blobs are garbage-collected.
+    sha256 = Column(String(64), primary_key=True)
+    file_name = Column(String, nullable=False)  # relative to the audio folder: ab/cd/<sha256><ext>
+    size_bytes = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime, nullable=True)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_audio_blob_ref_count', 'ref_count'),
     )
 
 class AudioTimestamp(db.Model):
@@ -138,3 +252,32 @@ class AudioTimestamp(db.Model):
         Index('idx_audio_timestamp_block_uuid', 'block_uuid'),
         Index('idx_audio_timestamp_timestamp_in_audio', 'timestamp_in_audio_ms'),
     )
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    # A unit of background work (see services/jobs.py). key names the work itself, e.g. the
+    # file a step runs on, so the same work is never queued twice at once.
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    key = Column(String, nullable=True)
+    recording_id = Column(Integer, ForeignKey('audio_recordings.id', ondelete='CASCADE'), nullable=True)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default='queued')  # queued, running, done or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_job_status_run_after', 'status', 'run_after'),
+        Index('idx_job_key', 'key', 'id'),
+        Index('idx_job_recording_id', 'recording_id'),
+    )
@@ -1,26 +1,29 @@
-from flask import Blueprint, request, jsonify, send_from_directory
-from src.models.models import AudioRecording, AudioTimestamp, Block
+from flask import Blueprint, request, jsonify, current_app
+from src.models.models import AudioRecording, AudioUpload, AudioMix, AudioTimestamp, Block
 from src.extensions import db
-from werkzeug.utils import secure_filename
+from src.services.pagination import keyset_response
+from src.services.audio_delivery import send_audio
+from src.services.waveform import Peaks, peaks_path, peaks_status, schedule_peaks, DEFAULT_PEAK_POINTS, MAX_PEAK_POINTS
+from src.services.audio_jobs import process_recording
+from src.services.audio_storage import AUDIO_FOLDER, save_stream, store_blob, release, delete_recordings
+from src.services.audio_upload import start_upload, append_chunk, finalize_upload, upload_state, UploadError
+from src.services.audio_mix import store_system_track, queue_mix, schedule_mix, mix_running, mix_job, mix_state, release_mix_files
 import os
-import uuid
+import numpy as np
 from datetime import datetime
 
 audio_bp = Blueprint('audio_bp', __name__)
 
-# Configure audio storage
-AUDIO_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../static/audio')
+# Configure audio storage (content-addressed, see services/audio_storage.py)
+AUDIO_UPLOAD_FOLDER = AUDIO_FOLDER
 os.makedirs(AUDIO_UPLOAD_FOLDER, exist_ok=True)
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'webm'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@audio_bp.route('/recordings', methods=['GET'])
-def get_recordings():
-    recordings = AudioRecording.query.order_by(AudioRecording.created_at.desc()).all()
-    
-    return jsonify([{
+def recording_to_dict(recording):
+    return {
         'id': recording.id,
         'file_name': recording.file_name,
         'file_path': recording.file_path,
@@ -35,28 +38,18 @@ def get_recordings():
         'audio_quality': recording.audio_quality,
         'file_size_bytes': recording.file_size_bytes,
         'created_at': recording.created_at
-    } for recording in recordings])
+    }
+
+@audio_bp.route('/recordings', methods=['GET'])
+def get_recordings():
+    # Newest first, one page of results at a time (or streamed)
+    return keyset_response(AudioRecording.query, [AudioRecording.created_at, AudioRecording.id], recording_to_dict, descending=True)
 
 @audio_bp.route('/recordings/<int:recording_id>', methods=['GET'])
 def get_recording(recording_id):
     recording = AudioRecording.query.get_or_404(recording_id)
     
-    return jsonify({
-        'id': recording.id,
-        'file_name': recording.file_name,
-        'file_path': recording.file_path,
-        'mime_type': recording.mime_type,
-        'page_id': recording.page_id,
-        'block_id_context_start': recording.block_id_context_start,
-        'start_timestamp': recording.start_timestamp,
-        'end_timestamp': recording.end_timestamp,
-        'duration_ms': recording.duration_ms,
-        'mic_device_name': recording.mic_device_name,
-        'system_audio_device_name': recording.system_audio_device_name,
-        'audio_quality': recording.audio_quality,
-        'file_size_bytes': recording.file_size_bytes,
-        'created_at': recording.created_at
-    })
+    return jsonify(recording_to_dict(recording))
 
 @audio_bp.route('/recordings', methods=['POST'])
 def create_recording():
@@ -70,17 +63,13 @@ def create_recording():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        # Generate a unique filename
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(AUDIO_UPLOAD_FOLDER, unique_filename)
-        
-        # Save the file
-        file.save(file_path)
+        # Save the file, hashed on the way in and stored once per distinct content
+        path, sha256, size = save_stream(file.stream, file.filename)
+        file_path, file_name = store_blob(db.session, path, sha256)
         
         # Create recording entry in database
         new_recording = AudioRecording(
-            file_name=unique_filename,
+            file_name=file_name,
             file_path=file_path,
             mime_type=file.content_type,
             page_id=request.form.get('page_id', type=int),
@@ -88,56 +77,50 @@ def create_recording():
             mic_device_name=request.form.get('mic_device_name'),
             system_audio_device_name=request.form.get('system_audio_device_name'),
             audio_quality=request.form.get('audio_quality'),
-            file_size_bytes=os.path.getsize(file_path)
+            file_size_bytes=size
         )
         
         db.session.add(new_recording)
+        db.session.flush()
+        # Duration and peaks are worked out in the background
+        if new_recording.file_size_bytes:
+            process_recording(new_recording)
         db.session.commit()
         
-        return jsonify({
-            'id': new_recording.id,
-            'file_name': new_recording.file_name,
-            'file_path': new_recording.file_path,
-            'mime_type': new_recording.mime_type,
-            'page_id': new_recording.page_id,
-            'block_id_context_start': new_recording.block_id_context_start,
-            'start_timestamp': new_recording.start_timestamp,
-            'end_timestamp': new_recording.end_timestamp,
-            'duration_ms': new_recording.duration_ms,
-            'mic_device_name': new_recording.mic_device_name,
-            'system_audio_device_name': new_recording.system_audio_device_name,
-            'audio_quality': new_recording.audio_quality,
-            'file_size_bytes': new_recording.file_size_bytes,
-            'created_at': new_recording.created_at
-        }), 201
+        return jsonify(recording_to_dict(new_recording)), 201
     
     return jsonify({'error': 'File type not allowed'}), 400
 
 @audio_bp.route('/recordings/<int:recording_id>', methods=['PUT'])
 def update_recording(recording_id):
     recording = AudioRecording.query.get_or_404(recording_id)
+    replaced = False
     
     # Check if the request has a file part
     if 'file' in request.files:
+        # Chunks still arriving would be written into the replacement
+        upload = AudioUpload.query.get(recording_id)
+        if upload is not None and upload.completed_at is None:
+            return jsonify({'error': 'Recording is still uploading'}), 409
         file = request.files['file']
         
         if file.filename != '' and allowed_file(file.filename):
-            # Delete old file if it exists
-            if os.path.exists(recording.file_path):
-                os.remove(recording.file_path)
-            
-            # Generate a unique filename
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            file_path = os.path.join(AUDIO_UPLOAD_FOLDER, unique_filename)
-            
-            # Save the file
-            file.save(file_path)
-            
-            recording.file_name = unique_filename
-            recording.file_path = file_path
+            # Save the new file, then let go of the old one
+            path, sha256, size = save_stream(file.stream, file.filename)
+            previous = recording.file_path
+            recording.file_path, recording.file_name = store_blob(db.session, path, sha256)
             recording.mime_type = file.content_type
-            recording.file_size_bytes = os.path.getsize(file_path)
+            recording.file_size_bytes = size
+            
+            # A new file supersedes any mix of the old one
+            mix = AudioMix.query.get(recording.id)
+            if mix is not None:
+                db.session.delete(mix)
+            db.session.flush()
+            release(db.session, previous)
+            if mix is not None:
+                release_mix_files(mix)
+            replaced = True
     
     # Update other fields from form data or JSON
     data = request.form.to_dict() if request.form else request.get_json() or {}
@@ -163,53 +146,193 @@ def update_recording(recording_id):
     if 'audio_quality' in data:
         recording.audio_quality = data['audio_quality']
     
+    # A new file is processed in the background
+    if replaced and recording.file_size_bytes:
+        process_recording(recording)
     db.session.commit()
     
-    return jsonify({
-        'id': recording.id,
-        'file_name': recording.file_name,
-        'file_path': recording.file_path,
-        'mime_type': recording.mime_type,
-        'page_id': recording.page_id,
-        'block_id_context_start': recording.block_id_context_start,
-        'start_timestamp': recording.start_timestamp,
-        'end_timestamp': recording.end_timestamp,
-        'duration_ms': recording.duration_ms,
-        'mic_device_name': recording.mic_device_name,
-        'system_audio_device_name': recording.system_audio_device_name,
-        'audio_quality': recording.audio_quality,
-        'file_size_bytes': recording.file_size_bytes,
-        'created_at': recording.created_at
+    return jsonify(recording_to_dict(recording))
+
+@audio_bp.route('/recordings/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json() or {}
+    
+    # The recording starts empty; its audio arrives through the chunk endpoint while recording
+    file_name = data.get('file_name', 'recording.webm')
+    if not allowed_file(file_name):
+        return jsonify({'error': 'File type not allowed'}), 400
+    recording, upload = start_upload(file_name, {
+        'mime_type': data.get('mime_type'),
+        'page_id': data.get('page_id'),
+        'block_id_context_start': data.get('block_id_context_start'),
+        'mic_device_name': data.get('mic_device_name'),
+        'system_audio_device_name': data.get('system_audio_device_name'),
+        'audio_quality': data.get('audio_quality')
     })
+    db.session.commit()
+    
+    return jsonify({**recording_to_dict(recording), 'upload': upload_state(upload)}), 201
+
+@audio_bp.route('/recordings/<int:recording_id>/upload', methods=['GET'])
+def get_upload(recording_id):
+    upload = AudioUpload.query.get_or_404(recording_id)
+    return jsonify(upload_state(upload))
+
+@audio_bp.route('/recordings/<int:recording_id>/chunks/<int:index>', methods=['PUT'])
+def put_chunk(recording_id, index):
+    recording = AudioRecording.query.get_or_404(recording_id)
+    upload = AudioUpload.query.get_or_404(recording_id)
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    
+    # The raw body is copied to the file as it arrives, never buffered whole
+    try:
+        stored = append_chunk(recording, upload, index, offset, request.stream, request.content_length,
+                              current_app.config['AUDIO_CHUNK_MAX_BYTES'])
+    except UploadError as error:
+        db.session.rollback()
+        return jsonify({'error': error.message, **upload_state(upload)}), error.status
+    db.session.commit()
+    
+    return jsonify({**upload_state(upload), 'stored': stored})
+
+@audio_bp.route('/recordings/<int:recording_id>/upload/complete', methods=['POST'])
+def complete_upload(recording_id):
+    recording = AudioRecording.query.get_or_404(recording_id)
+    upload = AudioUpload.query.get_or_404(recording_id)
+    data = request.get_json(silent=True) or {}
+    
+    end_timestamp = None
+    if data.get('end_timestamp'):
+        end_timestamp = datetime.fromisoformat(data['end_timestamp'].replace('Z', '+00:00')).replace(tzinfo=None)
+    if upload.completed_at is None:
+        try:
+            finalize_upload(recording, upload, end_timestamp=end_timestamp, duration_ms=data.get('duration_ms'))
+        except UploadError as error:
+            db.session.rollback()
+            return jsonify({'error': error.message, **upload_state(upload)}), error.status
+        process_recording(recording)
+    db.session.commit()
+    
+    return jsonify({**recording_to_dict(recording), 'upload': upload_state(upload)})
+
+@audio_bp.route('/recordings/<int:recording_id>/system_track', methods=['PUT'])
+def put_system_track(recording_id):
+    recording = AudioRecording.query.get_or_404(recording_id)
+    upload = AudioUpload.query.get(recording_id)
+    if upload is not None and upload.completed_at is None:
+        return jsonify({'error': 'Finish the microphone upload first'}), 409
+    file_name = request.args.get('file_name', 'system.webm')
+    if not allowed_file(file_name):
+        return jsonify({'error': 'File type not allowed'}), 400
+    offset_ms = request.args.get('offset_ms', 0, type=int)
+    if mix_running(recording_id):
+        mix = AudioMix.query.get(recording_id)
+        return jsonify({'error': 'Recording is already being mixed', **mix_state(mix)}), 409
+    
+    # The raw body is stored and the mix queued; mixing happens in a worker process
+    try:
+        system_path = store_system_track(request.stream, request.content_length, file_name)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    mix = queue_mix(recording, system_path, offset_ms)
+    schedule_mix(mix)
+    db.session.commit()
+    
+    return jsonify(mix_state(mix)), 202
+
+@audio_bp.route('/recordings/<int:recording_id>/mix', methods=['GET'])
+def get_recording_mix(recording_id):
+    mix = AudioMix.query.get_or_404(recording_id)
+    
+    # A worker that died mid-mix could not record the failure on the mix itself
+    job = mix_job(recording_id)
+    if mix.status in ('queued', 'mixing') and job is not None and job.status == 'failed':
+        mix.status = 'failed'
+        mix.error = job.error
+        db.session.commit()
+    
+    return jsonify(mix_state(mix))
+
+@audio_bp.route('/recordings/<int:recording_id>/peaks', methods=['GET'])
+def get_recording_peaks(recording_id):
+    recording = AudioRecording.query.get_or_404(recording_id)
+    upload = AudioUpload.query.get(recording_id)
+    if upload is not None and upload.completed_at is None:
+        return jsonify({'error': 'Recording is still uploading'}), 409
+    
+    # Peaks are computed in the background; 202 until the sidecar is written
+    status = peaks_status(recording.file_path)
+    if status is None:
+        schedule_peaks(recording.file_path, recording.id)
+        db.session.commit()
+        status = 'computing'
+    if status == 'computing':
+        return jsonify({'status': 'computing'}), 202
+    if status == 'failed':
+        return jsonify({'error': 'No decoder could read this recording', 'status': 'failed'}), 422
+    
+    peaks = Peaks(peaks_path(recording.file_path))
+    try:
+        start_ms = max(0, request.args.get('start', 0, type=int))
+        end_ms = request.args.get('end', int(peaks.duration_ms) + 1, type=int)
+        zoom = request.args.get('zoom', type=int)
+        if zoom is None:
+            points = max(1, min(request.args.get('points', DEFAULT_PEAK_POINTS, type=int), MAX_PEAK_POINTS))
+            zoom = peaks.zoom_for(start_ms, end_ms, points)
+        if not 0 <= zoom < peaks.zoom_levels:
+            return jsonify({'error': f'zoom must be between 0 and {peaks.zoom_levels - 1}'}), 400
+        first, data = peaks.slice(zoom, start_ms, end_ms)
+        ms_per_peak = peaks.ms_per_peak(zoom)
+        zoom_levels = peaks.zoom_levels
+        duration_ms = peaks.duration_ms
+    finally:
+        peaks.close()
+    
+    # Interleaved int8 min/max pairs, as raw bytes or a JSON list
+    if request.args.get('format') == 'binary':
+        response = current_app.response_class(data, mimetype='application/octet-stream')
+        response.headers['X-Peaks-Zoom'] = str(zoom)
+        response.headers['X-Peaks-Ms-Per-Peak'] = str(ms_per_peak)
+        response.headers['X-Peaks-Start-Ms'] = str(first * ms_per_peak)
+    else:
+        response = jsonify({
+            'zoom': zoom,
+            'zoom_levels': zoom_levels,
+            'ms_per_peak': ms_per_peak,
+            'start_ms': first * ms_per_peak,
+            'duration_ms': duration_ms,
+            'peaks': np.frombuffer(data, dtype=np.int8).tolist()
+        })
+    # The sidecar belongs to the content-named file, so the file name versions the response
+    response.set_etag(f'{recording.file_name}-{zoom}-{first}-{len(data)}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @audio_bp.route('/recordings/<int:recording_id>', methods=['DELETE'])
 def delete_recording(recording_id):
     recording = AudioRecording.query.get_or_404(recording_id)
     
-    # Delete file from filesystem
-    if os.path.exists(recording.file_path):
-        os.remove(recording.file_path)
-    
-    db.session.delete(recording)
+    # The stored files go once nothing else references them (see collect_garbage)
+    delete_recordings([recording])
     db.session.commit()
     
     return '', 204
 
-@audio_bp.route('/files/<filename>', methods=['GET'])
+@audio_bp.route('/files/<path:filename>', methods=['GET'])
 def get_audio_file(filename):
-    return send_from_directory(AUDIO_UPLOAD_FOLDER, filename)
+    return send_audio(AUDIO_UPLOAD_FOLDER, filename)
 
 @audio_bp.route('/timestamps', methods=['GET'])
 def get_timestamps():
-    timestamps = AudioTimestamp.query.all()
-    
-    return jsonify([{
+    return keyset_response(AudioTimestamp.query, [AudioTimestamp.id], lambda timestamp: {
         'id': timestamp.id,
         'recording_id': timestamp.recording_id,
         'block_uuid': timestamp.block_uuid,
         'timestamp_in_audio_ms': timestamp.timestamp_in_audio_ms,
         'block_created_at_realtime': timestamp.block_created_at_realtime
-    } for timestamp in timestamps])
+    })
 
 @audio_bp.route('/timestamps/<int:timestamp_id>', methods=['GET'])
 def get_timestamp(timestamp_id):
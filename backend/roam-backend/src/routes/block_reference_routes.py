@@ -1,19 +1,39 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
 from src.models.models import BlockReference, Block
 from src.extensions import db
+from src.services.pagination import keyset_response
+from src.services.transclusion import resolve_transclusions, DEFAULT_REF_DEPTH
+from src.services.versions import bump_pages
 
 block_reference_bp = Blueprint('block_reference_bp', __name__)
 
 @block_reference_bp.route('/', methods=['GET'])
 def get_block_references():
-    block_references = BlockReference.query.all()
-    
-    return jsonify([{
+    return keyset_response(BlockReference.query, [BlockReference.id], lambda ref: {
         'id': ref.id,
         'source_block_uuid': ref.source_block_uuid,
         'target_block_uuid': ref.target_block_uuid,
+        'ref_type': ref.ref_type,
         'created_at': ref.created_at
-    } for ref in block_references])
+    })
+
+@block_reference_bp.route('/resolve', methods=['POST'])
+def resolve_block_references():
+    data = request.get_json()
+    
+    # Everything a page or a set of blocks transcludes, in one round trip
+    if not data or ('page_id' in data) == ('block_uuids' in data):
+        return jsonify({'error': 'Either page_id or block_uuids is required'}), 400
+    block_uuids = data.get('block_uuids')
+    if block_uuids is not None and (not isinstance(block_uuids, list) or not all(isinstance(value, str) for value in block_uuids)):
+        return jsonify({'error': 'block_uuids must be a list of strings'}), 400
+    try:
+        depth = int(data.get('depth', DEFAULT_REF_DEPTH))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'depth must be an integer'}), 400
+    
+    return jsonify(resolve_transclusions(page_id=data.get('page_id'), block_uuids=block_uuids, depth=depth))
 
 @block_reference_bp.route('/<int:reference_id>', methods=['GET'])
 def get_block_reference(reference_id):
@@ -23,6 +43,7 @@ def get_block_reference(reference_id):
         'id': reference.id,
         'source_block_uuid': reference.source_block_uuid,
         'target_block_uuid': reference.target_block_uuid,
+        'ref_type': reference.ref_type,
         'created_at': reference.created_at
     })
 
@@ -55,12 +76,16 @@ def create_block_reference():
     )
     
     db.session.add(new_reference)
+    # Touching the source invalidates cached transclusions that read it
+    source_block.updated_at = datetime.utcnow()
+    bump_pages([source_block.page_id])
     db.session.commit()
     
     return jsonify({
         'id': new_reference.id,
         'source_block_uuid': new_reference.source_block_uuid,
         'target_block_uuid': new_reference.target_block_uuid,
+        'ref_type': new_reference.ref_type,
         'created_at': new_reference.created_at
     }), 201
 
@@ -68,7 +93,10 @@ def create_block_reference():
 def delete_block_reference(reference_id):
     reference = BlockReference.query.get_or_404(reference_id)
     
+    source_block = reference.source_block
     db.session.delete(reference)
+    source_block.updated_at = datetime.utcnow()
+    bump_pages([source_block.page_id])
     db.session.commit()
     
     return '', 204
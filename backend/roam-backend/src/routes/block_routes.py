@@ -1,25 +1,24 @@
 from flask import Blueprint, request, jsonify
-from src.models.models import Block, Page
+from src.models.models import Block, Page, AudioTimestamp
 from src.extensions import db
 import uuid
-from src.routes.page_routes import extract_page_links
+from src.services.links import sync_block_links
+from src.services import search
+from src.services.block_batch import apply_batch, BatchError
+from src.services.tree import fetch_tree
+from src.services.ordering import position_key, validate_key, schedule_rebalance
+from src.services.subtree import delete_subtrees, move_subtree, copy_subtree, row_to_dict, SubtreeError
+from src.services.pagination import keyset_response
+from src.services.ancestry import attach_block, reparent_block, is_descendant, ancestors, descendants
+from src.services.versions import bump_pages
+from src.services.audio_delivery import send_clip, DEFAULT_CLIP_BEFORE_MS, DEFAULT_CLIP_AFTER_MS, MAX_CLIP_MS
 
 block_bp = Blueprint('block_bp', __name__)
 
 @block_bp.route('/', methods=['GET'])
 def get_blocks():
-    blocks = Block.query.order_by(Block.created_at.desc()).all()
-    
-    return jsonify([{
-        'id': block.id,
-        'block_uuid': block.block_uuid,
-        'content': block.content,
-        'page_id': block.page_id,
-        'parent_block_uuid': block.parent_block_uuid,
-        'order': block.order,
-        'created_at': block.created_at,
-        'updated_at': block.updated_at
-    } for block in blocks])
+    # Newest first, one page of results at a time (or streamed)
+    return keyset_response(Block.query, [Block.created_at, Block.id], row_to_dict, descending=True)
 
 @block_bp.route('/<string:block_uuid>', methods=['GET'])
 def get_block(block_uuid):
@@ -51,24 +50,46 @@ def create_block():
     # Generate UUID for the block
     block_uuid = str(uuid.uuid4())
     
+    # Order key from the client, or between the given neighbour and the next sibling (default: append)
+    try:
+        if 'order' in data:
+            validate_key(data['order'])
+            order = data['order']
+        else:
+            order = position_key(
+                data['page_id'],
+                data.get('parent_block_uuid'),
+                after_uuid=data.get('after_block_uuid'),
+                before_uuid=data.get('before_block_uuid')
+            )
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    
     new_block = Block(
         block_uuid=block_uuid,
         content=data.get('content', ''),
         page_id=data['page_id'],
         parent_block_uuid=data.get('parent_block_uuid'),
-        order=data.get('order', 0)
+        order=order
     )
     
     db.session.add(new_block)
+    db.session.flush()
+    attach_block(new_block.block_uuid, new_block.parent_block_uuid)
+    bump_pages([new_block.page_id])
     
-    # Extract and create page links
+    # Sync page links and the mention index with the block's [[links]]
+    title_to_id = {}
     if data.get('content'):
-        links = extract_page_links(data['content'], data['page_id'])
-        for link in links:
-            db.session.add(link)
+        title_to_id = sync_block_links(new_block)
     
     db.session.commit()
     
+    # Keep the search index current
+    search.index_pages(title_to_id)
+    search.index_block(new_block.id, new_block.content)
+    schedule_rebalance(new_block.page_id, new_block.parent_block_uuid, new_block.order)
+    
     return jsonify({
         'id': new_block.id,
         'block_uuid': new_block.block_uuid,
@@ -80,27 +101,84 @@ def create_block():
         'updated_at': new_block.updated_at
     }), 201
 
+@block_bp.route('/batch', methods=['POST'])
+def batch_blocks():
+    data = request.get_json()
+    
+    if not data or 'operations' not in data:
+        return jsonify({'error': 'Operations are required'}), 400
+    
+    # Validate and apply every operation in a single transaction
+    try:
+        results, title_to_id, deleted_ids, long_keys = apply_batch(data['operations'])
+    except BatchError as error:
+        db.session.rollback()
+        return jsonify({'error': error.message, 'index': error.index}), 400
+    
+    db.session.commit()
+    
+    # Keep the search index current
+    search.index_pages(title_to_id)
+    for result in results:
+        if result['block']:
+            search.index_block(result['block']['id'], result['block']['content'])
+    for block_id in deleted_ids:
+        search.unindex_block(block_id)
+    for (page_id, parent_uuid), order in long_keys.items():
+        schedule_rebalance(page_id, parent_uuid, order)
+    
+    return jsonify(results)
+
 @block_bp.route('/<string:block_uuid>', methods=['PUT'])
 def update_block(block_uuid):
     block = Block.query.filter_by(block_uuid=block_uuid).first_or_404()
     data = request.get_json()
     
+    title_to_id = {}
     if 'content' in data:
         block.content = data['content']
         
-        # Extract and create page links
-        links = extract_page_links(data['content'], block.page_id)
-        for link in links:
-            db.session.add(link)
-    
-    if 'parent_block_uuid' in data:
-        block.parent_block_uuid = data['parent_block_uuid']
-    
-    if 'order' in data:
-        block.order = data['order']
+        # Sync page links and the mention index with the block's [[links]]
+        title_to_id = sync_block_links(block)
+    
+    # Moving touches only this row: a new parent and/or a key between the new neighbours
+    moved = any(key in data for key in ('parent_block_uuid', 'order', 'after_block_uuid', 'before_block_uuid'))
+    if moved:
+        parent_uuid = data.get('parent_block_uuid', block.parent_block_uuid)
+        if parent_uuid != block.parent_block_uuid and parent_uuid is not None and is_descendant(parent_uuid, block.block_uuid):
+            return jsonify({'error': 'Cannot move a block into its own subtree'}), 400
+        try:
+            if 'order' in data:
+                validate_key(data['order'])
+                order = data['order']
+            elif 'after_block_uuid' in data or 'before_block_uuid' in data or parent_uuid != block.parent_block_uuid:
+                order = position_key(
+                    block.page_id,
+                    parent_uuid,
+                    after_uuid=data.get('after_block_uuid'),
+                    before_uuid=data.get('before_block_uuid'),
+                    exclude_uuid=block.block_uuid
+                )
+            else:
+                order = block.order
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        
+        if parent_uuid != block.parent_block_uuid:
+            reparent_block(block.block_uuid, parent_uuid)
+        block.parent_block_uuid = parent_uuid
+        block.order = order
     
+    bump_pages([block.page_id])
     db.session.commit()
     
+    # Keep the search index current
+    if 'content' in data:
+        search.index_pages(title_to_id)
+        search.index_block(block.id, block.content)
+    if moved:
+        schedule_rebalance(block.page_id, block.parent_block_uuid, block.order)
+    
     return jsonify({
         'id': block.id,
         'block_uuid': block.block_uuid,
@@ -114,38 +192,94 @@ def update_block(block_uuid):
 
 @block_bp.route('/<string:block_uuid>', methods=['DELETE'])
 def delete_block(block_uuid):
+    Block.query.filter_by(block_uuid=block_uuid).first_or_404()  # Ensure block exists
+    
+    # Delete the block and its whole subtree in one statement
+    deleted = delete_subtrees([block_uuid])
+    db.session.commit()
+    
+    for block_id, _ in deleted:
+        search.unindex_block(block_id)
+    
+    return jsonify({'deleted': [deleted_uuid for _, deleted_uuid in deleted]})
+
+@block_bp.route('/<string:block_uuid>/move', methods=['PUT'])
+def move_block(block_uuid):
     block = Block.query.filter_by(block_uuid=block_uuid).first_or_404()
+    data = request.get_json() or {}
+    
+    if data.get('page_id') is not None and not Page.query.get(data['page_id']):
+        return jsonify({'error': 'Page not found'}), 404
+    
+    try:
+        rows = move_subtree(
+            block,
+            page_id=data.get('page_id'),
+            parent_uuid=data.get('parent_block_uuid'),
+            after_uuid=data.get('after_block_uuid'),
+            before_uuid=data.get('before_block_uuid')
+        )
+    except SubtreeError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    db.session.commit()
+    
+    schedule_rebalance(rows[0].page_id, data.get('parent_block_uuid'), next(row.order for row in rows if row.block_uuid == block_uuid))
+    
+    # Only the rows that changed: the root, plus its descendants when the page changed
+    return jsonify([row_to_dict(row) for row in rows])
+
+@block_bp.route('/<string:block_uuid>/copy', methods=['POST'])
+def copy_block(block_uuid):
+    block = Block.query.filter_by(block_uuid=block_uuid).first_or_404()
+    data = request.get_json() or {}
+    
+    page_id = data.get('page_id', block.page_id)
+    if not Page.query.get(page_id):
+        return jsonify({'error': 'Page not found'}), 404
+    
+    try:
+        rows = copy_subtree(
+            block,
+            page_id,
+            parent_uuid=data.get('parent_block_uuid'),
+            after_uuid=data.get('after_block_uuid'),
+            before_uuid=data.get('before_block_uuid')
+        )
+    except SubtreeError as error:
+        return jsonify({'error': str(error)}), 400
     
-    db.session.delete(block)
     db.session.commit()
     
-    return '', 204
+    for row in rows:
+        search.index_block(row.id, row.content)
+    
+    return jsonify([row_to_dict(row) for row in rows]), 201
 
 @block_bp.route('/<string:block_uuid>/indent', methods=['PUT'])
 def indent_block(block_uuid):
     block = Block.query.filter_by(block_uuid=block_uuid).first_or_404()
     
-    # Get all blocks at the same level
-    sibling_blocks = Block.query.filter_by(
-        page_id=block.page_id,
-        parent_block_uuid=block.parent_block_uuid
-    ).order_by(Block.order).all()
-    
-    # Find the current block's position among siblings
-    current_index = next((i for i, b in enumerate(sibling_blocks) if b.block_uuid == block_uuid), -1)
+    # The previous sibling becomes the parent; one indexed read instead of loading every sibling
+    new_parent = Block.query.filter(
+        Block.page_id == block.page_id,
+        Block.parent_block_uuid == block.parent_block_uuid,
+        Block.order < block.order
+    ).order_by(Block.order.desc()).first()
     
-    if current_index <= 0:
+    if not new_parent:
         return jsonify({'error': 'Cannot indent the first block or block not found among siblings'}), 400
     
-    # Get the previous sibling to become the parent
-    new_parent = sibling_blocks[current_index - 1]
-    
-    # Update the block's parent and reset order
+    # Last child of the new parent, so the block stays where it is on screen
+    block.order = position_key(block.page_id, new_parent.block_uuid)
     block.parent_block_uuid = new_parent.block_uuid
-    block.order = 0  # First child of the new parent
+    reparent_block(block.block_uuid, new_parent.block_uuid)
+    bump_pages([block.page_id])
     
     db.session.commit()
     
+    schedule_rebalance(block.page_id, block.parent_block_uuid, block.order)
+    
     return jsonify({
         'id': block.id,
         'block_uuid': block.block_uuid,
@@ -170,14 +304,16 @@ def outdent_block(block_uuid):
     if not parent_block:
         return jsonify({'error': 'Parent block not found'}), 404
     
-    # Update the block's parent to be the parent's parent
+    # Move to the parent's level, directly after the parent
+    block.order = position_key(block.page_id, parent_block.parent_block_uuid, after_uuid=parent_block.block_uuid)
     block.parent_block_uuid = parent_block.parent_block_uuid
-    
-    # Set order to be after the parent
-    block.order = parent_block.order + 0.1
+    reparent_block(block.block_uuid, parent_block.parent_block_uuid)
+    bump_pages([block.page_id])
     
     db.session.commit()
     
+    schedule_rebalance(block.page_id, block.parent_block_uuid, block.order)
+    
     return jsonify({
         'id': block.id,
         'block_uuid': block.block_uuid,
@@ -189,10 +325,39 @@ def outdent_block(block_uuid):
         'updated_at': block.updated_at
     })
 
+@block_bp.route('/<string:block_uuid>/tree', methods=['GET'])
+def get_block_tree(block_uuid):
+    Block.query.filter_by(block_uuid=block_uuid).first_or_404()  # Ensure block exists
+    
+    max_depth = request.args.get('max_depth', type=int)
+    if max_depth is not None and max_depth < 0:
+        return jsonify({'error': 'max_depth must not be negative'}), 400
+    collapsed = [collapsed_uuid for collapsed_uuid in request.args.get('collapsed', '').split(',') if collapsed_uuid]
+    
+    # Expanding a collapsed bullet loads just its subtree
+    return jsonify(fetch_tree(root_uuid=block_uuid, max_depth=max_depth, collapsed=collapsed)[0])
+
+@block_bp.route('/<string:block_uuid>/ancestors', methods=['GET'])
+def get_block_ancestors(block_uuid):
+    Block.query.filter_by(block_uuid=block_uuid).first_or_404()  # Ensure block exists
+    
+    # Breadcrumbs from the page root down to the block's parent, in one indexed read
+    return jsonify([dict(row_to_dict(block), depth=depth) for block, depth in ancestors(block_uuid)])
+
+@block_bp.route('/<string:block_uuid>/descendants', methods=['GET'])
+def get_block_descendants(block_uuid):
+    Block.query.filter_by(block_uuid=block_uuid).first_or_404()  # Ensure block exists
+    
+    max_depth = request.args.get('max_depth', type=int)
+    if max_depth is not None and max_depth < 0:
+        return jsonify({'error': 'max_depth must not be negative'}), 400
+    
+    # Everything under the bullet as a flat list, level by level
+    return jsonify([dict(row_to_dict(block), depth=depth) for block, depth in descendants(block_uuid, max_depth)])
+
 @block_bp.route('/<string:block_uuid>/audio_timestamps', methods=['GET'])
 def get_block_audio_timestamps(block_uuid):
-    from src.models.models import AudioTimestamp
-    
+
     block = Block.query.filter_by(block_uuid=block_uuid).first_or_404()
     
     timestamps = AudioTimestamp.query.filter_by(block_uuid=block_uuid).all()
@@ -209,8 +374,33 @@ def get_block_audio_timestamps(block_uuid):
                 'id': timestamp.recording.id,
                 'file_name': timestamp.recording.file_name,
                 'file_path': timestamp.recording.file_path,
-                'mime_type': timestamp.recording.mime_type
+                'mime_type': timestamp.recording.mime_type,
+                'duration_ms': timestamp.recording.duration_ms
             }
         })
     
     return jsonify(result)
+
+@block_bp.route('/<string:block_uuid>/audio_clip', methods=['GET'])
+def get_block_audio_clip(block_uuid):
+    Block.query.filter_by(block_uuid=block_uuid).first_or_404()  # Ensure block exists
+    
+    before = request.args.get('before', DEFAULT_CLIP_BEFORE_MS, type=int)
+    after = request.args.get('after', DEFAULT_CLIP_AFTER_MS, type=int)
+    if before < 0 or after < 0 or before + after == 0 or before + after > MAX_CLIP_MS:
+        return jsonify({'error': f'before and after must be non-negative and span at most {MAX_CLIP_MS} ms'}), 400
+    
+    # The block's latest recording unless one is named
+    query = AudioTimestamp.query.filter_by(block_uuid=block_uuid)
+    recording_id = request.args.get('recording_id', type=int)
+    if recording_id is not None:
+        query = query.filter_by(recording_id=recording_id)
+    timestamp = query.order_by(AudioTimestamp.recording_id.desc()).first()
+    if timestamp is None:
+        return jsonify({'error': 'Block has no audio timestamp'}), 404
+    
+    start_ms = max(0, timestamp.timestamp_in_audio_ms - before)
+    response = send_clip(timestamp.recording.file_path, start_ms, timestamp.timestamp_in_audio_ms + after)
+    if response is None:
+        return jsonify({'error': 'Clips are only available for WAV and WebM recordings'}), 415
+    return response
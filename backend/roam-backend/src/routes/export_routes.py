@@ -0,0 +1,21 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from src.services.export import export_graph, export_filename, FORMATS
+
+export_bp = Blueprint('export_bp', __name__)
+
+@export_bp.route('/', methods=['GET'])
+def export():
+    export_format = request.args.get('format', 'ndjson')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    if export_format not in FORMATS:
+        return jsonify({'error': f'Format must be one of: {", ".join(FORMATS)}'}), 400
+    
+    # Streamed straight from the database cursors; nothing is buffered beyond one page's blocks
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    response = Response(
+        stream_with_context(export_graph(export_format, compress)),
+        mimetype='application/gzip' if compress else mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={export_filename(export_format, compress)}'
+    return response
@@ -0,0 +1,171 @@
+from flask import Blueprint, request, jsonify
+import numpy as np
+from src.models.models import Page
+from src.services.link_graph import link_graph
+from src.services.titles import title_resolver
+from src.services.layout import current_layout, MAX_ZOOM, DEFAULT_TILE_LIMIT, MAX_TILE_LIMIT
+
+graph_bp = Blueprint('graph_bp', __name__)
+
+RANKINGS = ('pagerank', 'in_degree', 'out_degree')
+DEFAULT_RANK_LIMIT = 50
+MAX_RANK_LIMIT = 1000
+
+def _rank_limit():
+    limit = request.args.get('limit', DEFAULT_RANK_LIMIT, type=int)
+    return max(1, min(limit, MAX_RANK_LIMIT))
+
+def _top(scores, limit):
+    # Indices of the largest scores, best first, without sorting the whole array
+    limit = min(limit, len(scores))
+    if limit == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    return top[np.lexsort((top, -scores[top]))]
+
+def _page_metrics(graph, index):
+    in_degree, out_degree = graph.degrees()
+    labels = graph.components()
+    return {
+        'id': int(graph.page_ids[index]),
+        'pagerank': float(graph.pagerank()[index]),
+        'in_degree': int(in_degree[index]),
+        'out_degree': int(out_degree[index]),
+        'component': int(graph.page_ids[labels[index]])
+    }
+
+@graph_bp.route('/stats', methods=['GET'])
+def get_stats():
+    graph = link_graph()
+    labels = graph.components()
+    return jsonify({
+        'version': graph.version,
+        'pages': graph.node_count,
+        'links': graph.edge_count,
+        'components': int(np.count_nonzero(labels == np.arange(graph.node_count))),
+        'memory_bytes': graph.nbytes
+    })
+
+@graph_bp.route('/rank', methods=['GET'])
+def get_rank():
+    by = request.args.get('by', 'pagerank')
+    if by not in RANKINGS:
+        return jsonify({'error': f'by must be one of: {", ".join(RANKINGS)}'}), 400
+    
+    graph = link_graph()
+    in_degree, out_degree = graph.degrees()
+    scores = {'pagerank': graph.pagerank(), 'in_degree': in_degree, 'out_degree': out_degree}[by]
+    top = _top(scores, _rank_limit())
+    
+    page_ids = [int(graph.page_ids[index]) for index in top]
+    titles = title_resolver.page_titles(page_ids)
+    return jsonify([{**_page_metrics(graph, index), 'title': titles.get(page_id)} for index, page_id in zip(top, page_ids)])
+
+@graph_bp.route('/pages/<int:page_id>', methods=['GET'])
+def get_page_metrics(page_id):
+    page = Page.query.get_or_404(page_id)
+    graph = link_graph()
+    
+    index = graph.position(page_id)
+    if index is None:
+        # Created since the snapshot was taken and not linked yet
+        return jsonify({'id': page_id, 'title': page.title, 'pagerank': None, 'in_degree': 0, 'out_degree': 0, 'component': page_id, 'component_size': 1})
+    
+    labels = graph.components()
+    return jsonify({
+        **_page_metrics(graph, index),
+        'title': page.title,
+        'component_size': int(np.count_nonzero(labels == labels[index]))
+    })
+
+@graph_bp.route('/components', methods=['GET'])
+def get_components():
+    # Largest weakly connected components, each named by its lowest page id
+    graph = link_graph()
+    labels = graph.components()
+    sizes = np.bincount(labels, minlength=graph.node_count)
+    top = _top(sizes, _rank_limit())
+    return jsonify([{
+        'component': int(graph.page_ids[index]),
+        'size': int(sizes[index])
+    } for index in top if sizes[index] > 0])
+
+@graph_bp.route('/path', methods=['GET'])
+def get_path():
+    source_id = request.args.get('from', type=int)
+    target_id = request.args.get('to', type=int)
+    directed = request.args.get('directed', '').lower() in ('1', 'true', 'yes')
+    
+    if source_id is None or target_id is None:
+        return jsonify({'error': 'from and to page IDs are required'}), 400
+    
+    path = link_graph().shortest_path(source_id, target_id, directed=directed)
+    if path is None:
+        return jsonify({'error': 'No path between these pages'}), 404
+    
+    titles = title_resolver.page_titles(path)
+    return jsonify({
+        'length': len(path) - 1,
+        'path': [{'id': page_id, 'title': titles.get(page_id)} for page_id in path]
+    })
+
+@graph_bp.route('/layout', methods=['GET'])
+def get_layout():
+    # Layouts are computed in the background; 202 until the first one for this graph is ready
+    graph = link_graph()
+    layout = current_layout(graph)
+    if layout is None:
+        return jsonify({'status': 'computing', 'graph_version': graph.version}), 202
+    
+    return jsonify({
+        'status': 'ready' if layout.version == graph.version else 'updating',
+        'version': layout.version,
+        'graph_version': graph.version,
+        'pages': layout.graph.node_count,
+        'links': layout.graph.edge_count,
+        'max_zoom': MAX_ZOOM,
+        'tiles': f'/api/graph/layout/tiles/{{z}}/{{x}}/{{y}}?version={layout.version}'
+    })
+
+@graph_bp.route('/layout/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_layout_tile(z, x, y):
+    # Nodes positioned in one tile of the unit square, most central first, with their outgoing links
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        return jsonify({'error': f'Tile out of range (z is 0-{MAX_ZOOM}, x and y are below 2**z)'}), 400
+    limit = max(1, min(request.args.get('limit', DEFAULT_TILE_LIMIT, type=int), MAX_TILE_LIMIT))
+    version = request.args.get('version', type=int)
+    
+    layout = current_layout(link_graph(), version)
+    if layout is None:
+        if version is not None:
+            return jsonify({'error': 'Layout version is no longer cached'}), 404
+        return jsonify({'status': 'computing'}), 202
+    
+    members, total = layout.tile(z, x, y, limit)
+    sources, targets = layout.tile_links(members)
+    page_ids = layout.graph.page_ids
+    in_degree, out_degree = layout.graph.degrees()
+    ranks = layout.graph.pagerank()
+    titles = title_resolver.page_titles(page_ids[members].tolist())
+    
+    return jsonify({
+        'version': layout.version,
+        'z': z,
+        'x': x,
+        'y': y,
+        'total': total,
+        'nodes': [{
+            'id': int(page_ids[index]),
+            'title': titles.get(int(page_ids[index])),
+            'x': float(layout.positions[index, 0]),
+            'y': float(layout.positions[index, 1]),
+            'degree': int(in_degree[index] + out_degree[index]),
+            'pagerank': float(ranks[index])
+        } for index in members],
+        'links': [{
+            'source': int(page_ids[source]),
+            'target': int(page_ids[target]),
+            'target_x': float(layout.positions[target, 0]),
+            'target_y': float(layout.positions[target, 1])
+        } for source, target in zip(sources, targets)]
+    })
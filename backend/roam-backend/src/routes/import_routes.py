@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from werkzeug.utils import secure_filename
+from src.extensions import db
+from src.services.importer import import_files, IMPORT_EXTENSIONS
+import os
+import tempfile
+import zipfile
+
+import_bp = Blueprint('import_bp', __name__)
+
+@import_bp.route('/', methods=['POST'])
+def import_graph():
+    files = request.files.getlist('files')
+    
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # Roam JSON and Markdown files as they are; zip archives (e.g. an Obsidian vault) unpacked
+        for index, file in enumerate(files):
+            filename = secure_filename(file.filename or '')
+            if filename.lower().endswith('.zip'):
+                with zipfile.ZipFile(file.stream) as archive:
+                    archive.extractall(os.path.join(directory, str(index)))
+            elif filename.lower().endswith(IMPORT_EXTENSIONS):
+                # Markdown pages are titled after the file, so it keeps its own name in a folder of its own
+                name = os.path.basename((file.filename or '').replace('\\', '/'))
+                if '\0' in name:
+                    name = filename
+                os.makedirs(os.path.join(directory, str(index)))
+                file.save(os.path.join(directory, str(index), name))
+            else:
+                return jsonify({'error': f'Unsupported file type: {file.filename}'}), 400
+        
+        try:
+            stats = import_files([directory])
+        except (ValueError, UnicodeDecodeError) as error:
+            db.session.rollback()
+            return jsonify({'error': f'Could not parse import: {error}'}), 400
+    
+    db.session.commit()
+    
+    return jsonify(stats), 201
@@ -0,0 +1,37 @@
+from flask import Blueprint, request, jsonify
+from src.models.models import Job
+from src.extensions import db
+from src.services.pagination import keyset_response
+from src.services.jobs import job_to_dict, retry_job
+
+job_bp = Blueprint('job_bp', __name__)
+
+@job_bp.route('/', methods=['GET'])
+def get_jobs():
+    # Newest first, optionally narrowed to a status, a kind or a recording
+    query = Job.query
+    for field in ('status', 'kind'):
+        if request.args.get(field):
+            query = query.filter(getattr(Job, field) == request.args[field])
+    recording_id = request.args.get('recording_id', type=int)
+    if recording_id is not None:
+        query = query.filter(Job.recording_id == recording_id)
+    return keyset_response(query, [Job.id], job_to_dict, descending=True)
+
+@job_bp.route('/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    
+    return jsonify(job_to_dict(job))
+
+@job_bp.route('/<int:job_id>/retry', methods=['POST'])
+def retry(job_id):
+    job = Job.query.get_or_404(job_id)
+    
+    try:
+        retry_job(job)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 409
+    db.session.commit()
+    
+    return jsonify(job_to_dict(job)), 202
@@ -1,20 +1,21 @@
 from flask import Blueprint, request, jsonify
 from src.models.models import Link, Page
 from src.extensions import db
+from src.services.pagination import keyset_response
+from src.services.link_graph import record_link_events
+from src.services.versions import bump_pages
 
 link_bp = Blueprint('link_bp', __name__)
 
 @link_bp.route('/', methods=['GET'])
 def get_links():
-    links = Link.query.all()
-    
-    return jsonify([{
+    return keyset_response(Link.query, [Link.id], lambda link: {
         'id': link.id,
         'source_page_id': link.source_page_id,
         'target_page_id': link.target_page_id,
         'link_type': link.link_type,
         'created_at': link.created_at
-    } for link in links])
+    })
 
 @link_bp.route('/<int:link_id>', methods=['GET'])
 def get_link(link_id):
@@ -58,6 +59,8 @@ def create_link():
     )
     
     db.session.add(new_link)
+    record_link_events('add', [(new_link.source_page_id, new_link.target_page_id)])
+    bump_pages([new_link.source_page_id, new_link.target_page_id])
     db.session.commit()
     
     return jsonify({
@@ -73,6 +76,8 @@ def delete_link(link_id):
     link = Link.query.get_or_404(link_id)
     
     db.session.delete(link)
+    record_link_events('remove', [(link.source_page_id, link.target_page_id)])
+    bump_pages([link.source_page_id, link.target_page_id])
     db.session.commit()
     
     return '', 204
@@ -1,8 +1,17 @@
 from flask import Blueprint, request, jsonify
-from src.models.models import Page, Block, Link
+from src.models.models import Page, Block, Link, BlockMention
 from src.extensions import db
+from src.services.pagination import get_limit, encode_cursor, decode_cursor, keyset_after, keyset_response
+from src.services import search
+from src.services.tree import fetch_tree
+from src.services.graph import neighbourhood, DEFAULT_GRAPH_LIMIT
+from src.services.link_graph import record_link_events, latest_link_event
+from src.services.versions import bump_pages, bump_mentioned_by, page_version, titles_version
+from src.services.http_cache import versioned
+from src.services.titles import title_resolver, titles_changed, DEFAULT_SUGGESTIONS
+from src.services.rename import rename_page, RenameError
+from src.services.audio_storage import delete_recordings
 import uuid
-import re
 
 page_bp = Blueprint('page_bp', __name__)
 
@@ -10,19 +19,38 @@ page_bp = Blueprint('page_bp', __name__)
 def get_pages():
     search_query = request.args.get('search', '')
     
+    query = Page.query
     if search_query:
-        pages = Page.query.filter(Page.title.ilike(f'%{search_query}%')).order_by(Page.updated_at.desc()).all()
-    else:
-        pages = Page.query.order_by(Page.updated_at.desc()).all()
+        query = query.filter(Page.title.ilike(f'%{search_query}%'))
     
-    return jsonify([{
+    # Most recently updated first, one page of results at a time (or streamed)
+    return keyset_response(query, [Page.updated_at, Page.id], lambda page: {
         'id': page.id,
         'title': page.title,
         'created_at': page.created_at,
         'updated_at': page.updated_at
-    } for page in pages])
+    }, descending=True)
+
+@page_bp.route('/lookup', methods=['GET'])
+def lookup_page():
+    # Exact title lookup, e.g. for daily notes, served from the title cache
+    title = request.args.get('title', '')
+    page_id = title_resolver.page_ids([title]).get(title)
+    if page_id is None:
+        return jsonify({'error': 'Page not found'}), 404
+    
+    return jsonify({'id': page_id, 'title': title})
+
+@page_bp.route('/autocomplete', methods=['GET'])
+def autocomplete_titles():
+    # Suggestions for [[ in the editor
+    text = request.args.get('q', '')
+    limit = request.args.get('limit', DEFAULT_SUGGESTIONS, type=int)
+    
+    return jsonify([{'id': page_id, 'title': title} for title, page_id in title_resolver.suggest(text, limit)])
 
 @page_bp.route('/<int:page_id>', methods=['GET'])
+@versioned(page_version)
 def get_page(page_id):
     page = Page.query.get_or_404(page_id)
     
@@ -41,14 +69,17 @@ def create_page():
         return jsonify({'error': 'Title is required'}), 400
     
     # Check if page with this title already exists
-    existing_page = Page.query.filter_by(title=data['title']).first()
-    if existing_page:
+    if data['title'] in title_resolver.page_ids([data['title']]):
         return jsonify({'error': 'Page with this title already exists'}), 409
     
     new_page = Page(title=data['title'])
     db.session.add(new_page)
+    db.session.flush()
+    bump_pages([new_page.id])
     db.session.commit()
     
+    search.index_page(new_page.id, new_page.title)
+    
     return jsonify({
         'id': new_page.id,
         'title': new_page.title,
@@ -64,31 +95,51 @@ def update_page(page_id):
     if not data or 'title' not in data:
         return jsonify({'error': 'Title is required'}), 400
     
-    # Check if another page with this title already exists
-    existing_page = Page.query.filter_by(title=data['title']).first()
-    if existing_page and existing_page.id != page_id:
-        return jsonify({'error': 'Another page with this title already exists'}), 409
-    
-    page.title = data['title']
+    # Renames rewrite every [[Old Title]] reference in the same transaction; a title that is
+    # taken is a conflict unless the client asks to merge into the existing page
+    try:
+        page, rewritten, merged_id = rename_page(page, data['title'], merge=bool(data.get('merge')))
+    except RenameError as error:
+        return jsonify({'error': str(error)}), 409
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
     db.session.commit()
     
+    search.index_page(page.id, page.title)
+    if merged_id is not None:
+        search.unindex_page(merged_id)
+    if rewritten:
+        search.inverted_index.invalidate()
+    
     return jsonify({
         'id': page.id,
         'title': page.title,
         'created_at': page.created_at,
-        'updated_at': page.updated_at
+        'updated_at': page.updated_at,
+        'rewritten_blocks': rewritten,
+        'merged_page_id': merged_id
     })
 
 @page_bp.route('/<int:page_id>', methods=['DELETE'])
 def delete_page(page_id):
     page = Page.query.get_or_404(page_id)
+    block_ids = [block.id for block in page.blocks]
     
+    bump_mentioned_by(page_id)
+    titles_changed()
+    # The page's recordings go with it; their stored files are released, not leaked
+    delete_recordings(page.audio_recordings)
+    db.session.expire(page, ['audio_recordings'])
     db.session.delete(page)
+    record_link_events('remove_page', [(page_id, None)])
     db.session.commit()
     
+    search.unindex_page(page_id, block_ids)
+    
     return '', 204
 
 @page_bp.route('/<int:page_id>/blocks', methods=['GET'])
+@versioned(page_version)
 def get_page_blocks(page_id):
     Page.query.get_or_404(page_id)  # Ensure page exists
     
@@ -105,120 +156,90 @@ def get_page_blocks(page_id):
         'updated_at': block.updated_at
     } for block in blocks])
 
+@page_bp.route('/<int:page_id>/tree', methods=['GET'])
+@versioned(page_version)
+def get_page_tree(page_id):
+    Page.query.get_or_404(page_id)  # Ensure page exists
+    
+    max_depth = request.args.get('max_depth', type=int)
+    if max_depth is not None and max_depth < 0:
+        return jsonify({'error': 'max_depth must not be negative'}), 400
+    collapsed = [block_uuid for block_uuid in request.args.get('collapsed', '').split(',') if block_uuid]
+    
+    return jsonify(fetch_tree(page_id=page_id, max_depth=max_depth, collapsed=collapsed))
+
 @page_bp.route('/<int:page_id>/linked_references', methods=['GET'])
+@versioned(page_version)
 def get_linked_references(page_id):
-    page = Page.query.get_or_404(page_id)
-    
-    # Get all links where this page is the target
-    links = Link.query.filter_by(target_page_id=page_id).all()
+    Page.query.get_or_404(page_id)  # Ensure page exists
+    limit = get_limit()
+    
+    # One indexed join over the mention index, ordered so blocks arrive grouped by source page
+    query = db.session.query(
+        BlockMention.source_page_id,
+        BlockMention.block_uuid,
+        Page.title,
+        Block.id,
+        Block.content,
+        Link.id
+    ).join(
+        Block, Block.block_uuid == BlockMention.block_uuid
+    ).join(
+        Page, Page.id == BlockMention.source_page_id
+    ).outerjoin(
+        Link, (Link.source_page_id == BlockMention.source_page_id) & (Link.target_page_id == page_id)
+    ).filter(
+        BlockMention.target_page_id == page_id,
+        BlockMention.source_page_id != page_id
+    )
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor)
+        if not values or len(values) != 2:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(keyset_after([BlockMention.source_page_id, BlockMention.block_uuid], values))
+    
+    rows = query.order_by(BlockMention.source_page_id, BlockMention.block_uuid).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     result = []
-    for link in links:
-        source_page = link.source_page
-        
-        # Find blocks in the source page that contain references to this page
-        blocks_with_references = Block.query.filter_by(page_id=source_page.id).filter(
-            Block.content.like(f'%[[{page.title}]]%')
-        ).all()
-        
-        if blocks_with_references:
+    for source_page_id, block_uuid, source_title, block_id, content, link_id in rows:
+        if not result or result[-1]['source_page_id'] != source_page_id:
             result.append({
-                'id': link.id,
-                'source_page_id': source_page.id,
+                'id': link_id,
+                'source_page_id': source_page_id,
                 'target_page_id': page_id,
                 'source_page': {
-                    'id': source_page.id,
-                    'title': source_page.title
+                    'id': source_page_id,
+                    'title': source_title
                 },
-                'blocks': [{
-                    'id': block.id,
-                    'block_uuid': block.block_uuid,
-                    'content': block.content
-                } for block in blocks_with_references]
+                'blocks': []
             })
+        result[-1]['blocks'].append({
+            'id': block_id,
+            'block_uuid': block_uuid,
+            'content': content
+        })
     
-    return jsonify(result)
+    response = jsonify(result)
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor([rows[-1][0], rows[-1][1]])
+    return response
 
 @page_bp.route('/<int:page_id>/graph', methods=['GET'])
+@versioned(lambda page_id: f'{latest_link_event()}.{titles_version()}')
 def get_page_graph(page_id):
-    page = Page.query.get_or_404(page_id)
-    
-    # Get all links where this page is either source or target
-    outgoing_links = Link.query.filter_by(source_page_id=page_id).all()
-    incoming_links = Link.query.filter_by(target_page_id=page_id).all()
-    
-    nodes = []
-    links = []
-    
-    # Add current page as central node
-    nodes.append({
-        'id': page.id,
-        'title': page.title,
-        'type': 'current'
-    })
+    Page.query.get_or_404(page_id)  # Ensure page exists
     
-    # Add nodes and links for outgoing connections
-    for link in outgoing_links:
-        target_page = link.target_page
-        nodes.append({
-            'id': target_page.id,
-            'title': target_page.title,
-            'type': 'outgoing'
-        })
-        links.append({
-            'source': page.id,
-            'target': target_page.id,
-            'type': 'outgoing'
-        })
+    depth = request.args.get('depth', 1, type=int)
+    limit = request.args.get('limit', DEFAULT_GRAPH_LIMIT, type=int)
     
-    # Add nodes and links for incoming connections
-    for link in incoming_links:
-        source_page = link.source_page
-        # Skip if already added as an outgoing connection
-        if source_page.id != page.id and not any(node['id'] == source_page.id for node in nodes):
-            nodes.append({
-                'id': source_page.id,
-                'title': source_page.title,
-                'type': 'incoming'
-            })
-        links.append({
-            'source': source_page.id,
-            'target': page.id,
-            'type': 'incoming'
-        })
+    # depth + 3 queries however many links the neighbourhood has
+    nodes, links = neighbourhood(page_id, depth=depth, limit=limit)
     
     return jsonify({
         'nodes': nodes,
         'links': links
     })
-
-# Helper function to extract page links from content
-def extract_page_links(content, page_id):
-    # Find all [[Page Name]] patterns
-    link_pattern = r'\[\[(.*?)\]\]'
-    matches = re.findall(link_pattern, content)
-    
-    links = []
-    for match in matches:
-        # Find or create the target page
-        target_page = Page.query.filter_by(title=match).first()
-        if not target_page:
-            target_page = Page(title=match)
-            db.session.add(target_page)
-            db.session.flush()  # Get ID without committing
-        
-        # Create link if it doesn't exist
-        existing_link = Link.query.filter_by(
-            source_page_id=page_id,
-            target_page_id=target_page.id
-        ).first()
-        
-        if not existing_link and target_page.id != page_id:  # Avoid self-links
-            new_link = Link(
-                source_page_id=page_id,
-                target_page_id=target_page.id,
-                link_type='explicit'
-            )
-            links.append(new_link)
-    
-    return links
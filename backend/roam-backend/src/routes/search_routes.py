@@ -0,0 +1,30 @@
+from flask import Blueprint, request, jsonify
+from src.services.pagination import get_limit, encode_cursor, decode_cursor
+from src.services.search import search
+
+search_bp = Blueprint('search_bp', __name__)
+
+@search_bp.route('/', methods=['GET'])
+def search_graph():
+    query = request.args.get('q', '').strip()
+    
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    limit = get_limit(default=20)
+    
+    after = None
+    fallback = False
+    cursor = request.args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor)
+        if not values or len(values) != 4:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        fallback, after = bool(values[0]), values[1:]
+    
+    results, next_cursor = search(query, limit, after=after, fallback=fallback)
+    
+    response = jsonify(results)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = encode_cursor(next_cursor)
+    return response
@@ -0,0 +1,143 @@
+from sqlalchemy import select, insert, delete, literal, union_all
+from sqlalchemy.orm import aliased
+from src.models.models import Block, BlockClosure
+from src.extensions import db
+
+# Closure table over parent_block_uuid: ancestor and descendant lookups are single indexed
+# reads at any depth. Rows go away with their blocks via ON DELETE CASCADE.
+blocks = Block.__table__
+closure = BlockClosure.__table__
+CLOSURE_COLUMNS = ['ancestor_uuid', 'descendant_uuid', 'depth']
+
+def descendant_uuids(root_uuids, include_roots=True):
+    statement = select(closure.c.descendant_uuid).where(closure.c.ancestor_uuid.in_(list(root_uuids)))
+    if not include_roots:
+        statement = statement.where(closure.c.depth > 0)
+    return statement
+
+def is_descendant(block_uuid, ancestor_uuid):
+    # True for the block itself too, which is what cycle checks need
+    return db.session.query(closure.c.depth).filter(
+        closure.c.ancestor_uuid == ancestor_uuid,
+        closure.c.descendant_uuid == block_uuid
+    ).first() is not None
+
+def ancestors(block_uuid):
+    # Breadcrumbs, root first
+    return db.session.query(Block, BlockClosure.depth).join(
+        BlockClosure, BlockClosure.ancestor_uuid == Block.block_uuid
+    ).filter(
+        BlockClosure.descendant_uuid == block_uuid,
+        BlockClosure.depth > 0
+    ).order_by(BlockClosure.depth.desc()).all()
+
+def descendants(block_uuid, max_depth=None):
+    # Level by level, in sibling order within each parent
+    query = db.session.query(Block, BlockClosure.depth).join(
+        BlockClosure, BlockClosure.descendant_uuid == Block.block_uuid
+    ).filter(
+        BlockClosure.ancestor_uuid == block_uuid,
+        BlockClosure.depth > 0
+    )
+    if max_depth is not None:
+        query = query.filter(BlockClosure.depth <= max_depth)
+    return query.order_by(BlockClosure.depth, Block.parent_block_uuid, Block.order, Block.id).all()
+
+def attach_block(block_uuid, parent_uuid):
+    # A new leaf: itself at depth 0 plus each of the parent's ancestors one level further down
+    rows = select(literal(block_uuid), literal(block_uuid), literal(0))
+    if parent_uuid is not None:
+        rows = union_all(rows, select(
+            closure.c.ancestor_uuid, literal(block_uuid), closure.c.depth + 1
+        ).where(closure.c.descendant_uuid == parent_uuid))
+    db.session.execute(insert(closure).from_select(CLOSURE_COLUMNS, rows))
+
+def reparent_block(block_uuid, parent_uuid):
+    # Cut the subtree loose from its old ancestors, then hang it under the new parent's;
+    # two statements whatever the size of the subtree
+    subtree = select(closure.c.descendant_uuid).where(closure.c.ancestor_uuid == block_uuid)
+    old_ancestors = select(closure.c.ancestor_uuid).where(closure.c.descendant_uuid == block_uuid, closure.c.depth > 0)
+    db.session.execute(delete(closure).where(
+        closure.c.descendant_uuid.in_(subtree),
+        closure.c.ancestor_uuid.in_(old_ancestors)
+    ))
+    if parent_uuid is None:
+        return
+    
+    above = closure.alias('above')
+    below = closure.alias('below')
+    rows = select(above.c.ancestor_uuid, below.c.descendant_uuid, above.c.depth + below.c.depth + 1).select_from(
+        above.join(below, below.c.ancestor_uuid == block_uuid)
+    ).where(above.c.descendant_uuid == parent_uuid)
+    db.session.execute(insert(closure).from_select(CLOSURE_COLUMNS, rows))
+
+def _walk_subtrees(root_uuids):
+    # Parent-pointer walk for rebuilding, since the closure rows themselves are what is stale
+    tree = select(blocks.c.block_uuid).where(blocks.c.block_uuid.in_(list(root_uuids))).cte('walk', recursive=True)
+    child = aliased(blocks)
+    tree = tree.union(select(child.c.block_uuid).join(tree, child.c.parent_block_uuid == tree.c.block_uuid))
+    return select(tree.c.block_uuid)
+
+def _closure_rows(parents, known):
+    # parents maps block -> parent for the blocks to index; known holds the ancestor lists
+    # of blocks outside that set. Each list is built once from its parent's.
+    for block_uuid in parents:
+        path = []
+        seen = set()
+        current = block_uuid
+        while current in parents and current not in known and current not in seen:
+            seen.add(current)
+            path.append(current)
+            current = parents[current]
+        chain = known.get(current, [])
+        for node in reversed(path):
+            chain = [(node, 0)] + [(ancestor, depth + 1) for ancestor, depth in chain]
+            known[node] = chain
+    
+    for block_uuid in parents:
+        for ancestor, depth in known[block_uuid]:
+            yield {'ancestor_uuid': ancestor, 'descendant_uuid': block_uuid, 'depth': depth}
+
+def rebuild_subtrees(root_uuids):
+    # Recompute whole subtrees from parent_block_uuid, for batches and copies that create
+    # or move many blocks at once; four statements however many blocks are involved
+    root_uuids = list(root_uuids)
+    if not root_uuids:
+        return 0
+    
+    walk = _walk_subtrees(root_uuids)
+    parents = dict(db.session.execute(
+        select(blocks.c.block_uuid, blocks.c.parent_block_uuid).where(blocks.c.block_uuid.in_(walk))
+    ).all())
+    
+    # Ancestor lists of the parents just above the rebuilt subtrees are still correct
+    outer = {parent for parent in parents.values() if parent is not None and parent not in parents}
+    known = {}
+    if outer:
+        for ancestor, descendant, depth in db.session.execute(
+            select(closure.c.ancestor_uuid, closure.c.descendant_uuid, closure.c.depth).where(closure.c.descendant_uuid.in_(list(outer)))
+        ):
+            known.setdefault(descendant, []).append((ancestor, depth))
+    
+    db.session.execute(delete(closure).where(closure.c.descendant_uuid.in_(walk)))
+    rows = list(_closure_rows(parents, known))
+    if rows:
+        db.session.execute(insert(closure), rows)
+    return len(parents)
+
+def rebuild_closure(batch_size=5000):
+    # Backfill for databases created before the closure table existed
+    db.session.execute(delete(closure))
+    parents = dict(db.session.query(Block.block_uuid, Block.parent_block_uuid).all())
+    
+    batch = []
+    for row in _closure_rows(parents, {}):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(closure), batch)
+            batch = []
+    
+    if batch:
+        db.session.execute(insert(closure), batch)
+    db.session.commit()
+    return len(parents)
@@ -0,0 +1,65 @@
+import subprocess
+import wave
+import numpy as np
+
+# Streaming PCM decoding for recordings: blocks of (frames, channels) float32 samples in [-1, 1],
+# so nothing larger than a block is held in memory. WAV is read natively; every other container
+# goes through an optional local decoder (ffmpeg, or AUDIO_DECODER).
+DECODE_BLOCK_FRAMES = 1 << 16
+
+def wav_blocks(path):
+    # (sample rate, iterator of blocks), or None if wave cannot read it
+    try:
+        reader = wave.open(path, 'rb')
+    except (wave.Error, EOFError):
+        return None
+    width = reader.getsampwidth()
+    channels = reader.getnchannels()
+    
+    def blocks():
+        with reader:
+            while True:
+                data = reader.readframes(DECODE_BLOCK_FRAMES)
+                if not data:
+                    return
+                if width == 1:
+                    samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+                elif width == 3:
+                    raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+                    padded = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+                    padded[:, 1:] = raw
+                    samples = padded.view('<i4').ravel().astype(np.float32) / 2 ** 31
+                else:
+                    dtype = {2: '<i2', 4: '<i4'}[width]
+                    samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / 2 ** (8 * width - 1)
+                yield samples.reshape(-1, channels)
+    return reader.getframerate(), blocks()
+
+def decoder_blocks(path, decoder, sample_rate, channels=1):
+    # 16-bit PCM piped out of the decoder at the requested rate and channel count
+    process = subprocess.Popen(
+        [decoder, '-v', 'error', '-i', path, '-f', 's16le', '-ac', str(channels), '-ar', str(sample_rate), '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    frame_bytes = 2 * channels
+    
+    def blocks():
+        try:
+            while True:
+                data = process.stdout.read(DECODE_BLOCK_FRAMES * frame_bytes)
+                if not data:
+                    break
+                data = data[:len(data) - len(data) % frame_bytes]
+                yield (np.frombuffer(data, dtype='<i2').astype(np.float32) / 2 ** 15).reshape(-1, channels)
+        finally:
+            process.stdout.close()
+            if process.wait() != 0:
+                raise RuntimeError(f'Decoder exited with status {process.returncode}')
+    return sample_rate, blocks()
+
+def open_blocks(path, decoder, sample_rate):
+    # WAV at its own rate, anything else decoded to mono at sample_rate; None if nothing can read it
+    decoded = wav_blocks(path)
+    if decoded is None and decoder:
+        decoded = decoder_blocks(path, decoder, sample_rate)
+    return decoded
@@ -0,0 +1,110 @@
+import mimetypes
+import mmap
+import os
+from urllib.parse import quote
+from flask import current_app, send_file, abort, request, jsonify, Response
+from werkzeug.security import safe_join
+from src.models.models import AudioRecording, AudioUpload
+from src.extensions import db
+from src.services.audio_format import clip_pieces
+from src.services.audio_storage import blob_sha
+
+# Audio file responses. Stored files are named by the hash of their bytes (see audio_storage),
+# so they are sent as immutable for a year; files from before the store are too once their
+# upload is done, and files still being uploaded are revalidated on every request. Range
+# requests get 206 with just the requested bytes, which is what a player seeking into a long
+# recording asks for.
+#
+# AUDIO_SENDFILE_MODE hands the byte transfer to the web server instead of a Python worker:
+#   'x-accel-redirect' - nginx; AUDIO_ACCEL_PREFIX is the internal location mapped onto the folder
+#   'x-sendfile'       - Apache mod_xsendfile, lighttpd and others that take an absolute path
+# The server then answers Range and conditional requests itself.
+#
+# Clips are a window of a recording rebuilt as a small standalone file (see audio_format): a
+# synthesized header followed by byte ranges copied out of an mmap of the original, so cutting
+# seconds out of a multi-hour recording reads only those seconds.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+AUDIO_MIME_TYPES = {
+    '.webm': 'audio/webm',
+    '.ogg': 'audio/ogg',
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav'
+}
+DEFAULT_CLIP_BEFORE_MS = 5000
+DEFAULT_CLIP_AFTER_MS = 15000
+MAX_CLIP_MS = 10 * 60 * 1000
+CLIP_BUFFER_BYTES = 64 * 1024
+
+def _is_immutable(path, filename):
+    # A file with an unfinished upload can still grow; anything else never changes
+    if blob_sha(path):
+        return True
+    pending = db.session.query(AudioUpload.recording_id).join(
+        AudioRecording, AudioRecording.id == AudioUpload.recording_id
+    ).filter(AudioRecording.file_name == filename, AudioUpload.completed_at.is_(None)).first()
+    return pending is None
+
+def send_audio(folder, filename):
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    immutable = _is_immutable(path, filename)
+    mimetype = AUDIO_MIME_TYPES.get(os.path.splitext(filename)[1].lower()) or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    mode = current_app.config.get('AUDIO_SENDFILE_MODE')
+    if mode == 'x-accel-redirect':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = current_app.config['AUDIO_ACCEL_PREFIX'].rstrip('/') + '/' + quote(filename)
+    elif mode == 'x-sendfile':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        # Werkzeug answers If-None-Match/If-Modified-Since with 304 and Range/If-Range with 206,
+        # reading only the requested bytes from the file
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=0)
+    
+    response.headers['Accept-Ranges'] = 'bytes'
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    else:
+        response.cache_control.max_age = None
+        response.cache_control.public = None
+        response.cache_control.no_cache = True
+    return response
+
+def _clip_stream(data, pieces):
+    for piece in pieces:
+        if isinstance(piece, bytes):
+            yield piece
+            continue
+        for offset in range(piece[0], piece[1], CLIP_BUFFER_BYTES):
+            yield data[offset:min(offset + CLIP_BUFFER_BYTES, piece[1])]
+
+def send_clip(file_path, start_ms, end_ms):
+    # None when the container cannot be cut without re-encoding
+    try:
+        with open(file_path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        abort(404)
+    clip = clip_pieces(data, start_ms, end_ms)
+    if clip is None:
+        data.close()
+        return None
+    mimetype, pieces, duration_ms = clip
+    if not pieces:
+        data.close()
+        return jsonify({'error': 'No audio in that window'}), 416
+    length = sum(len(piece) if isinstance(piece, bytes) else piece[1] - piece[0] for piece in pieces)
+    
+    response = Response(_clip_stream(data, pieces), mimetype=mimetype)
+    response.content_length = length
+    response.call_on_close(data.close)
+    response.headers['X-Clip-Duration-Ms'] = str(duration_ms)
+    # A recording still being uploaded yields a longer clip as it grows, so the size is in the tag
+    response.set_etag(f'{os.path.basename(file_path)}-{start_ms}-{end_ms}-{len(data)}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,409 @@
+import os
+import struct
+
+# Container-level probes for recorded audio, so the server can work out a recording's duration
+# from the file itself rather than trust the client. Only headers are read, never samples:
+# WebM (what MediaRecorder writes) is walked element by element skipping block payloads, Ogg is
+# read from its last page and WAV from its chunk headers. Unknown formats return None.
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+CLUSTER = 0x1F43B675
+CLUSTER_TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+TRACKS = 0x1654AE6B
+CLUSTER_POSITION = 0xA7
+CLUSTER_PREV_SIZE = 0xAB
+UNKNOWN_SIZE = object()
+OGG_TAIL_BYTES = 64 * 1024
+WEBM_TAIL_BYTES = 1024 * 1024
+CLUSTER_ID = CLUSTER.to_bytes(4, 'big')
+UNKNOWN_SIZE_BYTES = b'\x01\xff\xff\xff\xff\xff\xff\xff'
+
+def _read_vint(file, keep_marker):
+    first = file.read(1)
+    if not first:
+        return None, 0
+    value = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not value & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError('Invalid EBML length')
+    rest = file.read(length - 1)
+    if len(rest) != length - 1:
+        return None, 0
+    if not keep_marker:
+        value &= mask - 1
+    all_ones = value == mask - 1
+    for byte in rest:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        return UNKNOWN_SIZE, length
+    return value, length
+
+def _read_uint(file, size):
+    return int.from_bytes(file.read(size), 'big')
+
+def _webm_walk(file, end, stop_at_cluster=False):
+    # Reads elements from the current position to end. Returns (timecode scale or None, declared
+    # duration or None, latest block timecode or None, offset of the first cluster or None).
+    scale = None
+    declared = None
+    last_timecode = None
+    cluster_timecode = None
+    while file.tell() < end:
+        position = file.tell()
+        element_id, _ = _read_vint(file, True)
+        size, _ = _read_vint(file, False)
+        if element_id is None or size is None:
+            raise ValueError('Truncated EBML element')
+        start = file.tell()
+        # Containers are entered rather than skipped; children follow one another in the file, so
+        # clusters streamed with an unknown size need no special handling
+        if element_id in (SEGMENT, INFO, CLUSTER, BLOCK_GROUP):
+            if element_id == CLUSTER:
+                if stop_at_cluster:
+                    return scale, declared, last_timecode, position
+                cluster_timecode = None
+            continue
+        if size is UNKNOWN_SIZE or start + size > end:
+            raise ValueError('Unbounded EBML element')
+        if element_id == TIMECODE_SCALE:
+            scale = _read_uint(file, size)
+        elif element_id == DURATION:
+            declared = struct.unpack('>f' if size == 4 else '>d', file.read(size))[0]
+        elif element_id == CLUSTER_TIMECODE:
+            cluster_timecode = _read_uint(file, size)
+        elif element_id in (SIMPLE_BLOCK, BLOCK):
+            if cluster_timecode is None:
+                raise ValueError('Block outside a cluster')
+            _read_vint(file, False)
+            timecode = cluster_timecode + struct.unpack('>h', file.read(2))[0]
+            if last_timecode is None or timecode > last_timecode:
+                last_timecode = timecode
+        file.seek(start + size)
+    return scale, declared, last_timecode, None
+
+def _webm_duration_ms(file, file_size):
+    # The header says how long a tick is, and sometimes the duration outright (MediaRecorder
+    # leaves it out). Otherwise the last block's time is found by parsing from the last cluster
+    # in the file's tail; a candidate only counts if it parses cleanly to the end of the file.
+    # The full walk over every cluster is the fallback.
+    scale, declared, _, first_cluster = _webm_walk(file, file_size, stop_at_cluster=True)
+    scale = scale or 1000000
+    if declared:
+        return int(declared * scale / 1000000)
+    if first_cluster is None:
+        return None
+    
+    tail_start = max(first_cluster, file_size - WEBM_TAIL_BYTES)
+    file.seek(tail_start)
+    tail = file.read()
+    position = len(tail)
+    last_timecode = None
+    while last_timecode is None:
+        position = tail.rfind(CLUSTER.to_bytes(4, 'big'), 0, position)
+        if position < 0:
+            break
+        file.seek(tail_start + position)
+        try:
+            last_timecode = _webm_walk(file, file_size)[2]
+        except (ValueError, struct.error):
+            pass
+    if last_timecode is None:
+        file.seek(first_cluster)
+        last_timecode = _webm_walk(file, file_size)[2]
+    return int(last_timecode * scale / 1000000) if last_timecode is not None else None
+
+def _ogg_duration_ms(file, file_size):
+    head = file.read(512)
+    segments = head[26]
+    packet = head[27 + segments:]
+    if packet.startswith(b'OpusHead'):
+        # Opus granules count 48 kHz samples, after a pre-skip
+        rate = 48000
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+    elif packet.startswith(b'\x01vorbis'):
+        rate = struct.unpack('<I', packet[12:16])[0]
+        pre_skip = 0
+    else:
+        return None
+    
+    file.seek(max(0, file_size - OGG_TAIL_BYTES))
+    tail = file.read()
+    position = tail.rfind(b'OggS')
+    if position < 0 or position + 14 > len(tail):
+        return None
+    granule = struct.unpack('<q', tail[position + 6:position + 14])[0]
+    if granule < 0 or not rate:
+        return None
+    return int(max(0, granule - pre_skip) * 1000 / rate)
+
+def _wav_duration_ms(file, file_size):
+    file.seek(12)
+    byte_rate = None
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, size = header[:4], struct.unpack('<I', header[4:])[0]
+        if chunk_id == b'fmt ':
+            byte_rate = struct.unpack('<I', file.read(16)[8:12])[0]
+            file.seek(size - 16 + (size & 1), os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # Streaming writers leave the size unset; the data then runs to the end of the file
+            available = file_size - file.tell()
+            if size == 0 or size == 0xFFFFFFFF or size > available:
+                size = available
+            return int(size * 1000 / byte_rate)
+        else:
+            file.seek(size + (size & 1), os.SEEK_CUR)
+
+def probe_duration_ms(path):
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            magic = file.read(12)
+            file.seek(0)
+            if magic[:4] == EBML_HEADER.to_bytes(4, 'big'):
+                return _webm_duration_ms(file, file_size)
+            if magic[:4] == b'OggS':
+                return _ogg_duration_ms(file, file_size)
+            if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+                return _wav_duration_ms(file, file_size)
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None
+
+# Clips: a time window of a recording as a standalone file, described as pieces that are either
+# small synthesized byte strings or (start, end) ranges of the original, so a handler can send
+# them straight out of an mmap. WAV windows are frame arithmetic. WebM windows are found by a
+# binary search over byte offsets for clusters (timecodes grow through the file), then only the
+# window's clusters are walked; blocks keep their bytes and only timecodes in the first cluster
+# are rewritten so the clip starts at zero.
+def _element(element_id, payload):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + (0x0100000000000000 | len(payload)).to_bytes(8, 'big') + payload
+
+def _cluster_timecode(data, offset, end):
+    # The timecode of a cluster starting at offset, or None if the ID bytes there are a coincidence
+    try:
+        data.seek(offset + len(CLUSTER_ID))
+        size, _ = _read_vint(data, False)
+        element_id, _ = _read_vint(data, True)
+        length, _ = _read_vint(data, False)
+        if size is None or element_id != CLUSTER_TIMECODE or length is UNKNOWN_SIZE or not length or length > 8:
+            return None
+        timecode = _read_uint(data, length)
+        if data.tell() >= end:
+            return timecode
+        next_id, _ = _read_vint(data, True)
+        if next_id in (SIMPLE_BLOCK, BLOCK_GROUP, CLUSTER_POSITION, CLUSTER_PREV_SIZE):
+            return timecode
+    except ValueError:
+        pass
+    return None
+
+def _cluster_at(data, position, end):
+    # (offset, timecode) of the first cluster at or after position
+    while True:
+        offset = data.find(CLUSTER_ID, position, end)
+        if offset < 0:
+            return None
+        timecode = _cluster_timecode(data, offset, end)
+        if timecode is not None:
+            return offset, timecode
+        position = offset + 1
+
+def _cluster_before(data, first, end, tick):
+    # The last cluster that starts at or before tick
+    best = _cluster_at(data, first, end)
+    low, high = first, end
+    while best is not None and low < high:
+        middle = (low + high) // 2
+        found = _cluster_at(data, middle, end)
+        if found is None or found[1] > tick:
+            high = middle
+        else:
+            best = found
+            low = found[0] + 1
+    return best
+
+def _webm_layout(data, size):
+    # (end of the EBML header, timecode scale, Tracks byte range, first cluster offset)
+    data.seek(0)
+    _read_vint(data, True)
+    header_size, _ = _read_vint(data, False)
+    header_end = data.tell() + header_size
+    data.seek(header_end)
+    if _read_vint(data, True)[0] != SEGMENT:
+        raise ValueError('No segment')
+    _read_vint(data, False)
+    scale = 1000000
+    tracks = None
+    while data.tell() < size:
+        position = data.tell()
+        element_id, _ = _read_vint(data, True)
+        element_size, _ = _read_vint(data, False)
+        if element_id == CLUSTER:
+            return header_end, scale, tracks, position
+        if element_id is None or element_size is None or element_size is UNKNOWN_SIZE:
+            break
+        start = data.tell()
+        if element_id == INFO:
+            while data.tell() < start + element_size:
+                child_id, _ = _read_vint(data, True)
+                child_size, _ = _read_vint(data, False)
+                child_start = data.tell()
+                if child_id == TIMECODE_SCALE:
+                    scale = _read_uint(data, child_size)
+                data.seek(child_start + child_size)
+        elif element_id == TRACKS:
+            tracks = (position, start + element_size)
+        data.seek(start + element_size)
+    return header_end, scale, tracks, None
+
+def _block_timecode_offset(data, element_id, start, end):
+    # Offset of the 16-bit relative timecode of a SimpleBlock, or of the Block inside a BlockGroup
+    if element_id == BLOCK_GROUP:
+        data.seek(start)
+        while data.tell() < end:
+            child_id, _ = _read_vint(data, True)
+            child_size, _ = _read_vint(data, False)
+            if child_id == BLOCK:
+                break
+            data.seek(data.tell() + child_size)
+        else:
+            return None
+    else:
+        data.seek(start)
+    _read_vint(data, False)
+    return data.tell()
+
+def _webm_clip(data, size, start_ms, end_ms):
+    header_end, scale, tracks, first_cluster = _webm_layout(data, size)
+    if tracks is None or first_cluster is None:
+        return None
+    start_tick = start_ms * 1000000 // scale
+    end_tick = end_ms * 1000000 // scale
+    found = _cluster_before(data, first_cluster, size, start_tick)
+    if found is None:
+        return None
+    
+    body = []
+    base = last = following = None
+    step = 0
+    cluster_timecode = None
+    new_cluster_timecode = None
+    data.seek(found[0])
+    while data.tell() < size:
+        position = data.tell()
+        element_id, _ = _read_vint(data, True)
+        element_size, _ = _read_vint(data, False)
+        if element_id is None or element_size is None:
+            break
+        start = data.tell()
+        if element_id == CLUSTER:
+            cluster_timecode = new_cluster_timecode = None
+            continue
+        # A recording still being uploaded can end partway through an element
+        if element_size is UNKNOWN_SIZE or start + element_size > size:
+            break
+        end = start + element_size
+        if element_id == CLUSTER_TIMECODE:
+            cluster_timecode = _read_uint(data, element_size)
+            if cluster_timecode > end_tick:
+                following = cluster_timecode
+                break
+        elif element_id in (SIMPLE_BLOCK, BLOCK_GROUP) and cluster_timecode is not None:
+            offset = _block_timecode_offset(data, element_id, start, end)
+            if offset is not None:
+                relative = struct.unpack('>h', data[offset:offset + 2])[0]
+                timecode = cluster_timecode + relative
+                if timecode > end_tick:
+                    following = timecode
+                    break
+                if timecode >= start_tick:
+                    if base is None:
+                        base = timecode
+                    if new_cluster_timecode is None:
+                        new_cluster_timecode = max(0, cluster_timecode - base)
+                        body.append(CLUSTER_ID + UNKNOWN_SIZE_BYTES + _element(CLUSTER_TIMECODE, new_cluster_timecode.to_bytes(8, 'big')))
+                    new_relative = timecode - base - new_cluster_timecode
+                    if new_relative == relative:
+                        body.append((position, end))
+                    else:
+                        body.extend([(position, offset), struct.pack('>h', new_relative), (offset + 2, end)])
+                    if last is not None and timecode > last:
+                        step = timecode - last
+                    last = timecode
+        data.seek(end)
+    
+    if base is None:
+        return 'audio/webm', [], 0
+    # The last block plays until the next one starts; where the data ends, for as long as the
+    # block before it did
+    duration = (following if following is not None else last + step) - base
+    info = _element(TIMECODE_SCALE, scale.to_bytes(4, 'big')) + _element(DURATION, struct.pack('>d', duration))
+    header = [(0, header_end), SEGMENT.to_bytes(4, 'big') + UNKNOWN_SIZE_BYTES + _element(INFO, info), tracks]
+    return 'audio/webm', header + body, duration * scale // 1000000
+
+def _wav_clip(data, size, start_ms, end_ms):
+    data.seek(12)
+    fmt = None
+    while data.tell() + 8 <= size:
+        chunk_start = data.tell()
+        chunk_id = data.read(4)
+        chunk_size = struct.unpack('<I', data.read(4))[0]
+        if chunk_id == b'fmt ':
+            fmt = data[chunk_start:chunk_start + 8 + chunk_size]
+        elif chunk_id == b'data':
+            break
+        data.seek(data.tell() + chunk_size + (chunk_size & 1))
+    else:
+        return None
+    if fmt is None:
+        return None
+    rate, _, block_align = struct.unpack('<IIH', fmt[12:22])
+    # A header without a frame size cannot be cut on frame boundaries
+    if block_align == 0:
+        return None
+    data_start = data.tell()
+    available = size - data_start
+    if chunk_size == 0 or chunk_size == 0xFFFFFFFF or chunk_size > available:
+        chunk_size = available
+    frames = chunk_size // block_align
+    first = min(frames, start_ms * rate // 1000)
+    last = min(frames, -(-end_ms * rate // 1000))
+    if last <= first:
+        return 'audio/wav', [], 0
+    length = (last - first) * block_align
+    padding = b'\0' * (length & 1)
+    header = b'RIFF' + struct.pack('<I', 4 + len(fmt) + 8 + length + len(padding)) + b'WAVE' + fmt + b'data' + struct.pack('<I', length)
+    pieces = [header, (data_start + first * block_align, data_start + last * block_align)]
+    if padding:
+        pieces.append(padding)
+    return 'audio/wav', pieces, (last - first) * 1000 // rate
+
+def clip_pieces(data, start_ms, end_ms):
+    # (mimetype, pieces, duration in ms) for a window of the recording mapped at data, or None for
+    # formats that cannot be clipped without re-encoding
+    size = len(data)
+    try:
+        if data[:4] == EBML_HEADER.to_bytes(4, 'big'):
+            return _webm_clip(data, size, start_ms, end_ms)
+        if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+            return _wav_clip(data, size, start_ms, end_ms)
+    except (ValueError, IndexError, struct.error):
+        pass
+    return None
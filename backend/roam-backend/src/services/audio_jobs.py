@@ -0,0 +1,102 @@
+import os
+import subprocess
+from flask import current_app
+from src.models.models import AudioRecording
+from src.extensions import db
+from src.services.audio_format import probe_duration_ms
+from src.services.audio_storage import incoming_path, hash_file, store_blob, release
+from src.services.jobs import register_job, enqueue, PermanentJobError
+from src.services.waveform import schedule_peaks, peaks_path
+
+# Processing for a recording's file once it is final, run as background jobs so requests only
+# store the bytes: the duration and size probed from the file, waveform peaks, and with
+# AUDIO_TRANSCODE=webm a transcode of anything else to WebM/Opus (through AUDIO_DECODER) that
+# the recording then points at. Each step is keyed by the file it reads, so a step whose file
+# has since been replaced leaves the recording alone. Files are named by their SHA-256 in the
+# store (see audio_storage), so there is no separate checksum step.
+TRANSCODE_BITRATE = '64k'
+
+def _current(job):
+    # The job's recording, if the file it worked on is still that recording's file
+    recording = db.session.get(AudioRecording, job.recording_id)
+    if recording is None or recording.file_path != job.payload['file_path']:
+        return None
+    return recording
+
+def _existing(payload):
+    # A file replaced while its steps were queued is not coming back
+    if not os.path.exists(payload['file_path']):
+        raise PermanentJobError('The file no longer exists')
+    return payload['file_path']
+
+def _run_probe(payload, config):
+    path = _existing(payload)
+    return {'file_size_bytes': os.path.getsize(path), 'duration_ms': probe_duration_ms(path)}
+
+def _apply_probe(job, result):
+    recording = _current(job)
+    if recording is None:
+        return
+    recording.file_size_bytes = result['file_size_bytes']
+    if result['duration_ms'] is not None:
+        recording.duration_ms = result['duration_ms']
+
+def _run_transcode(payload, config):
+    decoder = config['AUDIO_DECODER']
+    if not decoder:
+        raise PermanentJobError('No decoder is configured')
+    source = _existing(payload)
+    output = payload['output_path']
+    temporary = f'{output}.{os.getpid()}.tmp'
+    process = subprocess.run(
+        [decoder, '-v', 'error', '-y', '-i', source, '-vn', '-c:a', 'libopus',
+         '-b:a', TRANSCODE_BITRATE, '-f', 'webm', temporary],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    if process.returncode != 0:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise PermanentJobError(process.stderr.decode(errors='replace').strip()[-500:] or 'Transcoding failed')
+    os.replace(temporary, output)
+    return {'file_size_bytes': os.path.getsize(output), 'duration_ms': probe_duration_ms(output), 'sha256': hash_file(output)}
+
+def _apply_transcode(job, result):
+    output = job.payload['output_path']
+    recording = _current(job)
+    if recording is None:
+        if os.path.exists(output):
+            os.remove(output)
+        return
+    source = recording.file_path
+    recording.file_path, recording.file_name = store_blob(db.session, output, result['sha256'])
+    recording.mime_type = 'audio/webm'
+    recording.file_size_bytes = result['file_size_bytes']
+    if result['duration_ms'] is not None:
+        recording.duration_ms = result['duration_ms']
+    # The original stays only while a mix holds it as its source
+    db.session.flush()
+    release(db.session, source)
+    _queue_steps(recording, transcode=False, probe=False)
+
+register_job('probe', _run_probe, _apply_probe)
+register_job('transcode', _run_transcode, _apply_transcode, max_attempts=2, config=('AUDIO_DECODER',))
+
+def _queue_steps(recording, transcode, probe=True):
+    path = recording.file_path
+    payload = {'file_path': path}
+    # Recordings can share a stored file, so these steps are keyed by recording as well
+    if probe:
+        enqueue('probe', payload, key=f'probe:{recording.id}:{path}', recording_id=recording.id)
+    if transcode:
+        # Peaks are left to the transcoded file
+        output = incoming_path('transcoded.webm')
+        enqueue('transcode', {**payload, 'output_path': output}, key=f'transcode:{recording.id}:{path}', recording_id=recording.id)
+    elif not os.path.exists(peaks_path(path)):
+        # A stored duplicate already has its peaks
+        schedule_peaks(path, recording.id)
+
+def process_recording(recording):
+    # Queue the processing steps for a recording whose file is final; the caller commits
+    target = current_app.config.get('AUDIO_TRANSCODE')
+    transcode = target == 'webm' and bool(current_app.config.get('AUDIO_DECODER')) and not recording.file_path.lower().endswith('.webm')
+    _queue_steps(recording, transcode)
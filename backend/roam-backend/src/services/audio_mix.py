@@ -0,0 +1,317 @@
+import os
+import subprocess
+import time
+import wave
+from datetime import datetime
+import numpy as np
+from sqlalchemy import create_engine, select, update
+from src.models.models import AudioRecording, AudioMix
+from src.extensions import db
+from src.services.audio_decode import open_blocks
+from src.services.audio_format import probe_duration_ms
+from src.services.waveform import compute_peaks, peaks_path, remove_peaks
+from src.services.audio_storage import incoming_path, save_stream, hash_file, store_blob, add_reference, release
+from src.services.jobs import register_job, enqueue, active_job, latest_job, PermanentJobError
+
+# Mixing a recording's system audio into its microphone track, off the request thread. The
+# request only stores the system track and queues the mix; a worker process decodes both tracks
+# twice as streams: once to measure their loudness, once to mix. Both are downmixed to mono,
+# resampled to a common rate, shifted by the system track's start offset and scaled towards the
+# same RMS level (with capped gain, so a quiet track is not turned into noise); the sum goes
+# through a soft limiter instead of clipping. The mix runs as a background job (see jobs); it
+# writes progress to the mix row itself and, at the end, stores the mixed file (see
+# audio_storage) and points the recording at it. The mix row holds references on both sources.
+# The mix is encoded to WebM/Opus when a decoder (ffmpeg) is available and written as 16-bit WAV
+# otherwise.
+MIX_SAMPLE_RATE = 48000
+TARGET_RMS = 0.1
+MAX_GAIN = 8.0
+SILENCE_RMS = 1e-4
+LIMIT_THRESHOLD = 0.9
+MIX_BLOCK_FRAMES = 1 << 16
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+def _mono(blocks):
+    for block in blocks:
+        yield block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+
+def _resampled(blocks, rate_in, rate_out):
+    # Streaming linear interpolation; the last input sample of each block carries over so output
+    # samples between blocks are interpolated like any other
+    if rate_in == rate_out:
+        yield from blocks
+        return
+    step = rate_in / rate_out
+    previous = None
+    start = 0
+    produced = 0
+    for block in blocks:
+        if not block.size:
+            continue
+        buffer = block if previous is None else np.concatenate([previous, block])
+        last = start + buffer.size - 1
+        count = int(last / step) + 1 - produced
+        if count > 0:
+            times = (produced + np.arange(count)) * step - start
+            yield np.interp(times, np.arange(buffer.size), buffer).astype(np.float32)
+            produced += count
+        previous = buffer[-1:]
+        start = last
+
+def _shifted(blocks, frames):
+    # Delays the track by frames of silence, or drops its first -frames
+    if frames > 0:
+        yield np.zeros(frames, dtype=np.float32)
+    skip = max(0, -frames)
+    for block in blocks:
+        if skip >= block.size:
+            skip -= block.size
+            continue
+        yield block[skip:]
+        skip = 0
+
+class _Frames:
+    # Reads fixed-size runs of frames out of an iterator of variable-size blocks
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.buffer = np.zeros(0, dtype=np.float32)
+    
+    def read(self, count):
+        parts = [self.buffer]
+        available = self.buffer.size
+        while available < count:
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            parts.append(block)
+            available += block.size
+        data = np.concatenate(parts) if len(parts) > 1 else self.buffer
+        self.buffer = data[count:]
+        return data[:count]
+
+def _limit(samples):
+    # Soft knee above LIMIT_THRESHOLD: peaks are squashed towards 1.0 rather than clipped
+    magnitude = np.abs(samples)
+    over = magnitude > LIMIT_THRESHOLD
+    if over.any():
+        headroom = 1 - LIMIT_THRESHOLD
+        samples[over] = np.sign(samples[over]) * (LIMIT_THRESHOLD + headroom * np.tanh((magnitude[over] - LIMIT_THRESHOLD) / headroom))
+    return samples
+
+class _Output:
+    # 16-bit mono PCM into ffmpeg (WebM/Opus) when there is a decoder, or into a WAV file
+    def __init__(self, stem, sample_rate, decoder):
+        self.path = stem + ('.webm' if decoder else '.wav')
+        if decoder:
+            self.process = subprocess.Popen(
+                [decoder, '-v', 'error', '-y', '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', '-',
+                 '-c:a', 'libopus', '-b:a', '64k', '-f', 'webm', self.path],
+                stdin=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            self.file = self.process.stdin
+        else:
+            self.process = None
+            self.file = wave.open(self.path, 'wb')
+            self.file.setnchannels(1)
+            self.file.setsampwidth(2)
+            self.file.setframerate(sample_rate)
+    
+    @property
+    def mime_type(self):
+        return 'audio/webm' if self.process else 'audio/wav'
+    
+    def write(self, samples):
+        data = np.round(samples * 32767).astype('<i2').tobytes()
+        if self.process:
+            self.file.write(data)
+        else:
+            self.file.writeframesraw(data)
+    
+    def close(self):
+        self.file.close()
+        if self.process and self.process.wait() != 0:
+            raise RuntimeError(f'Encoder exited with status {self.process.returncode}')
+
+def _sample_rate(path, decoder):
+    # WAV keeps its own rate; anything else is decoded at MIX_SAMPLE_RATE
+    try:
+        with wave.open(path, 'rb') as reader:
+            return reader.getframerate()
+    except (wave.Error, EOFError):
+        if not decoder:
+            raise ValueError(f'No decoder can read {os.path.basename(path)}')
+        return MIX_SAMPLE_RATE
+
+_engines = {}
+
+def _engine(database_url):
+    # Worker processes talk to the database directly, with an engine of their own
+    if database_url not in _engines:
+        _engines[database_url] = create_engine(database_url)
+    return _engines[database_url]
+
+def _set_mix(database_url, recording_id, **values):
+    with _engine(database_url).begin() as connection:
+        connection.execute(update(AudioMix).where(AudioMix.recording_id == recording_id).values(updated_at=datetime.utcnow(), **values))
+
+def mix_tracks(database_url, recording_id, mic_path, system_path, system_offset_ms, output_stem, decoder=None):
+    # Runs in a worker process. Returns False when the mix is no longer wanted; a failure is
+    # recorded on the mix row and raised.
+    output = None
+    try:
+        _set_mix(database_url, recording_id, status='mixing', progress=0, error=None)
+        sample_rate = max(_sample_rate(mic_path, decoder), _sample_rate(system_path, decoder))
+        offset_frames = round(system_offset_ms * sample_rate / 1000)
+        
+        def track(index, aligned=True):
+            path = (mic_path, system_path)[index]
+            rate, blocks = open_blocks(path, decoder, MIX_SAMPLE_RATE)
+            blocks = _resampled(_mono(blocks), rate, sample_rate)
+            return _shifted(blocks, offset_frames) if index == 1 and aligned else blocks
+        
+        # Progress is measured against the probed durations, half for each pass
+        durations = [probe_duration_ms(mic_path), probe_duration_ms(system_path)]
+        expected = max(durations[0] or 0, (durations[1] or 0) + system_offset_ms) * sample_rate / 1000
+        reported = time.monotonic()
+        
+        def report(done, fraction_base):
+            nonlocal reported
+            if expected and time.monotonic() - reported >= PROGRESS_INTERVAL_SECONDS:
+                reported = time.monotonic()
+                _set_mix(database_url, recording_id, progress=min(0.99, fraction_base + 0.5 * done / expected))
+        
+        # Pass 1: the RMS level of each track
+        gains = []
+        done = 0
+        for index in (0, 1):
+            squares = 0.0
+            frames = 0
+            for block in track(index, aligned=False):
+                squares += float(np.dot(block, block))
+                frames += block.size
+                done += block.size
+                report(done / 2, 0)
+            rms = (squares / frames) ** 0.5 if frames else 0
+            gains.append(min(MAX_GAIN, TARGET_RMS / rms) if rms > SILENCE_RMS else 1.0)
+        
+        # Pass 2: scaled sum through the limiter, padding the shorter track with silence
+        output = _Output(output_stem, sample_rate, decoder)
+        try:
+            mic, system = _Frames(track(0)), _Frames(track(1))
+            frames = 0
+            while True:
+                a, b = mic.read(MIX_BLOCK_FRAMES), system.read(MIX_BLOCK_FRAMES)
+                if not a.size and not b.size:
+                    break
+                mixed = np.zeros(max(a.size, b.size), dtype=np.float32)
+                mixed[:a.size] += a * gains[0]
+                mixed[:b.size] += b * gains[1]
+                output.write(_limit(mixed))
+                frames += mixed.size
+                report(frames, 0.5)
+        finally:
+            output.close()
+        
+        # Peaks for the new file are ready by the time the recording points at it (they move into
+        # the store with it)
+        compute_peaks(output.path, peaks_path(output.path), decoder)
+        sha256 = hash_file(output.path)
+        # Only the mix that is still wanted (same system track, recording not deleted) lands; it
+        # takes the place of the recording's file, the mic track or an earlier mix
+        with _engine(database_url).begin() as connection:
+            finished = connection.execute(update(AudioMix).where(
+                AudioMix.recording_id == recording_id, AudioMix.system_file_path == system_path
+            ).values(status='done', progress=1, updated_at=datetime.utcnow(), completed_at=datetime.utcnow())).rowcount
+            if finished:
+                previous = connection.execute(select(AudioRecording.file_path).where(AudioRecording.id == recording_id)).scalar()
+                file_path, file_name = store_blob(connection, output.path, sha256)
+                connection.execute(update(AudioRecording).where(AudioRecording.id == recording_id).values(
+                    file_name=file_name,
+                    file_path=file_path,
+                    file_size_bytes=os.path.getsize(file_path),
+                    mime_type=output.mime_type,
+                    duration_ms=frames * 1000 // sample_rate
+                ))
+                release(connection, previous)
+        if not finished:
+            os.remove(output.path)
+            remove_peaks(output.path)
+        return bool(finished)
+    except Exception as error:
+        if output is not None and os.path.exists(output.path):
+            os.remove(output.path)
+            remove_peaks(output.path)
+        message = str(error) or type(error).__name__
+        _set_mix(database_url, recording_id, status='failed', error=message)
+        raise PermanentJobError(message) from error
+
+def mix_state(mix):
+    return {
+        'recording_id': mix.recording_id,
+        'status': mix.status,
+        'progress': mix.progress,
+        'error': mix.error,
+        'system_offset_ms': mix.system_offset_ms,
+        'completed_at': mix.completed_at
+    }
+
+def store_system_track(stream, length, file_name):
+    # The system track is copied from the request stream into the store, with a reference for
+    # the mix row that is about to name it
+    path, sha256, written = save_stream(stream, f'system_{file_name}', length)
+    if not written or (length is not None and written != length):
+        os.remove(path)
+        raise ValueError('System track body is empty or ended early')
+    return store_blob(db.session, path, sha256)[0]
+
+def queue_mix(recording, system_path, system_offset_ms):
+    # Creates or resets the mix row; the mic source stays the original file across re-mixes
+    mix = AudioMix.query.get(recording.id)
+    replaced = None
+    if mix is None:
+        mix = AudioMix(recording_id=recording.id, mic_file_path=recording.file_path)
+        db.session.add(mix)
+    else:
+        replaced = mix.system_file_path
+    mix.system_file_path = system_path
+    mix.system_offset_ms = system_offset_ms
+    mix.status = 'queued'
+    mix.progress = 0
+    mix.error = None
+    mix.completed_at = None
+    db.session.flush()
+    # The mix holds its own references on both sources
+    if replaced is None:
+        add_reference(db.session, mix.mic_file_path)
+    else:
+        release(db.session, replaced)
+    return mix
+
+def release_mix_files(mix):
+    # The mix's references on its sources, once its row is deleted (flushed)
+    for path in (mix.mic_file_path, mix.system_file_path):
+        release(db.session, path)
+
+def _run_mix(payload, config):
+    mixed = mix_tracks(config['SQLALCHEMY_DATABASE_URI'], decoder=config['AUDIO_DECODER'], **payload)
+    return {'mixed': mixed}
+
+# A second attempt only covers a worker that stopped mid-mix; mix failures themselves are final
+register_job('mix', _run_mix, max_attempts=2, config=('SQLALCHEMY_DATABASE_URI', 'AUDIO_DECODER'))
+
+def schedule_mix(mix):
+    # Queue the mix; the caller commits. A no-op while that recording is already being mixed.
+    stem = incoming_path('mixed')
+    enqueue('mix', {
+        'recording_id': mix.recording_id,
+        'mic_path': mix.mic_file_path,
+        'system_path': mix.system_file_path,
+        'system_offset_ms': mix.system_offset_ms,
+        'output_stem': stem
+    }, key=f'mix:{mix.recording_id}', recording_id=mix.recording_id)
+
+def mix_job(recording_id):
+    return latest_job(f'mix:{recording_id}')
+
+def mix_running(recording_id):
+    return active_job(f'mix:{recording_id}') is not None
@@ -0,0 +1,253 @@
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, func, or_
+from sqlalchemy.engine import Connection
+from werkzeug.utils import secure_filename
+from src.models.models import AudioBlob, AudioRecording, AudioUpload, AudioMix
+from src.extensions import db, dialect_insert
+from src.services.waveform import peaks_path, remove_peaks
+
+# Content-addressed audio storage. A finished audio file is stored once, named by the SHA-256 of
+# its bytes and sharded two levels deep (ab/cd/<sha256><ext>) so no directory holds more than a
+# few hundred files. Every row that points at a blob (a recording's file, a mix's sources) holds
+# one reference on its audio_blobs row, and storing bytes that are already there drops the new
+# copy and takes another reference. Files are written under incoming/ first (uploads are hashed
+# as they stream in) and renamed into place, so a blob is never seen half-written.
+#
+# Releasing the last reference leaves the blob to collect_garbage, which deletes blobs that have
+# been unreferenced for a grace period, plus files no row knows about. The functions that take an
+# executor work with the session or, in worker processes, a connection; the caller commits.
+# The store lives under the AUDIO_FOLDER environment variable, src/static/audio by default.
+AUDIO_FOLDER = os.path.abspath(os.getenv('AUDIO_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '../static/audio'))
+INCOMING_FOLDER = os.path.join(AUDIO_FOLDER, 'incoming')
+COPY_BUFFER_BYTES = 64 * 1024
+HASH_BUFFER_BYTES = 1024 * 1024
+GARBAGE_GRACE_SECONDS = 60 * 60
+INCOMING_GRACE_SECONDS = 24 * 60 * 60
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+def incoming_path(file_name):
+    os.makedirs(INCOMING_FOLDER, exist_ok=True)
+    return os.path.join(INCOMING_FOLDER, f'{uuid.uuid4()}_{secure_filename(file_name)}')
+
+def blob_name(sha256, extension):
+    # Relative to AUDIO_FOLDER; doubles as the URL path under /api/audio/files/
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+def blob_sha(path):
+    # The hash a file in the store is named by, or None for any other path
+    path = os.path.abspath(path)
+    sha256 = os.path.basename(path).split('.', 1)[0]
+    if not SHA256_PATTERN.fullmatch(sha256) or os.path.dirname(path) != os.path.join(AUDIO_FOLDER, sha256[:2], sha256[2:4]):
+        return None
+    return sha256
+
+def save_stream(stream, file_name, length=None):
+    # Copies an upload into incoming/ while hashing it. Returns (path, sha256, bytes written).
+    path = incoming_path(file_name)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(path, 'xb') as file:
+            while length is None or written < length:
+                data = stream.read(COPY_BUFFER_BYTES if length is None else min(COPY_BUFFER_BYTES, length - written))
+                if not data:
+                    break
+                digest.update(data)
+                file.write(data)
+                written += len(data)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), written
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(HASH_BUFFER_BYTES), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+def _move_in(source, target, keep_source):
+    # Duplicates are dropped; a peaks sidecar travels with its file unless the blob has one
+    if os.path.exists(target):
+        if not keep_source:
+            os.remove(source)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if keep_source:
+            os.link(source, target)
+        else:
+            os.replace(source, target)
+        # The grace period for files no row knows about counts from here
+        os.utime(target)
+    sidecar = peaks_path(source)
+    if os.path.exists(sidecar) and not os.path.exists(peaks_path(target)):
+        os.makedirs(os.path.dirname(peaks_path(target)), exist_ok=True)
+        (os.link if keep_source else os.replace)(sidecar, peaks_path(target))
+    elif not keep_source:
+        remove_peaks(source)
+
+def store_blob(executor, path, sha256=None, keep_source=False):
+    # Moves a finished file into the store (or drops it when the store has those bytes) and takes
+    # a reference for the caller's row. keep_source hard-links instead of moving. Returns the
+    # blob's (path, file_name).
+    sha256 = sha256 or hash_file(path)
+    now = datetime.utcnow()
+    row = {
+        'sha256': sha256,
+        'file_name': blob_name(sha256, os.path.splitext(path)[1].lower()),
+        'size_bytes': os.path.getsize(path),
+        'ref_count': 0,
+        'created_at': now
+    }
+    # Waits on a collection of the same blob in progress, which removes its file before committing
+    statement = dialect_insert(AudioBlob, executor if isinstance(executor, Connection) else None)
+    if statement is not None:
+        executor.execute(statement.values(**row).on_conflict_do_nothing(index_elements=['sha256']))
+    elif executor.execute(select(AudioBlob.sha256).where(AudioBlob.sha256 == sha256)).first() is None:
+        executor.execute(insert(AudioBlob).values(**row))
+    executor.execute(update(AudioBlob).where(AudioBlob.sha256 == sha256).values(
+        ref_count=AudioBlob.ref_count + 1, released_at=None
+    ).execution_options(synchronize_session=False))
+    file_name = executor.execute(select(AudioBlob.file_name).where(AudioBlob.sha256 == sha256)).scalar()
+    target = os.path.join(AUDIO_FOLDER, file_name)
+    _move_in(path, target, keep_source)
+    return target, file_name
+
+def add_reference(executor, path):
+    # Another row now points at a stored file; files from before the store are not counted
+    sha256 = blob_sha(path)
+    if sha256 is not None:
+        executor.execute(update(AudioBlob).where(AudioBlob.sha256 == sha256).values(
+            ref_count=AudioBlob.ref_count + 1, released_at=None
+        ).execution_options(synchronize_session=False))
+
+def _legacy_in_use(executor, path):
+    statements = (
+        select(AudioRecording.id).where(AudioRecording.file_path == path),
+        select(AudioMix.recording_id).where(or_(AudioMix.mic_file_path == path, AudioMix.system_file_path == path))
+    )
+    return any(executor.execute(statement.limit(1)).first() is not None for statement in statements)
+
+def release(executor, path):
+    # Drops a row's reference to its file, once that row no longer points at it (flushed). A file
+    # from before the store, or an unfinished upload, goes as soon as no row names it.
+    sha256 = blob_sha(path)
+    if sha256 is None:
+        if not _legacy_in_use(executor, path):
+            if os.path.exists(path):
+                os.remove(path)
+            remove_peaks(path)
+        return
+    executor.execute(update(AudioBlob).where(AudioBlob.sha256 == sha256, AudioBlob.ref_count > 0).values(
+        ref_count=AudioBlob.ref_count - 1, released_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False))
+
+def delete_recordings(recordings):
+    # Deletes recordings with their mixes and releases every file they held; the caller commits
+    recordings = list(recordings)
+    if not recordings:
+        return
+    mixes = AudioMix.query.filter(AudioMix.recording_id.in_([recording.id for recording in recordings])).all()
+    paths = [recording.file_path for recording in recordings]
+    paths += [path for mix in mixes for path in (mix.mic_file_path, mix.system_file_path)]
+    for row in mixes + recordings:
+        db.session.delete(row)
+    db.session.flush()
+    for path in paths:
+        release(db.session, path)
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+    remove_peaks(path)
+
+def _older_than(path, cutoff):
+    return datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff
+
+def collect_garbage(grace_seconds=GARBAGE_GRACE_SECONDS):
+    # Deletes blobs unreferenced for grace_seconds, files in the store that no blob row names, and
+    # leftovers in incoming/ that no recording points at. Returns what went.
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    stats = {'blobs': 0, 'bytes': 0, 'orphans': 0, 'incoming': 0}
+    candidates = db.session.execute(select(AudioBlob.sha256, AudioBlob.file_name, AudioBlob.size_bytes).where(
+        AudioBlob.ref_count <= 0, func.coalesce(AudioBlob.released_at, AudioBlob.created_at) < cutoff
+    )).all()
+    for sha256, file_name, size_bytes in candidates:
+        # Conditional, so a blob referenced again meanwhile stays. The file goes before the commit:
+        # storing the same bytes waits on this row, so it never puts back a file about to be deleted.
+        deleted = db.session.execute(delete(AudioBlob).where(
+            AudioBlob.sha256 == sha256, AudioBlob.ref_count <= 0
+        ).execution_options(synchronize_session=False)).rowcount
+        if deleted:
+            _remove_file(os.path.join(AUDIO_FOLDER, file_name))
+            stats['blobs'] += 1
+            stats['bytes'] += size_bytes
+        db.session.commit()
+    
+    # Files moved in by a request that failed before committing. Anything stored since this
+    # snapshot was touched on the way in, so it is inside the grace period.
+    known = set(db.session.execute(select(AudioBlob.file_name)).scalars())
+    for shard in sorted(os.listdir(AUDIO_FOLDER)):
+        if not re.fullmatch(r'[0-9a-f]{2}', shard):
+            continue
+        for subshard in sorted(os.listdir(os.path.join(AUDIO_FOLDER, shard))):
+            folder = os.path.join(AUDIO_FOLDER, shard, subshard)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if blob_sha(path) and f'{shard}/{subshard}/{name}' not in known and _older_than(path, cutoff):
+                    _remove_file(path)
+                    stats['orphans'] += 1
+    
+    # Abandoned temporary files; unfinished uploads stay as long as their recording does
+    if os.path.isdir(INCOMING_FOLDER):
+        incoming_cutoff = datetime.utcnow() - timedelta(seconds=max(grace_seconds, INCOMING_GRACE_SECONDS))
+        for name in os.listdir(INCOMING_FOLDER):
+            path = os.path.join(INCOMING_FOLDER, name)
+            if os.path.isfile(path) and _older_than(path, incoming_cutoff) and not _legacy_in_use(db.session, path):
+                _remove_file(path)
+                stats['incoming'] += 1
+    return stats
+
+def migrate_storage():
+    # Moves files from before the store into it, in place: each file is hard-linked into its
+    # blob, the rows that named it are repointed and committed, and only then is the old name
+    # removed, so the tool can be stopped and run again at any point. Returns what it did.
+    stats = {'files': 0, 'duplicates': 0, 'missing': 0}
+    pending = select(AudioUpload.recording_id).where(AudioUpload.completed_at.is_(None))
+    paths = set(db.session.execute(select(AudioRecording.file_path).where(AudioRecording.id.notin_(pending))).scalars())
+    for mic_path, system_path in db.session.execute(select(AudioMix.mic_file_path, AudioMix.system_file_path)):
+        paths.update((mic_path, system_path))
+    
+    for path in sorted(path for path in paths if blob_sha(path) is None):
+        if not os.path.exists(path):
+            stats['missing'] += 1
+            continue
+        recordings = AudioRecording.query.filter_by(file_path=path).all()
+        mic_mixes = AudioMix.query.filter_by(mic_file_path=path).all()
+        system_mixes = AudioMix.query.filter_by(system_file_path=path).all()
+        references = len(recordings) + len(mic_mixes) + len(system_mixes)
+        
+        sha256 = hash_file(path)
+        if db.session.get(AudioBlob, sha256) is not None:
+            stats['duplicates'] += 1
+        target, file_name = store_blob(db.session, path, sha256, keep_source=True)
+        for _ in range(references - 1):
+            add_reference(db.session, target)
+        for recording in recordings:
+            recording.file_path = target
+            recording.file_name = file_name
+        for mix in mic_mixes:
+            mix.mic_file_path = target
+        for mix in system_mixes:
+            mix.system_file_path = target
+        db.session.commit()
+        _remove_file(path)
+        stats['files'] += 1
+    return stats
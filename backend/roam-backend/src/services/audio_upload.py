@@ -0,0 +1,111 @@
+import os
+from datetime import datetime
+from sqlalchemy import update
+from src.models.models import AudioRecording, AudioUpload
+from src.extensions import db
+from src.services.audio_storage import AUDIO_FOLDER, INCOMING_FOLDER, incoming_path, store_blob
+
+# Chunked, resumable recording uploads. A recording is created empty and the client appends
+# numbered chunks while it records; each chunk names the offset it starts at, is copied from the
+# request stream straight into the file, and advances the upload row only if that row still
+# expects it. A client that lost its connection reads the row back and carries on from there.
+# Finalizing fixes the size and moves the file into the content-addressed store (see
+# audio_storage); the duration is probed from the file by a background job.
+COPY_BUFFER_BYTES = 64 * 1024
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def upload_state(upload):
+    return {
+        'recording_id': upload.recording_id,
+        'next_chunk': upload.next_chunk,
+        'received_bytes': upload.received_bytes,
+        'complete': upload.completed_at is not None
+    }
+
+def _upload_file(recording):
+    # Chunks are only ever written into the recording's own file under incoming/; a file in the
+    # store may be shared by other recordings with the same bytes
+    if os.path.dirname(os.path.abspath(recording.file_path)) != INCOMING_FOLDER:
+        raise UploadError('Recording file is no longer being uploaded', 409)
+    return recording.file_path
+
+def start_upload(file_name, fields):
+    # The empty file exists from the start so chunks can be written into it at their offsets
+    file_path = incoming_path(file_name)
+    open(file_path, 'xb').close()
+    
+    recording = AudioRecording(file_name=os.path.relpath(file_path, AUDIO_FOLDER).replace(os.sep, '/'),
+                               file_path=file_path, file_size_bytes=0, **fields)
+    db.session.add(recording)
+    db.session.flush()
+    upload = AudioUpload(recording_id=recording.id)
+    db.session.add(upload)
+    db.session.flush()
+    return recording, upload
+
+def append_chunk(recording, upload, index, offset, stream, length, max_bytes):
+    # Returns False for a chunk that was already stored (a retry after a lost response)
+    if upload.completed_at is not None:
+        raise UploadError('Upload is already complete', 409)
+    if index < upload.next_chunk and offset < upload.received_bytes:
+        return False
+    if index != upload.next_chunk or offset != upload.received_bytes:
+        raise UploadError(f'Expected chunk {upload.next_chunk} at offset {upload.received_bytes}', 409)
+    if length is None:
+        raise UploadError('Content-Length is required', 411)
+    if length > max_bytes:
+        raise UploadError(f'Chunks are limited to {max_bytes} bytes', 413)
+    
+    with open(_upload_file(recording), 'r+b') as file:
+        file.seek(offset)
+        written = 0
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_BYTES, length - written))
+            if not data:
+                break
+            file.write(data)
+            written += len(data)
+        # Anything past this chunk is left over from an attempt that broke off
+        file.truncate(offset + written)
+    if written != length:
+        raise UploadError('Chunk body ended early', 400)
+    
+    # Conditional on the expected position, so a concurrent retry of the same chunk advances it once
+    advanced = db.session.execute(update(AudioUpload).where(
+        AudioUpload.recording_id == upload.recording_id,
+        AudioUpload.next_chunk == index,
+        AudioUpload.received_bytes == offset,
+        AudioUpload.completed_at.is_(None)
+    ).values(
+        next_chunk=index + 1,
+        received_bytes=offset + length,
+        updated_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False)).rowcount
+    if advanced:
+        recording.file_size_bytes = offset + length
+    return bool(advanced)
+
+def finalize_upload(recording, upload, end_timestamp=None, duration_ms=None):
+    # Idempotent
+    if upload.completed_at is not None:
+        return
+    with open(_upload_file(recording), 'r+b') as file:
+        file.truncate(upload.received_bytes)
+        os.fsync(file.fileno())
+    # Chunks can be rewritten by retries, so the file is hashed once it is whole
+    recording.file_path, recording.file_name = store_blob(db.session, recording.file_path)
+    
+    now = datetime.utcnow()
+    recording.end_timestamp = end_timestamp or now
+    recording.file_size_bytes = upload.received_bytes
+    # A provisional duration; the probe job replaces it with the one read from the file
+    if duration_ms is not None:
+        recording.duration_ms = duration_ms
+    elif recording.start_timestamp is not None:
+        recording.duration_ms = int((recording.end_timestamp - recording.start_timestamp).total_seconds() * 1000)
+    upload.completed_at = now
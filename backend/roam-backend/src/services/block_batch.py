@@ -0,0 +1,344 @@
+import bisect
+import uuid
+from datetime import datetime
+from sqlalchemy import insert
+from src.models.models import Page, Block
+from src.extensions import db
+from src.services.links import sync_links
+from src.services.ordering import key_between, validate_key, MAX_KEY_LENGTH
+from src.services.subtree import delete_subtrees
+from src.services.versions import bump_pages
+from src.services.ancestry import rebuild_subtrees, is_descendant
+
+OPERATIONS = {'create', 'update', 'delete', 'indent', 'outdent'}
+POSITION_FIELDS = ('parent_block_uuid', 'order', 'after_block_uuid', 'before_block_uuid')
+BLOCK_COLUMNS = (Block.id, Block.block_uuid, Block.content, Block.page_id, Block.parent_block_uuid, Block.order, Block.created_at, Block.updated_at)
+
+class BatchError(Exception):
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+def _row_to_state(row):
+    return {
+        'id': row.id,
+        'block_uuid': row.block_uuid,
+        'content': row.content,
+        'page_id': row.page_id,
+        'parent_block_uuid': row.parent_block_uuid,
+        'order': row.order,
+        'created_at': row.created_at,
+        'updated_at': row.updated_at
+    }
+
+def _validate(operations):
+    if not isinstance(operations, list) or not operations:
+        raise BatchError(None, 'operations must be a non-empty list')
+    
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise BatchError(index, f"op must be one of {', '.join(sorted(OPERATIONS))}")
+        if operation['op'] == 'create':
+            if 'page_id' not in operation:
+                raise BatchError(index, 'Page ID is required')
+            if 'block_uuid' in operation:
+                try:
+                    uuid.UUID(str(operation['block_uuid']))
+                except ValueError:
+                    raise BatchError(index, 'block_uuid must be a UUID')
+        elif 'block_uuid' not in operation:
+            raise BatchError(index, 'block_uuid is required')
+        if 'order' in operation:
+            try:
+                validate_key(operation['order'])
+            except ValueError as error:
+                raise BatchError(index, str(error))
+
+def _load(operations):
+    # Two reads at most: the referenced blocks (including client-chosen uuids, to catch collisions),
+    # then whole pages where sibling order matters
+    referenced = set()
+    for operation in operations:
+        if 'block_uuid' in operation:
+            referenced.add(str(operation['block_uuid']))
+        if operation.get('parent_block_uuid'):
+            referenced.add(operation['parent_block_uuid'])
+    
+    state = {}
+    if referenced:
+        for row in db.session.query(*BLOCK_COLUMNS).filter(Block.block_uuid.in_(list(referenced))):
+            state[row.block_uuid] = _row_to_state(row)
+    
+    # Placing a block needs its sibling keys, which all live on the block's page
+    sibling_pages = set()
+    for operation in operations:
+        if operation['op'] in ('create', 'indent', 'outdent') or any(field in operation for field in POSITION_FIELDS):
+            page_id = operation.get('page_id') or state.get(operation.get('block_uuid'), {}).get('page_id')
+            if page_id is not None:
+                sibling_pages.add(page_id)
+    if sibling_pages:
+        query = db.session.query(*BLOCK_COLUMNS).filter(Block.page_id.in_(list(sibling_pages)))
+        if state:
+            query = query.filter(Block.block_uuid.notin_(list(state)))
+        for row in query:
+            state[row.block_uuid] = _row_to_state(row)
+    
+    page_ids = {operation['page_id'] for operation in operations if operation['op'] == 'create'}
+    existing_pages = set()
+    if page_ids:
+        existing_pages = {page_id for (page_id,) in db.session.query(Page.id).filter(Page.id.in_(list(page_ids)))}
+    return state, existing_pages
+
+class _SiblingKeys:
+    # Sorted (order, uuid) lists per (page, parent), built lazily from the loaded state
+    def __init__(self, state, deleted):
+        self.state = state
+        self.deleted = deleted
+        self.groups = {}
+    
+    def group(self, page_id, parent_uuid):
+        key = (page_id, parent_uuid)
+        if key not in self.groups:
+            self.groups[key] = sorted(
+                (block['order'], block['block_uuid']) for block in self.state.values()
+                if block['page_id'] == page_id and block['parent_block_uuid'] == parent_uuid
+                and block['block_uuid'] not in self.deleted
+            )
+        return self.groups[key]
+    
+    def add(self, block):
+        bisect.insort(self.group(block['page_id'], block['parent_block_uuid']), (block['order'], block['block_uuid']))
+    
+    def remove(self, block):
+        entries = self.group(block['page_id'], block['parent_block_uuid'])
+        position = bisect.bisect_left(entries, (block['order'], block['block_uuid']))
+        if position < len(entries) and entries[position][1] == block['block_uuid']:
+            entries.pop(position)
+    
+    def previous(self, block):
+        entries = self.group(block['page_id'], block['parent_block_uuid'])
+        position = bisect.bisect_left(entries, (block['order'], block['block_uuid']))
+        return entries[position - 1][1] if position > 0 else None
+    
+    def place(self, page_id, parent_uuid, after_uuid=None, before_uuid=None):
+        # Key between the anchor and its neighbour, or after the last sibling when appending
+        entries = self.group(page_id, parent_uuid)
+        if after_uuid is not None or before_uuid is not None:
+            anchor = self.state.get(after_uuid if after_uuid is not None else before_uuid)
+            if anchor is None or anchor['block_uuid'] in self.deleted or anchor['page_id'] != page_id or anchor['parent_block_uuid'] != parent_uuid:
+                raise ValueError('Sibling block not found')
+            position = bisect.bisect_left(entries, (anchor['order'], anchor['block_uuid']))
+            if after_uuid is not None:
+                upper = entries[position + 1][0] if position + 1 < len(entries) else None
+                return key_between(anchor['order'], upper)
+            lower = entries[position - 1][0] if position > 0 else None
+            return key_between(lower, anchor['order'])
+        return key_between(entries[-1][0] if entries else None, None)
+
+def _simulate(operations, state, existing_pages):
+    # Replay every operation in memory so the batch is validated before anything is written
+    op_uuids = []
+    created = []
+    updated = set()
+    deleted = set()
+    content_changed = set()
+    siblings = _SiblingKeys(state, deleted)
+    now = datetime.utcnow()
+    
+    def live(block_uuid):
+        block = state.get(block_uuid)
+        return block if block is not None and block_uuid not in deleted else None
+    
+    def within(block_uuid, ancestor_uuid):
+        # Walks the batch's parent links; above the loaded blocks the closure table still holds
+        seen = set()
+        while block_uuid is not None and block_uuid not in seen:
+            if block_uuid == ancestor_uuid:
+                return True
+            seen.add(block_uuid)
+            if block_uuid not in state:
+                return is_descendant(block_uuid, ancestor_uuid)
+            block_uuid = state[block_uuid]['parent_block_uuid']
+        return False
+    
+    for index, operation in enumerate(operations):
+        op = operation['op']
+        
+        try:
+            if op == 'create':
+                if operation['page_id'] not in existing_pages:
+                    raise BatchError(index, 'Page not found')
+                block_uuid = str(operation.get('block_uuid') or uuid.uuid4())
+                if block_uuid in state:
+                    raise BatchError(index, 'Block UUID already exists')
+                parent_uuid = operation.get('parent_block_uuid')
+                if parent_uuid and not live(parent_uuid):
+                    raise BatchError(index, 'Parent block not found')
+                order = operation.get('order') or siblings.place(
+                    operation['page_id'], parent_uuid,
+                    after_uuid=operation.get('after_block_uuid'),
+                    before_uuid=operation.get('before_block_uuid')
+                )
+                state[block_uuid] = {
+                    'id': None,
+                    'block_uuid': block_uuid,
+                    'content': operation.get('content', ''),
+                    'page_id': operation['page_id'],
+                    'parent_block_uuid': parent_uuid,
+                    'order': order,
+                    'created_at': now,
+                    'updated_at': now
+                }
+                siblings.add(state[block_uuid])
+                created.append(block_uuid)
+                op_uuids.append(block_uuid)
+                if operation.get('content'):
+                    content_changed.add(block_uuid)
+                continue
+            
+            block_uuid = operation['block_uuid']
+            op_uuids.append(block_uuid)
+            block = live(block_uuid)
+            if not block:
+                raise BatchError(index, 'Block not found')
+            
+            if op == 'delete':
+                # The subtree goes with it, as far as the batch has built it so far, so later
+                # operations on its blocks fail as they would after a real delete
+                subtree = [other for other_uuid, other in state.items()
+                           if other_uuid not in deleted and within(other_uuid, block_uuid)]
+                for other in subtree:
+                    siblings.remove(other)
+                    deleted.add(other['block_uuid'])
+                continue
+            
+            if op == 'update':
+                if 'content' in operation:
+                    block['content'] = operation['content']
+                    content_changed.add(block_uuid)
+                if any(field in operation for field in POSITION_FIELDS):
+                    parent_uuid = operation.get('parent_block_uuid', block['parent_block_uuid'])
+                    if parent_uuid and (parent_uuid == block_uuid or not live(parent_uuid)):
+                        raise BatchError(index, 'Parent block not found')
+                    if parent_uuid != block['parent_block_uuid'] and parent_uuid and within(parent_uuid, block_uuid):
+                        raise BatchError(index, 'Cannot move a block into its own subtree')
+                    siblings.remove(block)
+                    if 'order' in operation:
+                        order = operation['order']
+                    elif 'after_block_uuid' in operation or 'before_block_uuid' in operation or parent_uuid != block['parent_block_uuid']:
+                        order = siblings.place(
+                            block['page_id'], parent_uuid,
+                            after_uuid=operation.get('after_block_uuid'),
+                            before_uuid=operation.get('before_block_uuid')
+                        )
+                    else:
+                        order = block['order']
+                    block['parent_block_uuid'] = parent_uuid
+                    block['order'] = order
+                    siblings.add(block)
+            
+            elif op == 'indent':
+                # Last child of the previous sibling
+                new_parent_uuid = siblings.previous(block)
+                if new_parent_uuid is None:
+                    raise BatchError(index, 'Cannot indent the first block or block not found among siblings')
+                siblings.remove(block)
+                block['order'] = siblings.place(block['page_id'], new_parent_uuid)
+                block['parent_block_uuid'] = new_parent_uuid
+                siblings.add(block)
+            
+            elif op == 'outdent':
+                # Directly after the old parent, at the parent's level
+                if not block['parent_block_uuid']:
+                    raise BatchError(index, 'Block is already at the root level')
+                parent_block = live(block['parent_block_uuid'])
+                if not parent_block:
+                    raise BatchError(index, 'Parent block not found')
+                siblings.remove(block)
+                block['order'] = siblings.place(block['page_id'], parent_block['parent_block_uuid'], after_uuid=parent_block['block_uuid'])
+                block['parent_block_uuid'] = parent_block['parent_block_uuid']
+                siblings.add(block)
+        except ValueError as error:
+            raise BatchError(index, str(error))
+        
+        block['updated_at'] = now
+        updated.add(block_uuid)
+    
+    return op_uuids, created, updated, deleted, content_changed
+
+def _parents_first(created, state):
+    # Insert order that satisfies the parent_block_uuid foreign key
+    pending = set(created)
+    ordered = []
+    
+    def visit(block_uuid):
+        if block_uuid not in pending:
+            return
+        pending.discard(block_uuid)
+        visit(state[block_uuid]['parent_block_uuid'])
+        ordered.append(block_uuid)
+    
+    for block_uuid in created:
+        visit(block_uuid)
+    return ordered
+
+def apply_batch(operations):
+    # Applies the operations in one transaction and returns one result per operation
+    _validate(operations)
+    state, existing_pages = _load(operations)
+    original_parents = {block_uuid: block['parent_block_uuid'] for block_uuid, block in state.items()}
+    op_uuids, created, updated, deleted, content_changed = _simulate(operations, state, existing_pages)
+    
+    created_set = set(created)
+    inserts = [block_uuid for block_uuid in _parents_first(created, state) if block_uuid not in deleted]
+    if inserts:
+        db.session.execute(insert(Block.__table__), [{
+            key: value for key, value in state[block_uuid].items() if key != 'id'
+        } for block_uuid in inserts])
+    
+    updates = [state[block_uuid] for block_uuid in updated if block_uuid not in created_set and block_uuid not in deleted]
+    if updates:
+        db.session.bulk_update_mappings(Block, [{
+            'id': block['id'],
+            'content': block['content'],
+            'parent_block_uuid': block['parent_block_uuid'],
+            'order': block['order'],
+            'updated_at': block['updated_at']
+        } for block in updates])
+    
+    # New and reparented blocks get their ancestry rows recomputed in one pass
+    rebuild_subtrees(inserts + [
+        block['block_uuid'] for block in updates if block['parent_block_uuid'] != original_parents.get(block['block_uuid'])
+    ])
+    
+    # Link extraction runs once for the whole batch
+    deleted_existing = [block_uuid for block_uuid in deleted if block_uuid not in created_set]
+    link_entries = [(block_uuid, state[block_uuid]['page_id'], state[block_uuid]['content'])
+                    for block_uuid in content_changed if block_uuid not in deleted]
+    title_to_id = sync_links(link_entries)
+    
+    # Deleted blocks take their subtrees with them; their links are pruned there
+    deleted_rows = delete_subtrees(deleted_existing)
+    bump_pages(state[block_uuid]['page_id'] for block_uuid in inserts + [block['block_uuid'] for block in updates])
+    
+    # One read for the final rows so results carry database ids
+    final = {}
+    touched = inserts + [block['block_uuid'] for block in updates]
+    if touched:
+        for row in db.session.query(*BLOCK_COLUMNS).filter(Block.block_uuid.in_(touched)):
+            final[row.block_uuid] = _row_to_state(row)
+    
+    results = [{
+        'op': operation['op'],
+        'block_uuid': block_uuid,
+        'block': final.get(block_uuid)
+    } for operation, block_uuid in zip(operations, op_uuids)]
+    
+    # Sibling lists that ended up with overlong keys, to respace after commit
+    long_keys = {
+        (block['page_id'], block['parent_block_uuid']): block['order']
+        for block in final.values() if len(block['order']) > MAX_KEY_LENGTH
+    }
+    
+    return results, title_to_id, [block_id for block_id, _ in deleted_rows], long_keys
@@ -0,0 +1,165 @@
+import json
+import zlib
+from datetime import datetime, timezone
+from sqlalchemy import select
+from src.models.models import Page, Block, Link, BlockReference, AudioRecording, AudioTimestamp
+from src.extensions import db
+
+FORMATS = ('ndjson', 'roam')
+EXPORT_VERSION = 1
+STREAM_BATCH_SIZE = 2000
+CHUNK_SIZE = 64 * 1024
+
+BLOCK_COLUMNS = (Block.id, Block.block_uuid, Block.content, Block.page_id, Block.parent_block_uuid, Block.order, Block.created_at, Block.updated_at)
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=lambda value: value.isoformat())
+
+def _millis(value):
+    # Timestamps are stored as naive UTC
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000) if value is not None else None
+
+def _stream(statement):
+    # Server-side cursor on Postgres; rows are fetched STREAM_BATCH_SIZE at a time
+    return iter(db.session.execute(statement.execution_options(yield_per=STREAM_BATCH_SIZE)))
+
+def _begin_snapshot():
+    # One consistent snapshot across all the cursors of an export
+    if db.session.get_bind().dialect.name == 'postgresql' and not db.session.in_transaction():
+        db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+def _ndjson_block(row):
+    return {
+        'id': row.id,
+        'block_uuid': row.block_uuid,
+        'content': row.content,
+        'order': row.order,
+        'created_at': row.created_at,
+        'updated_at': row.updated_at,
+        'children': []
+    }
+
+def _roam_block(row):
+    return {
+        'uid': row.block_uuid,
+        'string': row.content,
+        'create-time': _millis(row.created_at),
+        'edit-time': _millis(row.updated_at),
+        'children': []
+    }
+
+def _nest(rows, make_node):
+    # Rows arrive ordered by (parent, order), so appending keeps every children list in order
+    nodes = {row.block_uuid: make_node(row) for row in rows}
+    roots = []
+    for row in rows:
+        parent = nodes.get(row.parent_block_uuid)
+        (parent['children'] if parent is not None else roots).append(nodes[row.block_uuid])
+    return roots, nodes
+
+def page_trees(make_node):
+    # Merge-join the page stream with a block stream in the same page order, so only one
+    # page's blocks are held at a time and the whole export is a single pass over each table
+    pages = _stream(select(Page.id, Page.title, Page.created_at, Page.updated_at).order_by(Page.id))
+    blocks = _stream(select(*BLOCK_COLUMNS).order_by(Block.page_id, Block.parent_block_uuid, Block.order, Block.id))
+    
+    pending = next(blocks, None)
+    for page in pages:
+        rows = []
+        while pending is not None and pending.page_id <= page.id:
+            if pending.page_id == page.id:
+                rows.append(pending)
+            pending = next(blocks, None)
+        roots, nodes = _nest(rows, make_node)
+        yield page, roots, nodes
+
+def _ndjson_lines():
+    yield _dumps({'type': 'export', 'version': EXPORT_VERSION, 'exported_at': datetime.utcnow()})
+    
+    for page, roots, _ in page_trees(_ndjson_block):
+        yield _dumps({
+            'type': 'page',
+            'id': page.id,
+            'title': page.title,
+            'created_at': page.created_at,
+            'updated_at': page.updated_at,
+            'children': roots
+        })
+    
+    sections = (
+        ('link', select(Link.id, Link.source_page_id, Link.target_page_id, Link.link_type, Link.created_at).order_by(Link.id)),
+        ('block_reference', select(
+            BlockReference.id, BlockReference.source_block_uuid, BlockReference.target_block_uuid, BlockReference.ref_type,
+            BlockReference.created_at
+        ).order_by(BlockReference.id)),
+        ('audio_recording', select(
+            AudioRecording.id, AudioRecording.file_name, AudioRecording.file_path, AudioRecording.mime_type,
+            AudioRecording.page_id, AudioRecording.block_id_context_start, AudioRecording.start_timestamp,
+            AudioRecording.end_timestamp, AudioRecording.duration_ms, AudioRecording.file_size_bytes, AudioRecording.created_at
+        ).order_by(AudioRecording.id)),
+        ('audio_timestamp', select(
+            AudioTimestamp.id, AudioTimestamp.recording_id, AudioTimestamp.block_uuid,
+            AudioTimestamp.timestamp_in_audio_ms, AudioTimestamp.block_created_at_realtime
+        ).order_by(AudioTimestamp.id)),
+    )
+    for record_type, statement in sections:
+        for row in _stream(statement):
+            yield _dumps({'type': record_type, **row._mapping})
+
+def _roam_lines():
+    # Roam's export is one JSON array of pages; it has no place for links, references or audio,
+    # which Roam derives from block content
+    yield '['
+    first = True
+    for page, roots, nodes in page_trees(_roam_block):
+        for node in nodes.values():
+            if not node['children']:
+                del node['children']
+        entry = {
+            'title': page.title,
+            'create-time': _millis(page.created_at),
+            'edit-time': _millis(page.updated_at)
+        }
+        if roots:
+            entry['children'] = roots
+        yield ('' if first else ',') + _dumps(entry)
+        first = False
+    yield ']'
+
+def _chunks(lines, separator):
+    # Coalesce small lines into CHUNK_SIZE writes
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line + separator)
+        size += len(line) + len(separator)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_graph(export_format='ndjson', compress=False):
+    # Generator of bytes for the whole graph, pages in id order with nested block trees
+    if export_format not in FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+    
+    _begin_snapshot()
+    if export_format == 'ndjson':
+        chunks = _chunks(_ndjson_lines(), '\n')
+    else:
+        chunks = _chunks(_roam_lines(), '')
+    return gzip_chunks(chunks) if compress else chunks
+
+def export_filename(export_format, compress):
+    extension = 'ndjson' if export_format == 'ndjson' else 'json'
+    return f'graph-export.{extension}' + ('.gz' if compress else '')
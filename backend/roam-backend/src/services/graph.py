@@ -0,0 +1,100 @@
+from sqlalchemy import select, union_all, func, literal, or_
+from src.models.models import Link
+from src.extensions import db
+from src.services.titles import title_resolver
+
+MAX_GRAPH_DEPTH = 4
+DEFAULT_GRAPH_LIMIT = 200
+MAX_GRAPH_LIMIT = 2000
+
+def _frontier_edges(frontier):
+    # Every link touching the frontier, both directions, in one indexed query
+    frontier = list(frontier)
+    return db.session.query(Link.source_page_id, Link.target_page_id).filter(or_(
+        Link.source_page_id.in_(frontier),
+        Link.target_page_id.in_(frontier)
+    )).order_by(Link.source_page_id, Link.target_page_id).all()
+
+def _degrees(page_ids):
+    # In- and out-degree for every node in one grouped query
+    page_ids = list(page_ids)
+    ends = union_all(
+        select(Link.source_page_id.label('page_id'), func.count().label('out_degree'), literal(0).label('in_degree')).where(
+            Link.source_page_id.in_(page_ids)
+        ).group_by(Link.source_page_id),
+        select(Link.target_page_id.label('page_id'), literal(0).label('out_degree'), func.count().label('in_degree')).where(
+            Link.target_page_id.in_(page_ids)
+        ).group_by(Link.target_page_id)
+    ).subquery()
+    rows = db.session.execute(
+        select(ends.c.page_id, func.sum(ends.c.out_degree), func.sum(ends.c.in_degree)).group_by(ends.c.page_id)
+    )
+    return {page_id: (int(out_degree or 0), int(in_degree or 0)) for page_id, out_degree, in_degree in rows}
+
+def neighbourhood(page_id, depth=1, limit=DEFAULT_GRAPH_LIMIT):
+    # Breadth-first by level: one query per hop finds the next ring, then one query each for the
+    # edges among the kept nodes, their titles and their degrees. Stops growing at `limit` nodes.
+    depth = max(1, min(depth, MAX_GRAPH_DEPTH))
+    limit = max(1, min(limit, MAX_GRAPH_LIMIT))
+    
+    hops = {page_id: 0}
+    frontier = {page_id}
+    for hop in range(1, depth + 1):
+        next_frontier = set()
+        for source_id, target_id in _frontier_edges(frontier):
+            for other in (source_id, target_id):
+                if other not in hops and len(hops) < limit:
+                    hops[other] = hop
+                    next_frontier.add(other)
+        if not next_frontier or len(hops) >= limit:
+            break
+        frontier = next_frontier
+    
+    ids = list(hops)
+    edges = db.session.query(Link.source_page_id, Link.target_page_id).filter(
+        Link.source_page_id.in_(ids),
+        Link.target_page_id.in_(ids)
+    ).all()
+    titles = title_resolver.page_titles(ids)
+    degrees = _degrees(ids)
+    
+    # Direct neighbours keep the one-hop labels relative to the current page
+    outgoing = {target_id for source_id, target_id in edges if source_id == page_id}
+    incoming = {source_id for source_id, target_id in edges if target_id == page_id}
+    
+    nodes = []
+    for node_id, hop in hops.items():
+        if node_id == page_id:
+            node_type = 'current'
+        elif node_id in outgoing:
+            node_type = 'outgoing'
+        elif node_id in incoming:
+            node_type = 'incoming'
+        else:
+            node_type = 'indirect'
+        out_degree, in_degree = degrees.get(node_id, (0, 0))
+        nodes.append({
+            'id': node_id,
+            'title': titles.get(node_id),
+            'type': node_type,
+            'depth': hop,
+            'in_degree': in_degree,
+            'out_degree': out_degree,
+            'degree': in_degree + out_degree
+        })
+    
+    links = []
+    for source_id, target_id in edges:
+        if source_id == page_id:
+            link_type = 'outgoing'
+        elif target_id == page_id:
+            link_type = 'incoming'
+        else:
+            link_type = 'indirect'
+        links.append({
+            'source': source_id,
+            'target': target_id,
+            'type': link_type
+        })
+    
+    return nodes, links
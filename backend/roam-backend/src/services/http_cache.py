@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app, make_response, Response
+
+# Conditional GET for reads tagged with a version: If-None-Match is answered with 304 before the
+# view runs, and 200 responses are kept in an in-process LRU keyed by (route, URL, version).
+# RESPONSE_CACHE_BYTES bounds the LRU by body size; 0 turns it off.
+
+class ResponseCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, entry, max_bytes):
+        size = len(entry[0])
+        if size > max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self.entries[key] = entry
+            self.size += size
+            while self.size > max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted[0])
+
+response_cache = ResponseCache()
+
+def versioned(version_of):
+    # version_of takes the view's arguments and returns a cheap version for the resource
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            etag = f'{request.endpoint}-{version_of(**kwargs)}'
+            if etag in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.cache_control.no_cache = True
+                return response
+            
+            max_bytes = current_app.config.get('RESPONSE_CACHE_BYTES', 0)
+            key = (request.endpoint, request.full_path, etag)
+            entry = response_cache.get(key) if max_bytes else None
+            if entry is not None:
+                body, mimetype, headers = entry
+                response = Response(body, mimetype=mimetype, headers=headers)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                if max_bytes:
+                    response_cache.put(key, (response.get_data(), response.mimetype, [
+                        (name, value) for name, value in response.headers if name == 'X-Next-Cursor'
+                    ]), max_bytes)
+            # no-cache lets browsers keep the body but revalidate it on every navigation
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
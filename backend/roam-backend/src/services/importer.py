@@ -0,0 +1,330 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, insert, literal, and_, exists
+from src.models.models import Page, Block, Link, BlockMention, BlockReference, BlockClosure
+from src.extensions import db
+from src.services.links import extract_titles, extract_block_refs, BLOCK_REF_PATTERN, MENTION_LINK_TYPE, CONTENT_REF_TYPE
+from src.services.ordering import keys_between
+from src.services.link_graph import record_link_events
+from src.services.versions import bump_pages
+from src.services import search
+
+# Bulk loader for Roam JSON exports and Markdown vaults. Files are parsed in a process pool into
+# plain rows; the rows are written with COPY on PostgreSQL (batched executemany elsewhere) and
+# page links are derived from the mention table in one set-based pass at the end.
+IMPORT_EXTENSIONS = ('.json', '.md', '.markdown')
+LOAD_BATCH_SIZE = 10000
+SPLIT_FILE_SIZE = 4 * 1024 * 1024
+TITLE_BATCH_SIZE = 1000
+
+ALIAS_LINK_PATTERN = re.compile(r'\[\[([^\]|]+)\|([^\]]+)\]\]')
+BULLET_PATTERN = re.compile(r'^([ \t]*)(?:[-*+]|\d+[.)])\s+(.*)$')
+TAB_WIDTH = 4
+
+# Parsing runs in worker processes and only deals in tuples:
+#   page: (title, created_at, updated_at, blocks)
+#   block: (block_uuid, content, parent_uuid, order, created_at, updated_at, chain, titles, references)
+# chain lists the block's ancestors nearest first, for the closure rows; titles and references
+# are the [[page]] and ((uid)) targets in the content.
+
+def _block(block_uuid, content, parent_uuid, order, created_at, updated_at, chain):
+    return (
+        block_uuid, content, parent_uuid, order, created_at, updated_at, chain,
+        extract_titles(content), extract_block_refs(content)
+    )
+
+def _from_millis(value):
+    return datetime.utcfromtimestamp(value / 1000) if value else None
+
+def _roam_blocks(children, parent_uuid, chain, now, blocks):
+    keys = keys_between(None, None, len(children))
+    for child, order in zip(children, keys):
+        block_uuid = child.get('uid') or str(uuid.uuid4())
+        blocks.append(_block(
+            block_uuid,
+            child.get('string', ''),
+            parent_uuid,
+            order,
+            _from_millis(child.get('create-time')) or now,
+            _from_millis(child.get('edit-time')) or now,
+            chain
+        ))
+        if child.get('children'):
+            _roam_blocks(child['children'], block_uuid, (block_uuid,) + chain, now, blocks)
+
+def _load_roam(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+def parse_roam_pages(entries):
+    # Rows for a run of page entries from a Roam export
+    now = datetime.utcnow()
+    pages = []
+    for entry in entries:
+        if not entry.get('title'):
+            continue
+        blocks = []
+        _roam_blocks(entry.get('children') or [], None, (), now, blocks)
+        pages.append((
+            entry['title'],
+            _from_millis(entry.get('create-time')) or now,
+            _from_millis(entry.get('edit-time')) or now,
+            blocks
+        ))
+    return pages
+
+def parse_roam(path):
+    return parse_roam_pages(_load_roam(path))
+
+def _indent_width(whitespace):
+    return sum(TAB_WIDTH if char == '\t' else 1 for char in whitespace)
+
+def parse_markdown(path):
+    # One page per file, titled after the file; list items nest by indentation and any other
+    # paragraph becomes a top-level block. Obsidian [[Page|alias]] links become Roam aliases.
+    now = datetime.utcnow()
+    modified = datetime.utcfromtimestamp(os.path.getmtime(path))
+    with open(path, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    
+    if lines and lines[0].strip() == '---':
+        closing = next((i for i in range(1, len(lines)) if lines[i].strip() == '---'), None)
+        if closing is not None:
+            lines = lines[closing + 1:]
+    
+    items = []  # (indent, content) in document order
+    for line in lines:
+        if not line.strip():
+            continue
+        match = BULLET_PATTERN.match(line)
+        if match:
+            items.append([_indent_width(match.group(1)), match.group(2)])
+        elif items and _indent_width(line[:len(line) - len(line.lstrip())]) > items[-1][0]:
+            items[-1][1] += '\n' + line.strip()
+        else:
+            items.append([0, line.strip()])
+    
+    # Build the tree first so each sibling list gets its keys in one go
+    stack = []  # (indent, node)
+    roots = []
+    for indent, content in items:
+        node = {'uuid': str(uuid.uuid4()), 'content': ALIAS_LINK_PATTERN.sub(r'[\2]([[\1]])', content), 'children': []}
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        (stack[-1][1]['children'] if stack else roots).append(node)
+        stack.append((indent, node))
+    
+    blocks = []
+    pending = [(roots, None, ())]
+    while pending:
+        siblings, parent_uuid, chain = pending.pop()
+        for node, order in zip(siblings, keys_between(None, None, len(siblings))):
+            blocks.append(_block(node['uuid'], node['content'], parent_uuid, order, now, now, chain))
+            if node['children']:
+                pending.append((node['children'], node['uuid'], (node['uuid'],) + chain))
+    
+    title = os.path.splitext(os.path.basename(path))[0]
+    return [(title, modified, modified, blocks)]
+
+def parse_task(task):
+    # A path, or a run of page entries from a large Roam export
+    if isinstance(task, list):
+        return parse_roam_pages(task)
+    if task.lower().endswith('.json'):
+        return parse_roam(task)
+    return parse_markdown(task)
+
+def _tasks(paths, workers):
+    # A Roam export is a single file, so a large one is read once here and its pages are turned
+    # into rows as contiguous ranges across the workers
+    tasks = []
+    for path in paths:
+        if path.lower().endswith('.json') and os.path.getsize(path) > SPLIT_FILE_SIZE:
+            data = _load_roam(path)
+            parts = workers or os.cpu_count() or 1
+            tasks.extend(data[len(data) * part // parts:len(data) * (part + 1) // parts] for part in range(parts))
+        else:
+            tasks.append(path)
+    return tasks
+
+def collect_paths(paths):
+    # Files as given, and importable files anywhere under given directories
+    collected = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                collected.extend(
+                    os.path.join(directory, name) for name in sorted(names) if name.lower().endswith(IMPORT_EXTENSIONS)
+                )
+        else:
+            collected.append(path)
+    return collected
+
+def _copy_rows(table, columns, rows):
+    # COPY ... FROM STDIN in CSV; QUOTE_NONNUMERIC keeps None (NULL) apart from ''
+    cursor = db.session.connection().connection.cursor()
+    statement = f'COPY {table.name} ({", ".join(f"{column}" for column in columns)}) FROM STDIN WITH (FORMAT csv)'
+    for start in range(0, len(rows), LOAD_BATCH_SIZE):
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows[start:start + LOAD_BATCH_SIZE])
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+    cursor.close()
+
+def load_rows(model, columns, rows):
+    if not rows:
+        return 0
+    table = model.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        _copy_rows(table, ['"order"' if column == 'order' else column for column in columns], rows)
+    else:
+        for start in range(0, len(rows), LOAD_BATCH_SIZE):
+            db.session.execute(insert(table), [dict(zip(columns, row)) for row in rows[start:start + LOAD_BATCH_SIZE]])
+    return len(rows)
+
+def _chunked(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _page_ids(titles):
+    title_to_id = {}
+    for chunk in _chunked(titles, TITLE_BATCH_SIZE):
+        title_to_id.update(db.session.query(Page.title, Page.id).filter(Page.title.in_(chunk)))
+    return title_to_id
+
+def _existing_uuids(uuids):
+    existing = set()
+    for chunk in _chunked(uuids, TITLE_BATCH_SIZE):
+        existing.update(block_uuid for (block_uuid,) in db.session.query(Block.block_uuid).filter(Block.block_uuid.in_(chunk)))
+    return existing
+
+def _last_root_keys(page_ids):
+    last = {}
+    for chunk in _chunked(page_ids, TITLE_BATCH_SIZE):
+        rows = db.session.query(Block.page_id, Block.order).filter(
+            Block.page_id.in_(chunk), Block.parent_block_uuid.is_(None)
+        ).order_by(Block.page_id, Block.order)
+        last.update(rows)
+    return last
+
+def _link_pages():
+    # One INSERT ... SELECT turns every mention pair without a link into one
+    pairs = select(
+        BlockMention.source_page_id, BlockMention.target_page_id, literal(MENTION_LINK_TYPE), literal(datetime.utcnow())
+    ).where(
+        BlockMention.source_page_id != BlockMention.target_page_id,
+        ~exists().where(and_(
+            Link.source_page_id == BlockMention.source_page_id,
+            Link.target_page_id == BlockMention.target_page_id
+        ))
+    ).distinct()
+    result = db.session.execute(insert(Link).from_select(['source_page_id', 'target_page_id', 'link_type', 'created_at'], pairs))
+    record_link_events('rebuild', [(None, None)])
+    return result.rowcount
+
+def import_files(paths, workers=None):
+    # Returns row counts, elapsed seconds and rows per second; the caller commits
+    started = time.monotonic()
+    paths = collect_paths(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parsed = [page for pages in pool.map(parse_task, _tasks(paths, workers), chunksize=4) for page in pages]
+    
+    # Pages: imported titles plus every [[title]] the blocks mention
+    titles = {}
+    mentioned = set()
+    for title, created_at, updated_at, blocks in parsed:
+        titles.setdefault(title, (created_at, updated_at))
+        for block in blocks:
+            mentioned |= block[7]
+    existing = _page_ids(set(titles) | mentioned)
+    now = datetime.utcnow()
+    new_pages = [(title, *titles.get(title, (now, now))) for title in set(titles) | mentioned if title not in existing]
+    load_rows(Page, ['title', 'created_at', 'updated_at'], new_pages)
+    title_to_id = dict(existing)
+    title_to_id.update(_page_ids([title for title, _, _ in new_pages]))
+    
+    # Roots are keyed per page after whatever the page already holds, so pages that exist
+    # already or appear in several files keep every root in import order
+    last_keys = _last_root_keys([title_to_id[title] for title in titles if title in existing])
+    roots_by_page = {}
+    for title, _, _, blocks in parsed:
+        roots_by_page.setdefault(title_to_id[title], []).extend(block for block in blocks if block[2] is None)
+    root_keys = {}
+    for page_id, roots in roots_by_page.items():
+        root_keys.update(zip(map(id, roots), keys_between(last_keys.get(page_id), None, len(roots))))
+    
+    # Uuids that are already stored, or repeat within the import, get fresh ones. ((uid))
+    # references to a block that collided with a stored one follow it to its fresh uuid.
+    taken = _existing_uuids([block[0] for _, _, _, blocks in parsed for block in blocks])
+    assigned = []
+    imported = set()
+    renamed = {}
+    for _, _, _, blocks in parsed:
+        new_uuids = []
+        for block in blocks:
+            block_uuid = block[0]
+            new_uuid = block_uuid if block_uuid not in taken and block_uuid not in imported else str(uuid.uuid4())
+            if block_uuid in taken:
+                renamed.setdefault(block_uuid, new_uuid)
+            imported.add(new_uuid)
+            new_uuids.append(new_uuid)
+        assigned.append(new_uuids)
+    follow = lambda match: f'(({renamed.get(match.group(1), match.group(1))}))'
+    
+    block_rows = []
+    closure_rows = []
+    mention_rows = []
+    reference_rows = []
+    for (title, _, _, blocks), new_uuids in zip(parsed, assigned):
+        page_id = title_to_id[title]
+        local = {}
+        for block, new_uuid in zip(blocks, new_uuids):
+            block_uuid, content, parent_uuid, order, created_at, updated_at, chain, targets, references = block
+            local[block_uuid] = new_uuid
+            if renamed and references & renamed.keys():
+                content = BLOCK_REF_PATTERN.sub(follow, content)
+                references = {renamed.get(target, target) for target in references}
+            if parent_uuid is None:
+                order = root_keys[id(block)]
+            block_rows.append((new_uuid, content, page_id, local.get(parent_uuid), order, created_at, updated_at))
+            
+            closure_rows.append((new_uuid, new_uuid, 0))
+            closure_rows.extend((local[ancestor], new_uuid, depth) for depth, ancestor in enumerate(chain, 1))
+            mention_rows.extend((new_uuid, page_id, title_to_id[target]) for target in targets)
+            reference_rows.extend((new_uuid, target) for target in references)
+    
+    load_rows(Block, ['block_uuid', 'content', 'page_id', 'parent_block_uuid', 'order', 'created_at', 'updated_at'], block_rows)
+    load_rows(BlockClosure, ['ancestor_uuid', 'descendant_uuid', 'depth'], closure_rows)
+    load_rows(BlockMention, ['block_uuid', 'source_page_id', 'target_page_id'], mention_rows)
+    
+    # ((uid)) references resolve against the import first, then blocks already stored
+    outside = {target for _, target in reference_rows if target not in imported}
+    known = imported | _existing_uuids(outside)
+    reference_rows = [(source, target, CONTENT_REF_TYPE, now) for source, target in reference_rows if target in known]
+    load_rows(BlockReference, ['source_block_uuid', 'target_block_uuid', 'ref_type', 'created_at'], reference_rows)
+    
+    links = _link_pages()
+    bump_pages(title_to_id.values())
+    
+    # Bulk rows bypass the per-write search hooks; the SQLite index rebuilds on next use
+    search.inverted_index.invalidate()
+    
+    elapsed = time.monotonic() - started
+    rows = len(new_pages) + len(block_rows) + len(reference_rows) + max(links, 0)
+    return {
+        'files': len(paths),
+        'pages': len(new_pages),
+        'blocks': len(block_rows),
+        'links': max(links, 0),
+        'block_references': len(reference_rows),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed) if elapsed > 0 else rows
+    }
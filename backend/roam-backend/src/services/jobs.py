@@ -0,0 +1,199 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from src.models.models import Job
+from src.extensions import db
+
+# A persistent local job queue for work that should not hold up a request. Jobs are rows, so
+# queued work survives a restart. Each app process runs a dispatcher thread that claims due jobs
+# with a conditional UPDATE (so processes sharing the table never run a job twice), runs them in
+# a process pool of JOB_WORKERS, renews their lease while they run and stores the outcome. A job
+# whose process went away is claimed again once its lease lapses. Failures are retried with
+# exponential backoff up to the job's max_attempts; PermanentJobError fails a job at once.
+#
+# A kind is registered with a run function, called in the pool with the job's payload and the
+# app settings named in config, and an optional apply function, called by the dispatcher inside
+# an app context to store the result.
+POLL_SECONDS = 1.0
+LEASE_SECONDS = 60
+RETRY_BASE_SECONDS = 5
+ACTIVE_STATUSES = ('queued', 'running')
+
+class PermanentJobError(Exception):
+    pass
+
+_kinds = {}
+
+def register_job(kind, run, apply=None, max_attempts=3, config=()):
+    _kinds[kind] = (run, apply, max_attempts, config)
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'key': job.key,
+        'recording_id': job.recording_id,
+        'payload': job.payload,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.error,
+        'run_after': job.run_after,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at
+    }
+
+def active_job(key):
+    return Job.query.filter(Job.key == key, Job.status.in_(ACTIVE_STATUSES)).order_by(Job.id.desc()).first()
+
+def latest_job(key):
+    return Job.query.filter_by(key=key).order_by(Job.id.desc()).first()
+
+def enqueue(kind, payload, key=None, recording_id=None):
+    # Adds the job to the session; the caller commits. Work already queued or running under the
+    # same key is returned instead of being queued again.
+    if key is not None:
+        job = active_job(key)
+        if job is not None:
+            return job
+    job = Job(kind=kind, key=key, recording_id=recording_id, payload=payload, max_attempts=_kinds[kind][2])
+    db.session.add(job)
+    db.session.flush()
+    dispatcher.start(current_app._get_current_object())
+    dispatcher.wake()
+    return job
+
+def retry_job(job):
+    if job.status != 'failed':
+        raise ValueError('Only failed jobs can be retried')
+    job.status = 'queued'
+    job.attempts = 0
+    job.error = None
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    dispatcher.wake()
+
+class Dispatcher:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread = None
+        self.app = None
+        self.pool = None
+        self.running = {}
+    
+    def start(self, app):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.app = app
+                self.thread = threading.Thread(target=self._loop, name='job-dispatcher', daemon=True)
+                self.thread.start()
+    
+    def wake(self):
+        self.event.set()
+    
+    def _executor(self):
+        if self.pool is None:
+            # Spawned, not forked: a worker forked while a request holds a SQLite write lock
+            # inherits the lock state and can never write to the database
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.app.config['JOB_WORKERS'], mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.pool
+    
+    def _loop(self):
+        while True:
+            self.event.wait(POLL_SECONDS)
+            self.event.clear()
+            try:
+                with self.app.app_context():
+                    self._finish()
+                    self._renew()
+                    self._claim()
+            except Exception:
+                self.app.logger.exception('Job dispatcher pass failed')
+    
+    def _finish(self):
+        for job_id, future in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[job_id]
+            job = db.session.get(Job, job_id)
+            # Gone with its recording
+            if job is None:
+                continue
+            now = datetime.utcnow()
+            try:
+                result = future.result()
+                apply = _kinds[job.kind][1]
+                if apply is not None:
+                    apply(job, result)
+                job.status = 'done'
+                job.result = result
+                job.error = None
+            except Exception as error:
+                db.session.rollback()
+                job = db.session.get(Job, job_id)
+                if job is None:
+                    continue
+                if isinstance(error, BrokenProcessPool):
+                    self.pool = None
+                if isinstance(error, PermanentJobError) or job.attempts >= job.max_attempts:
+                    job.status = 'failed'
+                else:
+                    job.status = 'queued'
+                    job.run_after = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+                job.error = str(error) or type(error).__name__
+                self.app.logger.warning('Job %s (%s) attempt %s failed: %s', job.id, job.kind, job.attempts, job.error)
+            job.locked_until = None
+            if job.status != 'queued':
+                job.finished_at = now
+            db.session.commit()
+    
+    def _renew(self):
+        if not self.running:
+            return
+        db.session.execute(update(Job).where(Job.id.in_(list(self.running)), Job.status == 'running').values(
+            locked_until=datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+        ).execution_options(synchronize_session=False))
+        db.session.commit()
+    
+    def _claim(self):
+        now = datetime.utcnow()
+        lapsed = and_(Job.status == 'running', Job.locked_until < now)
+        # A job whose process kept dying does not come back forever
+        db.session.execute(update(Job).where(lapsed, Job.attempts >= Job.max_attempts).values(
+            status='failed', error='The worker stopped before the job finished', finished_at=now, locked_until=None
+        ).execution_options(synchronize_session=False))
+        db.session.commit()
+        
+        free = self.app.config['JOB_WORKERS'] - len(self.running)
+        if free <= 0:
+            return
+        due = and_(or_(and_(Job.status == 'queued', Job.run_after <= now), lapsed), Job.kind.in_(list(_kinds)))
+        candidates = db.session.query(Job.id).filter(due, Job.id.notin_(list(self.running))).order_by(Job.id).limit(free).all()
+        for (job_id,) in candidates:
+            claimed = db.session.execute(update(Job).where(Job.id == job_id, due).values(
+                status='running', attempts=Job.attempts + 1, started_at=now,
+                locked_until=now + timedelta(seconds=LEASE_SECONDS)
+            ).execution_options(synchronize_session=False)).rowcount
+            db.session.commit()
+            if not claimed:
+                continue
+            job = db.session.get(Job, job_id)
+            run, _, _, config = _kinds[job.kind]
+            future = self._executor().submit(run, job.payload, {name: self.app.config.get(name) for name in config})
+            future.add_done_callback(lambda _: self.wake())
+            self.running[job_id] = future
+
+dispatcher = Dispatcher()
+
+def init_jobs(app):
+    # The dispatcher starts with the first request, so CLI commands never start one
+    app.before_request(lambda: dispatcher.start(app))
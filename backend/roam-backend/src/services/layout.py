@@ -0,0 +1,225 @@
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import numpy as np
+from flask import current_app
+from src.services.link_graph import expand_frontier
+
+# Force-directed layout of the whole link graph, computed off the request path in a worker
+# process and cached per link graph version. Fruchterman-Reingold forces with unit ideal edge
+# length; repulsion is split into a far field on a grid, convolved by FFT, and exact forces
+# between nodes that share a grid cell, so one iteration costs O(n + edges + cells log cells).
+LAYOUT_ITERATIONS = 300
+INCREMENTAL_ITERATIONS = 40
+INCREMENTAL_MIN_OVERLAP = 0.9  # share of nodes that must keep their position to refine instead of recompute
+GRAVITY = 0.05
+MIN_GRID = 16
+MAX_GRID = 256
+MAX_CELL_PARTNERS = 24
+LAYOUT_CACHE_SIZE = 3
+
+# Tiles split the unit square into 2**z by 2**z squares; nodes are sorted along a Z-order
+# curve at MAX_ZOOM so each tile is one contiguous slice
+MAX_ZOOM = 16
+DEFAULT_TILE_LIMIT = 500
+MAX_TILE_LIMIT = 5000
+MAX_TILE_LINKS = 10000
+
+@lru_cache(maxsize=8)
+def _kernels(grid):
+    # Spectra of the unit-cell repulsion kernel r / |r|^2, laid out for circular convolution
+    offsets = np.arange(2 * grid)
+    offsets[grid:] -= 2 * grid
+    dx, dy = np.meshgrid(offsets, offsets, indexing='ij')
+    squared = (dx * dx + dy * dy).astype(float)
+    squared[0, 0] = np.inf
+    return np.fft.rfft2(dx / squared), np.fft.rfft2(dy / squared)
+
+def _repulsion(positions):
+    count = len(positions)
+    grid = int(np.clip(2 ** np.ceil(np.log2(np.sqrt(count) + 1)), MIN_GRID, MAX_GRID))
+    low = positions.min(axis=0)
+    cell = max(np.ptp(positions, axis=0).max(), 1e-9) / grid * (1 + 1e-9)
+    cells = np.minimum(((positions - low) / cell).astype(np.int64), grid - 1)
+    flat = cells[:, 0] * grid + cells[:, 1]
+    cell_counts = np.bincount(flat, minlength=grid * grid)
+    
+    # Far field: every other cell acts as a point mass at its centre
+    spectrum = np.fft.rfft2(cell_counts.reshape(grid, grid).astype(float), s=(2 * grid, 2 * grid))
+    kernel_x, kernel_y = _kernels(grid)
+    field_x = np.fft.irfft2(spectrum * kernel_x, s=(2 * grid, 2 * grid))[:grid, :grid] / cell
+    field_y = np.fft.irfft2(spectrum * kernel_y, s=(2 * grid, 2 * grid))[:grid, :grid] / cell
+    force = np.stack([field_x[cells[:, 0], cells[:, 1]], field_y[cells[:, 0], cells[:, 1]]], axis=1)
+    
+    # Near field: exact pairs within a cell, sampling evenly spaced partners in crowded cells
+    order = np.argsort(flat, kind='stable')
+    cell_starts = np.cumsum(cell_counts) - cell_counts
+    totals = cell_counts[flat[order]]
+    used = np.minimum(totals, MAX_CELL_PARTNERS)
+    origins = np.repeat(order, used)
+    steps = np.arange(used.sum()) - np.repeat(np.cumsum(used) - used, used)
+    partners = order[np.repeat(cell_starts[flat[order]], used) + steps * np.repeat(totals, used) // np.repeat(used, used)]
+    weights = np.repeat(totals / used, used)
+    distinct = origins != partners
+    origins, partners, weights = origins[distinct], partners[distinct], weights[distinct]
+    
+    delta = positions[origins] - positions[partners]
+    squared = np.maximum((delta ** 2).sum(axis=1), 1e-4)
+    push = delta * (weights / squared)[:, None]
+    force[:, 0] += np.bincount(origins, weights=push[:, 0], minlength=count)
+    force[:, 1] += np.bincount(origins, weights=push[:, 1], minlength=count)
+    return force
+
+def _attraction(positions, sources, targets):
+    delta = positions[targets] - positions[sources]
+    pull = delta * np.hypot(delta[:, 0], delta[:, 1])[:, None]
+    count = len(positions)
+    force = np.zeros_like(positions)
+    for axis in (0, 1):
+        force[:, axis] = np.bincount(sources, weights=pull[:, axis], minlength=count) - np.bincount(
+            targets, weights=pull[:, axis], minlength=count
+        )
+    return force
+
+def compute_layout(sources, targets, count, positions=None, iterations=LAYOUT_ITERATIONS, temperature=None):
+    # Runs in the worker process; returns float32 (count, 2) positions in layout units
+    if count == 0:
+        return np.zeros((0, 2), dtype=np.float32)
+    spread = np.sqrt(count)
+    if positions is None:
+        positions = np.random.default_rng(0).uniform(0, spread, (count, 2))
+    positions = positions.astype(float)
+    temperature = spread / 10 if temperature is None else temperature
+    
+    for step in range(iterations):
+        force = _repulsion(positions) + _attraction(positions, sources, targets)
+        force -= GRAVITY * (positions - positions.mean(axis=0))
+        # Cooling: each node moves at most the current temperature along its net force
+        length = np.maximum(np.hypot(force[:, 0], force[:, 1]), 1e-9)
+        limit = temperature * (1 - step / iterations)
+        positions += force * (np.minimum(length, limit) / length)[:, None]
+    return positions.astype(np.float32)
+
+def _interleave(x, y):
+    # Z-order code of 16-bit cell coordinates
+    codes = []
+    for value in (x, y):
+        value = np.asarray(value, dtype=np.int64) & 0xFFFF
+        value = (value | (value << 8)) & 0x00FF00FF
+        value = (value | (value << 4)) & 0x0F0F0F0F
+        value = (value | (value << 2)) & 0x33333333
+        value = (value | (value << 1)) & 0x55555555
+        codes.append(value)
+    return codes[0] | (codes[1] << 1)
+
+class Layout:
+    def __init__(self, graph, positions):
+        self.graph = graph
+        self.version = graph.version
+        self.raw = positions
+        
+        # Normalised into the unit square, keeping the aspect ratio
+        if len(positions):
+            low = positions.min(axis=0)
+            span = max(float(np.ptp(positions, axis=0).max()), 1e-9)
+            self.positions = ((positions - low) / span).astype(np.float32)
+        else:
+            self.positions = positions
+        side = 1 << MAX_ZOOM
+        cells = np.minimum((self.positions * side).astype(np.int64), side - 1)
+        codes = _interleave(cells[:, 0], cells[:, 1])
+        self.order = np.argsort(codes, kind='stable')
+        self.codes = codes[self.order]
+    
+    def tile(self, z, x, y, limit=DEFAULT_TILE_LIMIT):
+        # Node positions in one tile, the highest-PageRank ones first when it holds more than limit
+        shift = 2 * (MAX_ZOOM - z)
+        prefix = int(_interleave(x, y))
+        start = np.searchsorted(self.codes, prefix << shift)
+        end = np.searchsorted(self.codes, (prefix + 1) << shift)
+        members = self.order[start:end]
+        if len(members) > limit:
+            ranks = self.graph.pagerank()[members]
+            members = members[np.argpartition(-ranks, limit - 1)[:limit]]
+        ranks = self.graph.pagerank()[members]
+        return members[np.argsort(-ranks, kind='stable')], int(end - start)
+    
+    def tile_links(self, members):
+        # Outgoing links of the tile's nodes; targets may lie in other tiles
+        sources, targets = expand_frontier(members.astype(np.int64), self.graph.out_indptr, self.graph.out_indices)
+        return sources[:MAX_TILE_LINKS], targets[:MAX_TILE_LINKS]
+
+def _seed(graph, previous):
+    # Positions carried over from the previous layout, with new nodes placed at the centroid of
+    # their already placed neighbours; None when too much changed to refine
+    if previous is None or graph.node_count == 0:
+        return None
+    index = np.minimum(np.searchsorted(previous.graph.page_ids, graph.page_ids), previous.graph.node_count - 1)
+    known = previous.graph.page_ids[index] == graph.page_ids
+    if known.mean() < INCREMENTAL_MIN_OVERLAP:
+        return None
+    
+    positions = np.zeros((graph.node_count, 2))
+    positions[known] = previous.raw[index[known]]
+    fresh = np.flatnonzero(~known)
+    if fresh.size:
+        reached, origins = expand_frontier(fresh, graph.out_indptr, graph.out_indices)
+        incoming, incoming_origins = expand_frontier(fresh, graph.in_indptr, graph.in_indices)
+        reached = np.concatenate([reached, incoming])
+        origins = np.concatenate([origins, incoming_origins])
+        placed = known[reached]
+        reached, origins = reached[placed], origins[placed]
+        neighbours = np.bincount(origins, minlength=graph.node_count)[fresh]
+        centre = positions[known].mean(axis=0)
+        jitter = np.random.default_rng(graph.version).normal(scale=1.0, size=(fresh.size, 2))
+        for axis in (0, 1):
+            total = np.bincount(origins, weights=positions[reached, axis], minlength=graph.node_count)[fresh]
+            positions[fresh, axis] = np.where(neighbours > 0, total / np.maximum(neighbours, 1), centre[axis]) + jitter[:, axis]
+    return positions
+
+_lock = threading.Lock()
+_layouts = OrderedDict()
+_pending = None
+_pool = None
+
+def _executor():
+    global _pool
+    if _pool is None:
+        # Spawned rather than forked from this threaded process, like the job pool (see jobs)
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def _collect():
+    global _pending
+    if _pending is None or not _pending[1].done():
+        return
+    graph, future = _pending
+    _pending = None
+    try:
+        _layouts[graph.version] = Layout(graph, future.result())
+    except Exception:
+        current_app.logger.exception('Graph layout failed for version %s', graph.version)
+        return
+    while len(_layouts) > LAYOUT_CACHE_SIZE:
+        _layouts.popitem(last=False)
+
+def current_layout(graph, version=None):
+    # The newest finished layout (or the requested cached version), which may trail graph.
+    # Starts computing one for graph.version in the background when none is running.
+    global _pending
+    with _lock:
+        _collect()
+        if version is not None:
+            return _layouts.get(version)
+        
+        latest = next(reversed(_layouts.values()), None)
+        if (latest is None or latest.version != graph.version) and _pending is None:
+            seed = _seed(graph, latest)
+            if seed is None:
+                arguments = (None, LAYOUT_ITERATIONS, None)
+            else:
+                arguments = (seed, INCREMENTAL_ITERATIONS, np.sqrt(graph.node_count) / 100)
+            _pending = (graph, _executor().submit(compute_layout, graph.sources(), graph.out_indices, graph.node_count, *arguments))
+        return latest
@@ -0,0 +1,237 @@
+import threading
+import time
+import numpy as np
+from sqlalchemy import select, insert, func
+from src.models.models import Page, Link, LinkEvent
+from src.extensions import db
+
+# Whole-graph analytics over an in-memory snapshot of `links`, one per worker process.
+# Edges are kept as CSR arrays of int32 node positions (out- and in-adjacency), about
+# 8 bytes per link plus 24 per page (its int64 id and two int64 row pointers). Link writes
+# append to link_events; each snapshot replays the events past its version instead of
+# reloading the table.
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+LOAD_BATCH_SIZE = 50000
+
+# Events are numbered when inserted but become visible at commit, so one can land behind a
+# snapshot's version; a periodic full reload bounds how long such a miss can last
+SNAPSHOT_MAX_AGE = 600
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-8
+PAGERANK_MAX_ITERATIONS = 100
+
+def record_link_events(kind, pairs):
+    # kind is 'add' or 'remove' for (source_id, target_id) pairs, 'remove_page' for
+    # (page_id, None) and 'rebuild' for (None, None) after bulk writes
+    rows = [{'kind': kind, 'source_page_id': source_id, 'target_page_id': target_id} for source_id, target_id in pairs]
+    if rows:
+        db.session.execute(insert(LinkEvent), rows)
+
+def latest_link_event():
+    return db.session.query(func.max(LinkEvent.id)).scalar() or 0
+
+def _pack(sources, targets):
+    return (np.asarray(sources, dtype=np.int64) << ID_BITS) | np.asarray(targets, dtype=np.int64)
+
+def expand_frontier(frontier, indptr, indices):
+    # Neighbours of every node in frontier, with the node each one was reached from
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    origins = np.repeat(frontier, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return indices[np.repeat(starts, counts) + offsets], origins
+
+class LinkGraph:
+    def __init__(self, page_ids, edge_keys, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._cache = {}
+        
+        sources = edge_keys >> ID_BITS
+        targets = edge_keys & ID_MASK
+        # Every endpoint is a node, even a page created after the page list was read
+        self.page_ids = np.union1d(page_ids, np.union1d(sources, targets)) if edge_keys.size else page_ids
+        count = len(self.page_ids)
+        
+        # edge_keys are sorted by (source, target), so they are already in out-CSR order
+        source_positions = np.searchsorted(self.page_ids, sources).astype(np.int32)
+        target_positions = np.searchsorted(self.page_ids, targets).astype(np.int32)
+        self.out_indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source_positions, minlength=count), out=self.out_indptr[1:])
+        self.out_indices = target_positions
+        
+        order = np.argsort(target_positions, kind='stable')
+        self.in_indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(target_positions, minlength=count), out=self.in_indptr[1:])
+        self.in_indices = source_positions[order]
+    
+    @property
+    def node_count(self):
+        return len(self.page_ids)
+    
+    @property
+    def edge_count(self):
+        return len(self.out_indices)
+    
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.page_ids, self.out_indptr, self.out_indices, self.in_indptr, self.in_indices))
+    
+    def position(self, page_id):
+        index = int(np.searchsorted(self.page_ids, page_id))
+        if index < self.node_count and self.page_ids[index] == page_id:
+            return index
+        return None
+    
+    def sources(self):
+        # Source position of every edge, aligned with out_indices
+        return np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.out_indptr))
+    
+    def edge_keys(self):
+        return _pack(self.page_ids[self.sources()], self.page_ids[self.out_indices])
+    
+    def applied(self, events, version):
+        # A new snapshot with the events replayed in order; the old one stays valid for readers
+        changes = {}
+        removed_pages = set()
+        for kind, source_id, target_id in events:
+            if kind == 'remove_page':
+                removed_pages.add(source_id)
+                changes = {pair: added for pair, added in changes.items() if source_id not in pair}
+            elif kind in ('add', 'remove'):
+                changes[(source_id, target_id)] = kind == 'add'
+        
+        keys = self.edge_keys()
+        page_ids = self.page_ids
+        if removed_pages:
+            removed = np.fromiter(removed_pages, dtype=np.int64)
+            keys = keys[~(np.isin(keys >> ID_BITS, removed) | np.isin(keys & ID_MASK, removed))]
+            page_ids = np.setdiff1d(page_ids, removed, assume_unique=True)
+        
+        additions = [pair for pair, added in changes.items() if added]
+        removals = [pair for pair, added in changes.items() if not added]
+        if removals:
+            keys = np.setdiff1d(keys, _pack(*zip(*removals)), assume_unique=True)
+        if additions:
+            keys = np.union1d(keys, _pack(*zip(*additions)))
+        return LinkGraph(page_ids, keys, version)
+    
+    def degrees(self):
+        if 'degrees' not in self._cache:
+            self._cache['degrees'] = (np.diff(self.in_indptr), np.diff(self.out_indptr))
+        return self._cache['degrees']
+    
+    def pagerank(self):
+        # Power iteration; rank held by pages without outgoing links is spread evenly
+        if 'pagerank' not in self._cache:
+            count = self.node_count
+            rank = np.full(count, 1.0 / count) if count else np.zeros(0)
+            out_degree = np.diff(self.out_indptr)
+            dangling = out_degree == 0
+            share = np.zeros(count)
+            share[~dangling] = 1.0 / out_degree[~dangling]
+            sources = self.sources()
+            
+            for _ in range(PAGERANK_MAX_ITERATIONS):
+                spread = np.bincount(self.out_indices, weights=(rank * share)[sources], minlength=count)
+                updated = PAGERANK_DAMPING * (spread + rank[dangling].sum() / count) + (1 - PAGERANK_DAMPING) / count
+                converged = np.abs(updated - rank).sum() < PAGERANK_TOLERANCE
+                rank = updated
+                if converged:
+                    break
+            self._cache['pagerank'] = rank
+        return self._cache['pagerank']
+    
+    def components(self):
+        # Weakly connected components by min-label propagation with pointer jumping;
+        # each page is labelled with the smallest node position in its component
+        if 'components' not in self._cache:
+            labels = np.arange(self.node_count)
+            sources = self.sources()
+            targets = self.out_indices
+            while True:
+                smallest = np.minimum(labels[sources], labels[targets])
+                updated = labels.copy()
+                np.minimum.at(updated, sources, smallest)
+                np.minimum.at(updated, targets, smallest)
+                while True:
+                    jumped = updated[updated]
+                    if np.array_equal(jumped, updated):
+                        break
+                    updated = jumped
+                if np.array_equal(updated, labels):
+                    break
+                labels = updated
+            self._cache['components'] = labels
+        return self._cache['components']
+    
+    def shortest_path(self, source_id, target_id, directed=False):
+        # Level-synchronous BFS over the CSR arrays; returns page ids or None
+        start, goal = self.position(source_id), self.position(target_id)
+        if start is None or goal is None:
+            return None
+        parents = np.full(self.node_count, -1, dtype=np.int64)
+        parents[start] = start
+        frontier = np.array([start], dtype=np.int64)
+        
+        while frontier.size and parents[goal] == -1:
+            reached, origins = expand_frontier(frontier, self.out_indptr, self.out_indices)
+            if not directed:
+                incoming, incoming_origins = expand_frontier(frontier, self.in_indptr, self.in_indices)
+                reached = np.concatenate([reached, incoming])
+                origins = np.concatenate([origins, incoming_origins])
+            fresh = parents[reached] == -1
+            reached, first = np.unique(reached[fresh], return_index=True)
+            parents[reached] = origins[fresh][first]
+            frontier = reached.astype(np.int64)
+        
+        if parents[goal] == -1:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(parents[path[-1]]))
+        return [int(self.page_ids[index]) for index in reversed(path)]
+
+def _load(version):
+    pages = db.session.execute(select(Page.id).order_by(Page.id).execution_options(yield_per=LOAD_BATCH_SIZE))
+    page_ids = np.fromiter((page_id for (page_id,) in pages), dtype=np.int64)
+    
+    chunks = [np.zeros(0, dtype=np.int64)]
+    links = db.session.execute(select(Link.source_page_id, Link.target_page_id).execution_options(yield_per=LOAD_BATCH_SIZE))
+    for partition in links.partitions():
+        pairs = np.array(partition, dtype=np.int64).reshape(-1, 2)
+        chunks.append(_pack(pairs[:, 0], pairs[:, 1]))
+    return LinkGraph(page_ids, np.unique(np.concatenate(chunks)), version)
+
+_lock = threading.Lock()
+_graph = None
+
+def link_graph():
+    # This worker's snapshot, brought up to date; costs one indexed query when nothing changed
+    global _graph
+    with _lock:
+        oldest, latest = db.session.query(func.min(LinkEvent.id), func.max(LinkEvent.id)).one()
+        latest = latest or 0
+        
+        stale = _graph is None or time.monotonic() - _graph.loaded_at > SNAPSHOT_MAX_AGE
+        trimmed = _graph is not None and oldest is not None and oldest > _graph.version + 1
+        if stale or trimmed:
+            _graph = _load(latest)
+        elif latest > _graph.version:
+            events = db.session.query(LinkEvent.kind, LinkEvent.source_page_id, LinkEvent.target_page_id).filter(
+                LinkEvent.id > _graph.version
+            ).order_by(LinkEvent.id).all()
+            if any(kind == 'rebuild' for kind, _, _ in events):
+                _graph = _load(latest)
+            else:
+                _graph = _graph.applied(events, latest)
+        return _graph
+
+def trim_link_events(keep=100000):
+    # Snapshots older than the trimmed range reload in full on their next refresh
+    latest = latest_link_event()
+    deleted = LinkEvent.query.filter(LinkEvent.id <= latest - keep).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
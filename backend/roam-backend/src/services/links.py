@@ -0,0 +1,202 @@
+import re
+from sqlalchemy import insert, exists, and_, tuple_
+from sqlalchemy.exc import IntegrityError
+from src.models.models import Page, Block, Link, BlockMention, BlockReference
+from src.extensions import db, dialect_insert
+from src.services.link_graph import record_link_events
+from src.services.versions import bump_pages
+from src.services.titles import title_resolver
+
+LINK_PATTERN = re.compile(r'\[\[(.*?)\]\]')
+BLOCK_REF_PATTERN = re.compile(r'\(\(([^()\s]+)\)\)')
+# Page links that exist because a block mentions the target; manual links keep their own type
+MENTION_LINK_TYPE = 'mention'
+# Block references written as ((uuid)) in the source block; references created through the API differ
+CONTENT_REF_TYPE = 'content'
+
+def extract_titles(content):
+    return {title for title in LINK_PATTERN.findall(content or '') if title.strip()}
+
+def extract_block_refs(content):
+    return set(BLOCK_REF_PATTERN.findall(content or ''))
+
+def insert_ignoring_conflicts(model, rows, index_elements):
+    # INSERT ... ON CONFLICT DO NOTHING, so concurrent writers never race on unique keys
+    statement = dialect_insert(model)
+    if statement is not None:
+        db.session.execute(statement.on_conflict_do_nothing(index_elements=index_elements), rows)
+        return
+    
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model), [row])
+        except IntegrityError:
+            pass
+
+def resolve_titles(titles):
+    # Map titles to page ids through the resolver cache, upserting pages that do not exist yet
+    if not titles:
+        return {}
+    
+    title_to_id = title_resolver.page_ids(titles)
+    missing = [title for title in titles if title not in title_to_id]
+    if missing:
+        insert_ignoring_conflicts(Page, [{'title': title} for title in missing], ['title'])
+        title_to_id.update(db.session.query(Page.title, Page.id).filter(Page.title.in_(missing)))
+    return title_to_id
+
+def add_links(pairs):
+    # Page-level links for (source_page_id, target_page_id) pairs, skipping self-links
+    rows = [{
+        'source_page_id': source_id,
+        'target_page_id': target_id,
+        'link_type': MENTION_LINK_TYPE
+    } for source_id, target_id in pairs if source_id != target_id]
+    if rows:
+        insert_ignoring_conflicts(Link, rows, ['source_page_id', 'target_page_id'])
+        record_link_events('add', [(row['source_page_id'], row['target_page_id']) for row in rows])
+        bump_pages({page_id for row in rows for page_id in (row['source_page_id'], row['target_page_id'])})
+
+def prune_links(pairs):
+    # Drop mention links for exactly these pairs once no block on the source page still mentions
+    # the target; links created through the API are never pruned
+    if not pairs:
+        return
+    still_mentioned = exists().where(and_(
+        BlockMention.source_page_id == Link.source_page_id,
+        BlockMention.target_page_id == Link.target_page_id
+    ))
+    # Select first so the graph snapshot learns exactly which links went away
+    stale = db.session.query(Link.id, Link.source_page_id, Link.target_page_id).filter(
+        tuple_(Link.source_page_id, Link.target_page_id).in_(list(pairs)),
+        Link.link_type == MENTION_LINK_TYPE,
+        ~still_mentioned
+    ).all()
+    if stale:
+        Link.query.filter(Link.id.in_([link_id for link_id, _, _ in stale])).delete(synchronize_session=False)
+        record_link_events('remove', [(source_id, target_id) for _, source_id, target_id in stale])
+        bump_pages({page_id for _, source_id, target_id in stale for page_id in (source_id, target_id)})
+
+def sync_block_refs(entries):
+    # ((uuid)) references follow the content the same way mentions do: the blocks' content refs
+    # are diffed against the refs in the new content, keeping only targets that exist. Blocks
+    # without refs are cleared with one delete and no read. References made through the API are
+    # never touched, and a pair that already has one is not added again.
+    refs_by_block = {block_uuid: extract_block_refs(content) for block_uuid, _, content in entries}
+    referencing = [block_uuid for block_uuid, refs in refs_by_block.items() if refs]
+    from_content = BlockReference.ref_type == CONTENT_REF_TYPE
+    if not referencing:
+        BlockReference.query.filter(
+            BlockReference.source_block_uuid.in_(list(refs_by_block)), from_content
+        ).delete(synchronize_session=False)
+        return
+    
+    known = {block_uuid for (block_uuid,) in db.session.query(Block.block_uuid).filter(
+        Block.block_uuid.in_(list(set().union(*refs_by_block.values())))
+    )}
+    new_pairs = {(source, target) for source, refs in refs_by_block.items() for target in refs if target in known}
+    old_pairs = set(db.session.query(BlockReference.source_block_uuid, BlockReference.target_block_uuid).filter(
+        BlockReference.source_block_uuid.in_(list(refs_by_block)), from_content
+    ))
+    
+    removed = old_pairs - new_pairs
+    if removed:
+        BlockReference.query.filter(
+            tuple_(BlockReference.source_block_uuid, BlockReference.target_block_uuid).in_(list(removed)), from_content
+        ).delete(synchronize_session=False)
+    added = new_pairs - old_pairs
+    if added:
+        insert_ignoring_conflicts(BlockReference, [{
+            'source_block_uuid': source,
+            'target_block_uuid': target,
+            'ref_type': CONTENT_REF_TYPE
+        } for source, target in added], ['source_block_uuid', 'target_block_uuid'])
+
+def sync_links(entries):
+    # Diff stored mentions against new content for many blocks at once and apply the change in bulk.
+    # entries are (block_uuid, page_id, content) for blocks that are already flushed.
+    if not entries:
+        return {}
+    sync_block_refs(entries)
+    
+    titles_by_block = {block_uuid: extract_titles(content) for block_uuid, _, content in entries}
+    title_to_id = resolve_titles(set().union(*titles_by_block.values()))
+    page_of = {block_uuid: page_id for block_uuid, page_id, _ in entries}
+    new_sets = {block_uuid: {title_to_id[title] for title in titles} for block_uuid, titles in titles_by_block.items()}
+    
+    old_sets = {block_uuid: set() for block_uuid in page_of}
+    for block_uuid, target_id in db.session.query(BlockMention.block_uuid, BlockMention.target_page_id).filter(
+        BlockMention.block_uuid.in_(list(page_of))
+    ):
+        old_sets[block_uuid].add(target_id)
+    
+    # Blocks that lost a mention are cleared and re-inserted in full, so one delete covers them all
+    cleared = {block_uuid for block_uuid in page_of if old_sets[block_uuid] - new_sets[block_uuid]}
+    if cleared:
+        BlockMention.query.filter(BlockMention.block_uuid.in_(list(cleared))).delete(synchronize_session=False)
+    
+    mention_rows = []
+    added_pairs = set()
+    removed_pairs = set()
+    for block_uuid, page_id in page_of.items():
+        old_ids, new_ids = old_sets[block_uuid], new_sets[block_uuid]
+        inserted_ids = new_ids if block_uuid in cleared else new_ids - old_ids
+        mention_rows.extend({
+            'block_uuid': block_uuid,
+            'source_page_id': page_id,
+            'target_page_id': target_id
+        } for target_id in inserted_ids)
+        added_pairs.update((page_id, target_id) for target_id in new_ids - old_ids)
+        removed_pairs.update((page_id, target_id) for target_id in old_ids - new_ids)
+    
+    if mention_rows:
+        db.session.execute(insert(BlockMention), mention_rows)
+    
+    add_links(added_pairs)
+    prune_links(removed_pairs)
+    
+    # The blocks' pages, and every page whose linked references show them
+    bump_pages(set(page_of.values()).union(*old_sets.values(), *new_sets.values()))
+    
+    return title_to_id
+
+def sync_block_links(block, content=None):
+    # Pass content='' to drop the block's mentions and refs before deleting it
+    if content is None:
+        content = block.content
+    return sync_links([(block.block_uuid, block.page_id, content)])
+
+def rebuild_mentions(batch_size=1000):
+    # Backfill the index for blocks written before it existed
+    BlockMention.query.delete(synchronize_session=False)
+    title_to_id = dict(db.session.query(Page.title, Page.id))
+    
+    rows = []
+    query = db.session.query(Block.block_uuid, Block.page_id, Block.content).filter(Block.content.like('%[[%'))
+    for block_uuid, page_id, content in query.yield_per(batch_size):
+        for title in extract_titles(content):
+            if title in title_to_id:
+                rows.append({
+                    'block_uuid': block_uuid,
+                    'source_page_id': page_id,
+                    'target_page_id': title_to_id[title]
+                })
+        if len(rows) >= batch_size:
+            db.session.execute(insert(BlockMention), rows)
+            rows = []
+    
+    if rows:
+        db.session.execute(insert(BlockMention), rows)
+    
+    # ((uuid)) references written before they were extracted from content
+    entries = []
+    query = db.session.query(Block.block_uuid, Block.page_id, Block.content).filter(Block.content.like('%((%'))
+    for entry in query.yield_per(batch_size):
+        entries.append(entry)
+        if len(entries) >= batch_size:
+            sync_block_refs(entries)
+            entries = []
+    if entries:
+        sync_block_refs(entries)
+    db.session.commit()
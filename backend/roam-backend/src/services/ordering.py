@@ -0,0 +1,233 @@
+import threading
+from flask import current_app
+from sqlalchemy import Integer, inspect, text
+from src.models.models import Block
+from src.extensions import db
+from src.services.versions import bump_pages
+
+# Fractional index keys: an order-preserving string with a variable-length integer part
+# (head char encodes its length) followed by a base-62 fraction without trailing zeros.
+# Keys compare correctly as plain byte strings, so sibling scans stay on idx_block_hierarchy.
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+SMALLEST_INTEGER = 'A' + '0' * 26
+FIRST_KEY = 'a0'
+
+# Keys longer than this get their sibling list respaced in the background
+MAX_KEY_LENGTH = 32
+
+def _integer_length(head):
+    if 'a' <= head <= 'z':
+        return ord(head) - ord('a') + 2
+    if 'A' <= head <= 'Z':
+        return ord('Z') - ord(head) + 2
+    raise ValueError(f'Invalid order key head: {head!r}')
+
+def _integer_part(key):
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise ValueError(f'Invalid order key: {key!r}')
+    return key[:length]
+
+def validate_key(key):
+    if not isinstance(key, str) or not key:
+        raise ValueError('Order key must be a non-empty string')
+    integer = _integer_part(key)
+    if any(char not in DIGITS for char in key[1:]):
+        raise ValueError(f'Invalid order key: {key!r}')
+    if key == SMALLEST_INTEGER or key[len(integer):].endswith('0'):
+        raise ValueError(f'Invalid order key: {key!r}')
+
+def _midpoint(a, b):
+    # Fraction strictly between a and b (b=None means the end); neither has trailing zeros
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+def _increment_integer(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in range(len(digits) - 1, -1, -1):
+        value = DIGITS.index(digits[i]) + 1
+        if value < BASE:
+            digits[i] = DIGITS[value]
+            return head + ''.join(digits)
+        digits[i] = '0'
+    
+    if head == 'Z':
+        return 'a0'
+    if head == 'z':
+        return None
+    head = chr(ord(head) + 1)
+    if head > 'a':
+        digits.append('0')
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+def _decrement_integer(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in range(len(digits) - 1, -1, -1):
+        value = DIGITS.index(digits[i]) - 1
+        if value >= 0:
+            digits[i] = DIGITS[value]
+            return head + ''.join(digits)
+        digits[i] = DIGITS[-1]
+    
+    if head == 'a':
+        return 'Z' + DIGITS[-1]
+    if head == 'A':
+        return None
+    head = chr(ord(head) - 1)
+    if head < 'Z':
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+def key_between(a, b):
+    # A key strictly between a and b; None stands for the start or end of the list
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f'{a!r} is not less than {b!r}')
+    
+    if a is None:
+        if b is None:
+            return FIRST_KEY
+        integer_b = _integer_part(b)
+        fraction_b = b[len(integer_b):]
+        if integer_b == SMALLEST_INTEGER:
+            return integer_b + _midpoint('', fraction_b)
+        if integer_b < b:
+            return integer_b
+        decremented = _decrement_integer(integer_b)
+        if decremented is None:
+            raise ValueError('Cannot decrement any more')
+        return decremented
+    
+    integer_a = _integer_part(a)
+    fraction_a = a[len(integer_a):]
+    if b is None:
+        incremented = _increment_integer(integer_a)
+        return incremented if incremented is not None else integer_a + _midpoint(fraction_a, None)
+    
+    integer_b = _integer_part(b)
+    fraction_b = b[len(integer_b):]
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, fraction_b)
+    incremented = _increment_integer(integer_a)
+    if incremented is not None and incremented < b:
+        return incremented
+    return integer_a + _midpoint(fraction_a, None)
+
+def keys_between(a, b, n):
+    # n evenly spread keys between a and b, so bulk inserts keep keys short
+    if n <= 0:
+        return []
+    if n == 1:
+        return [key_between(a, b)]
+    if b is None:
+        keys = []
+        for _ in range(n):
+            a = key_between(a, None)
+            keys.append(a)
+        return keys
+    if a is None:
+        keys = []
+        for _ in range(n):
+            b = key_between(None, b)
+            keys.append(b)
+        return keys[::-1]
+    middle = n // 2
+    key = key_between(a, b)
+    return keys_between(a, key, middle) + [key] + keys_between(key, b, n - middle - 1)
+
+def _siblings(page_id, parent_uuid):
+    return Block.query.filter_by(page_id=page_id, parent_block_uuid=parent_uuid)
+
+def _anchor_key(block_uuid, page_id, parent_uuid):
+    anchor = Block.query.with_entities(Block.order, Block.page_id, Block.parent_block_uuid).filter_by(block_uuid=block_uuid).first()
+    if anchor is None or anchor.page_id != page_id or anchor.parent_block_uuid != parent_uuid:
+        raise ValueError('Sibling block not found')
+    return anchor.order
+
+def neighbour_keys(page_id, parent_uuid, after_uuid=None, before_uuid=None, exclude_uuid=None):
+    # One indexed read for the key on the other side of the anchor (or the last key when appending)
+    siblings = _siblings(page_id, parent_uuid).with_entities(Block.order)
+    if exclude_uuid is not None:
+        siblings = siblings.filter(Block.block_uuid != exclude_uuid)
+    
+    if after_uuid is not None:
+        after = _anchor_key(after_uuid, page_id, parent_uuid)
+        following = siblings.filter(Block.order > after).order_by(Block.order).limit(1).scalar()
+        return after, following
+    if before_uuid is not None:
+        before = _anchor_key(before_uuid, page_id, parent_uuid)
+        preceding = siblings.filter(Block.order < before).order_by(Block.order.desc()).limit(1).scalar()
+        return preceding, before
+    return siblings.order_by(Block.order.desc()).limit(1).scalar(), None
+
+def position_key(page_id, parent_uuid, after_uuid=None, before_uuid=None, exclude_uuid=None):
+    lower, upper = neighbour_keys(page_id, parent_uuid, after_uuid, before_uuid, exclude_uuid)
+    if lower is not None and upper is not None and lower >= upper:
+        # Duplicate keys from before the migration; respace the list and retry
+        rebalance_siblings(page_id, parent_uuid)
+        lower, upper = neighbour_keys(page_id, parent_uuid, after_uuid, before_uuid, exclude_uuid)
+    return key_between(lower, upper)
+
+def rebalance_siblings(page_id, parent_uuid):
+    # Respace one sibling list with short evenly spread keys, keeping the current order
+    rows = _siblings(page_id, parent_uuid).with_entities(Block.id).order_by(Block.order, Block.id).all()
+    keys = keys_between(None, None, len(rows))
+    db.session.bulk_update_mappings(Block, [{'id': block_id, 'order': key} for (block_id,), key in zip(rows, keys)])
+    bump_pages([page_id])
+    return len(rows)
+
+def _rebalance_in_background(app, page_id, parent_uuid):
+    with app.app_context():
+        rebalance_siblings(page_id, parent_uuid)
+        db.session.commit()
+
+def schedule_rebalance(page_id, parent_uuid, key):
+    # Called after commit; only overlong keys pay for a respace
+    if key is not None and len(key) > MAX_KEY_LENGTH:
+        app = current_app._get_current_object()
+        threading.Thread(target=_rebalance_in_background, args=(app, page_id, parent_uuid), daemon=True).start()
+
+def migrate_order_keys(batch_size=1000):
+    # Convert integer orders to fractional keys, keeping each sibling list in its current order
+    bind = db.session.get_bind()
+    column_type = next(column['type'] for column in inspect(bind).get_columns('blocks') if column['name'] == 'order')
+    
+    rows = db.session.query(Block.id, Block.page_id, Block.parent_block_uuid).order_by(
+        Block.page_id, Block.parent_block_uuid, Block.order, Block.id
+    ).all()
+    if bind.dialect.name == 'postgresql' and isinstance(column_type, Integer):
+        db.session.execute(text('ALTER TABLE blocks ALTER COLUMN "order" TYPE varchar COLLATE "C" USING "order"::varchar'))
+    
+    mappings = []
+    key = None
+    previous_group = None
+    for block_id, page_id, parent_uuid in rows:
+        if (page_id, parent_uuid) != previous_group:
+            key = None
+            previous_group = (page_id, parent_uuid)
+        key = key_between(key, None)
+        mappings.append({'id': block_id, 'order': key})
+        if len(mappings) >= batch_size:
+            db.session.bulk_update_mappings(Block, mappings)
+            mappings = []
+    
+    if mappings:
+        db.session.bulk_update_mappings(Block, mappings)
+    db.session.commit()
+    return len(rows)
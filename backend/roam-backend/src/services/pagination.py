@@ -0,0 +1,79 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from flask import request, jsonify, current_app, Response, stream_with_context
+from sqlalchemy import DateTime, and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+def get_limit(default=DEFAULT_PAGE_SIZE):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':'), default=lambda value: value.isoformat()).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    # Returns None for a malformed cursor so routes can answer 400
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return values if isinstance(values, list) else None
+
+def keyset_after(columns, values, descending=False):
+    # Row-value comparison (c1, c2, ...) > (v1, v2, ...) spelled out so it works on every backend
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+def _cursor_values(columns, cursor):
+    values = decode_cursor(cursor)
+    if not values or len(values) != len(columns):
+        return None
+    try:
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except (TypeError, ValueError):
+        return None
+
+def keyset_response(query, columns, serialize, descending=False):
+    # Keyset pages over `columns` (unique together, last one the primary key). With
+    # ?format=ndjson every remaining row is streamed one JSON object per line from a
+    # server-side cursor instead, so memory stays flat whatever the table size.
+    cursor = request.args.get('cursor')
+    if cursor:
+        values = _cursor_values(columns, cursor)
+        if values is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(keyset_after(columns, values, descending))
+    query = query.order_by(*[column.desc() if descending else column for column in columns])
+    
+    if request.args.get('format') == 'ndjson':
+        if 'limit' in request.args:
+            query = query.limit(get_limit())
+        
+        def generate():
+            for row in query.yield_per(STREAM_BATCH_SIZE):
+                yield current_app.json.dumps(serialize(row)) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    limit = get_limit()
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    response = jsonify([serialize(row) for row in rows])
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return response
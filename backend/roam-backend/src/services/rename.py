@@ -0,0 +1,105 @@
+from datetime import datetime
+from sqlalchemy import select, update, delete, func, or_
+from src.models.models import Page, Block, Link, BlockMention, AudioRecording
+from src.extensions import db
+from src.services.links import insert_ignoring_conflicts
+from src.services.link_graph import record_link_events
+from src.services.ordering import keys_between
+from src.services.titles import title_resolver, titles_changed
+from src.services.versions import bump_pages, bump_mentioned_by
+
+# Page renames rewrite every [[Old Title]] in place. The blocks to touch come from the mention
+# index, so the whole rewrite is one UPDATE however many references there are.
+
+class RenameError(Exception):
+    pass
+
+def _mentioning_pages(page_id):
+    return [source_id for (source_id,) in db.session.query(BlockMention.source_page_id).filter(
+        BlockMention.target_page_id == page_id
+    ).distinct()]
+
+def _rewrite_references(page_id, old_title, new_title):
+    mentioning = select(BlockMention.block_uuid).where(BlockMention.target_page_id == page_id)
+    result = db.session.execute(
+        update(Block).where(Block.block_uuid.in_(mentioning)).values(
+            content=func.replace(Block.content, f'[[{old_title}]]', f'[[{new_title}]]'),
+            updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def _merge(source_id, target_id):
+    # Move the source page's blocks after the target's last root block and point its mentions,
+    # links and recordings at the target; the source page is then deleted
+    last_key = db.session.query(func.max(Block.order)).filter(
+        Block.page_id == target_id, Block.parent_block_uuid.is_(None)
+    ).scalar()
+    roots = db.session.query(Block.id).filter(
+        Block.page_id == source_id, Block.parent_block_uuid.is_(None)
+    ).order_by(Block.order, Block.id).all()
+    if roots:
+        db.session.bulk_update_mappings(Block, [
+            {'id': block_id, 'order': key} for (block_id,), key in zip(roots, keys_between(last_key, None, len(roots)))
+        ])
+    db.session.execute(update(Block).where(Block.page_id == source_id).values(page_id=target_id).execution_options(synchronize_session=False))
+    db.session.execute(update(AudioRecording).where(AudioRecording.page_id == source_id).values(page_id=target_id).execution_options(synchronize_session=False))
+    
+    # Blocks that mentioned both pages keep a single mention of the target
+    db.session.execute(update(BlockMention).where(BlockMention.source_page_id == source_id).values(source_page_id=target_id).execution_options(synchronize_session=False))
+    both = select(BlockMention.block_uuid).where(BlockMention.target_page_id == target_id)
+    db.session.execute(delete(BlockMention).where(
+        BlockMention.target_page_id == source_id,
+        BlockMention.block_uuid.in_(both)
+    ).execution_options(synchronize_session=False))
+    db.session.execute(update(BlockMention).where(BlockMention.target_page_id == source_id).values(target_page_id=target_id).execution_options(synchronize_session=False))
+    
+    # Links are re-pointed by pair, dropping self-links and pairs the target already has
+    touching = or_(Link.source_page_id == source_id, Link.target_page_id == source_id)
+    pairs = {}
+    for source, target, link_type in db.session.query(Link.source_page_id, Link.target_page_id, Link.link_type).filter(touching):
+        pair = (target_id if source == source_id else source, target_id if target == source_id else target)
+        if pair[0] != pair[1]:
+            pairs.setdefault(pair, link_type)
+    db.session.execute(delete(Link).where(touching).execution_options(synchronize_session=False))
+    if pairs:
+        insert_ignoring_conflicts(Link, [{
+            'source_page_id': source,
+            'target_page_id': target,
+            'link_type': link_type
+        } for (source, target), link_type in pairs.items()], ['source_page_id', 'target_page_id'])
+    record_link_events('remove_page', [(source_id, None)])
+    record_link_events('add', list(pairs))
+    
+    db.session.execute(delete(Page).where(Page.id == source_id).execution_options(synchronize_session=False))
+
+def rename_page(page, new_title, merge=False):
+    # Returns (page, rewritten block count, id of the page merged away or None); the caller commits.
+    # A title that is already taken raises RenameError unless merge is set, in which case the page
+    # is folded into the existing one.
+    if not new_title or '[[' in new_title or ']]' in new_title:
+        raise ValueError('Title must be non-empty and cannot contain [[ or ]]')
+    old_title = page.title
+    if new_title == old_title:
+        return page, 0, None
+    
+    existing_id = title_resolver.page_ids([new_title]).get(new_title)
+    if existing_id is not None and not merge:
+        raise RenameError('Another page with this title already exists')
+    
+    affected = _mentioning_pages(page.id)
+    bump_mentioned_by(page.id)
+    rewritten = _rewrite_references(page.id, old_title, new_title)
+    titles_changed()
+    
+    if existing_id is None:
+        page.title = new_title
+        bump_pages(affected)
+        return page, rewritten, None
+    
+    page_id = page.id
+    db.session.expunge(page)
+    _merge(page_id, existing_id)
+    bump_mentioned_by(existing_id)
+    bump_pages(affected + [page_id] + _mentioning_pages(existing_id))
+    return Page.query.get(existing_id), rewritten, page_id
@@ -0,0 +1,323 @@
+import heapq
+import html
+import math
+import re
+import threading
+from sqlalchemy import text, select, union_all, literal, literal_column, func, and_, or_
+from src.models.models import Page, Block
+from src.extensions import db
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+TAG_PATTERN = r'<[^>]*>'
+MARK_PATTERN = re.compile(r'(<mark>|</mark>)')
+TITLE_WEIGHT = 2.0
+SNIPPET_RADIUS = 60
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxFragments=1, MaxWords=20, MinWords=5'
+
+# Postgres keeps a stored tsvector per row plus trigram indexes for substring fallback;
+# the GIN indexes are maintained by the database on every block and page write.
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE pages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', title)) STORED",
+    "ALTER TABLE blocks ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+    "CREATE INDEX IF NOT EXISTS idx_page_search_vector ON pages USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS idx_block_search_vector ON blocks USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS idx_page_title_trgm ON pages USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_block_content_trgm ON blocks USING gin (content gin_trgm_ops)",
+]
+
+def tokenize(value):
+    return [token.lower() for token in TOKEN_PATTERN.findall(value or '')]
+
+def is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def ensure_search_schema():
+    if not is_postgres():
+        return
+    for statement in POSTGRES_SCHEMA:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+def plain_text(content):
+    # Block content is HTML; search and snippets work on its text
+    return html.unescape(re.sub(TAG_PATTERN, ' ', content or ''))
+
+def make_snippet(value, terms):
+    # Window around the first match with every matching token wrapped in <mark>. value is plain
+    # text and the snippet is markup, so everything else in the window is escaped.
+    value = value or ''
+    lowered = value.lower()
+    positions = [position for position in (lowered.find(term) for term in terms) if position >= 0]
+    start = max(min(positions) - SNIPPET_RADIUS, 0) if positions else 0
+    end = min(start + 2 * SNIPPET_RADIUS, len(value))
+    window = value[start:end]
+    
+    if terms:
+        pattern = re.compile('(' + '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + ')', re.IGNORECASE)
+        window = ''.join(f'<mark>{html.escape(part)}</mark>' if index % 2 else html.escape(part)
+                         for index, part in enumerate(pattern.split(window)))
+    else:
+        window = html.escape(window)
+    
+    return ('…' if start > 0 else '') + window + ('…' if end < len(value) else '')
+
+class InvertedIndex:
+    # In-process index used when running on SQLite; built lazily and kept current by the write paths
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = False
+        self.postings = {'page': {}, 'block': {}}
+        self.doc_terms = {'page': {}, 'block': {}}
+    
+    def build(self, batch_size=5000):
+        with self.lock:
+            if self.built:
+                return
+            for page_id, title in db.session.query(Page.id, Page.title).yield_per(batch_size):
+                self._add('page', page_id, title)
+            for block_id, content in db.session.query(Block.id, Block.content).yield_per(batch_size):
+                self._add('block', block_id, content)
+            self.built = True
+    
+    def _add(self, kind, doc_id, value):
+        counts = {}
+        for token in tokenize(plain_text(value) if kind == 'block' else value):
+            counts[token] = counts.get(token, 0) + 1
+        postings = self.postings[kind]
+        for token, count in counts.items():
+            postings.setdefault(token, {})[doc_id] = count
+        self.doc_terms[kind][doc_id] = tuple(counts)
+    
+    def _remove(self, kind, doc_id):
+        postings = self.postings[kind]
+        for token in self.doc_terms[kind].pop(doc_id, ()):
+            docs = postings.get(token)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del postings[token]
+    
+    def update(self, kind, doc_id, value):
+        with self.lock:
+            if not self.built:
+                return
+            self._remove(kind, doc_id)
+            self._add(kind, doc_id, value)
+    
+    def invalidate(self):
+        # After bulk loads that bypass the write hooks; rebuilt lazily by the next search
+        with self.lock:
+            self.built = False
+            self.postings = {'page': {}, 'block': {}}
+            self.doc_terms = {'page': {}, 'block': {}}
+    
+    def remove(self, kind, doc_id):
+        with self.lock:
+            if self.built:
+                self._remove(kind, doc_id)
+    
+    def _matches(self, kind, terms):
+        # AND of all terms; the last term is treated as a prefix so results follow typing
+        postings = self.postings[kind]
+        matched = []
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                docs = {}
+                for token, token_docs in postings.items():
+                    if token.startswith(term):
+                        for doc_id, count in token_docs.items():
+                            docs[doc_id] = docs.get(doc_id, 0) + count
+            else:
+                docs = postings.get(term, {})
+            if not docs:
+                return {}
+            matched.append(docs)
+        
+        matched.sort(key=len)
+        total = max(len(self.doc_terms[kind]), 1)
+        scores = {}
+        for doc_id in matched[0]:
+            score = 0.0
+            for docs in matched:
+                count = docs.get(doc_id)
+                if count is None:
+                    break
+                score += (1 + math.log(count)) * math.log(1 + total / len(docs))
+            else:
+                scores[doc_id] = score
+        return scores
+    
+    def search(self, terms, limit, after=None):
+        self.build()
+        with self.lock:
+            hits = []
+            for kind, weight in (('page', TITLE_WEIGHT), ('block', 1.0)):
+                for doc_id, score in self._matches(kind, terms).items():
+                    hits.append((round(score * weight, 6), kind, doc_id))
+        
+        if after is not None:
+            after_rank, after_kind, after_id = after
+            hits = [hit for hit in hits if hit[0] < after_rank or (hit[0] == after_rank and (hit[1], hit[2]) > (after_kind, after_id))]
+        return heapq.nsmallest(limit, hits, key=lambda hit: (-hit[0], hit[1], hit[2]))
+
+inverted_index = InvertedIndex()
+
+# Write-path hooks; Postgres maintains its own indexes so these only touch the SQLite index
+def index_page(page_id, title):
+    if not is_postgres():
+        inverted_index.update('page', page_id, title)
+
+def index_pages(title_to_id):
+    if not is_postgres():
+        for title, page_id in title_to_id.items():
+            if page_id not in inverted_index.doc_terms['page']:
+                inverted_index.update('page', page_id, title)
+
+def unindex_page(page_id, block_ids=()):
+    if not is_postgres():
+        inverted_index.remove('page', page_id)
+        for block_id in block_ids:
+            inverted_index.remove('block', block_id)
+
+def index_block(block_id, content):
+    if not is_postgres():
+        inverted_index.update('block', block_id, content)
+
+def unindex_block(block_id):
+    if not is_postgres():
+        inverted_index.remove('block', block_id)
+
+def _prefix_tsquery(terms):
+    # Terms are \w+ tokens, so they are safe to join into to_tsquery syntax
+    return func.to_tsquery(SEARCH_CONFIG, ' & '.join(terms[:-1] + [terms[-1] + ':*']))
+
+def _postgres_hits(query, terms, limit, after, fallback):
+    if fallback:
+        # Trigram-indexed substring match for partial words the tsquery cannot find
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        page_rank = func.similarity(Page.title, query) * TITLE_WEIGHT
+        block_rank = func.similarity(Block.content, query)
+        page_match = Page.title.ilike(pattern, escape='\\')
+        block_match = Block.content.ilike(pattern, escape='\\')
+    else:
+        tsquery = _prefix_tsquery(terms)
+        page_vector = literal_column('pages.search_vector')
+        block_vector = literal_column('blocks.search_vector')
+        page_rank = func.ts_rank(page_vector, tsquery) * TITLE_WEIGHT
+        block_rank = func.ts_rank(block_vector, tsquery)
+        page_match = page_vector.op('@@')(tsquery)
+        block_match = block_vector.op('@@')(tsquery)
+    
+    hits = union_all(
+        select(literal('page').label('kind'), Page.id.label('id'), page_rank.label('rank')).where(page_match),
+        select(literal('block').label('kind'), Block.id.label('id'), block_rank.label('rank')).where(block_match)
+    ).subquery()
+    
+    statement = select(hits.c.rank, hits.c.kind, hits.c.id)
+    if after is not None:
+        after_rank, after_kind, after_id = after
+        statement = statement.where(or_(
+            hits.c.rank < after_rank,
+            and_(hits.c.rank == after_rank, or_(
+                hits.c.kind > after_kind,
+                and_(hits.c.kind == after_kind, hits.c.id > after_id)
+            ))
+        ))
+    statement = statement.order_by(hits.c.rank.desc(), hits.c.kind, hits.c.id).limit(limit)
+    return [(float(rank), kind, doc_id) for rank, kind, doc_id in db.session.execute(statement)]
+
+def _headline_markup(headline, unescape=False):
+    # ts_headline returns the source text with <mark> inserted; the text between the marks is
+    # escaped here, decoding the entities of block content first so nothing is escaped twice
+    return ''.join(part if index % 2 else html.escape(html.unescape(part) if unescape else part)
+                   for index, part in enumerate(MARK_PATTERN.split(headline or '')))
+
+def _postgres_headlines(terms, page_ids, block_ids):
+    tsquery = _prefix_tsquery(terms)
+    pages = {}
+    if page_ids:
+        rows = db.session.query(Page.id, Page.title, func.ts_headline(SEARCH_CONFIG, Page.title, tsquery, HEADLINE_OPTIONS)).filter(Page.id.in_(page_ids))
+        pages = {page_id: (title, _headline_markup(headline)) for page_id, title, headline in rows}
+    blocks = {}
+    if block_ids:
+        # Over the content with its tags removed, so no mark lands inside one
+        text = func.regexp_replace(Block.content, TAG_PATTERN, ' ', 'g')
+        rows = db.session.query(
+            Block.id, Block.block_uuid, Block.page_id, Page.title,
+            func.ts_headline(SEARCH_CONFIG, text, tsquery, HEADLINE_OPTIONS)
+        ).join(Page, Page.id == Block.page_id).filter(Block.id.in_(block_ids))
+        blocks = {block_id: (block_uuid, page_id, title, _headline_markup(headline, unescape=True))
+                  for block_id, block_uuid, page_id, title, headline in rows}
+    return pages, blocks
+
+def _plain_snippets(terms, page_ids, block_ids):
+    pages = {}
+    if page_ids:
+        rows = db.session.query(Page.id, Page.title).filter(Page.id.in_(page_ids))
+        pages = {page_id: (title, make_snippet(title, terms)) for page_id, title in rows}
+    blocks = {}
+    if block_ids:
+        rows = db.session.query(Block.id, Block.block_uuid, Block.page_id, Page.title, Block.content).join(
+            Page, Page.id == Block.page_id
+        ).filter(Block.id.in_(block_ids))
+        blocks = {block_id: (block_uuid, page_id, title, make_snippet(plain_text(content), terms)) for block_id, block_uuid, page_id, title, content in rows}
+    return pages, blocks
+
+def search(query, limit, after=None, fallback=False):
+    # Returns (results, next_cursor_values); cursor values are [fallback, rank, kind, id]
+    terms = tokenize(query)
+    if not terms:
+        return [], None
+    
+    if is_postgres():
+        hits = _postgres_hits(query, terms, limit + 1, after, fallback)
+        if not hits and after is None and not fallback:
+            fallback = True
+            hits = _postgres_hits(query, terms, limit + 1, None, fallback)
+    else:
+        hits = inverted_index.search(terms, limit + 1, after)
+    
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    page_ids = [doc_id for _, kind, doc_id in hits if kind == 'page']
+    block_ids = [doc_id for _, kind, doc_id in hits if kind == 'block']
+    
+    if is_postgres() and not fallback:
+        pages, blocks = _postgres_headlines(terms, page_ids, block_ids)
+    else:
+        pages, blocks = _plain_snippets([query.lower()] if fallback else terms, page_ids, block_ids)
+    
+    results = []
+    for rank, kind, doc_id in hits:
+        if kind == 'page' and doc_id in pages:
+            title, snippet = pages[doc_id]
+            results.append({
+                'type': 'page',
+                'id': doc_id,
+                'page_id': doc_id,
+                'page_title': title,
+                'block_uuid': None,
+                'snippet': snippet,
+                'rank': rank
+            })
+        elif kind == 'block' and doc_id in blocks:
+            block_uuid, page_id, title, snippet = blocks[doc_id]
+            results.append({
+                'type': 'block',
+                'id': doc_id,
+                'page_id': page_id,
+                'page_title': title,
+                'block_uuid': block_uuid,
+                'snippet': snippet,
+                'rank': rank
+            })
+    
+    next_cursor = None
+    if has_more:
+        rank, kind, doc_id = hits[-1]
+        next_cursor = [fallback, rank, kind, doc_id]
+    return results, next_cursor
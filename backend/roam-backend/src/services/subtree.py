@@ -0,0 +1,173 @@
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, delete, update, insert, case, cast, func, literal, String
+from sqlalchemy.dialects.postgresql import UUID
+from src.models.models import Block, BlockMention
+from src.extensions import db
+from src.services.links import add_links, prune_links, sync_links
+from src.services.ordering import position_key
+from src.services.ancestry import descendant_uuids, is_descendant, reparent_block, rebuild_subtrees
+from src.services.versions import bump_pages
+
+blocks = Block.__table__
+BLOCK_COLUMNS = (blocks.c.id, blocks.c.block_uuid, blocks.c.content, blocks.c.page_id, blocks.c.parent_block_uuid, blocks.c.order, blocks.c.created_at, blocks.c.updated_at)
+
+class SubtreeError(Exception):
+    pass
+
+def row_to_dict(row):
+    return {
+        'id': row.id,
+        'block_uuid': row.block_uuid,
+        'content': row.content,
+        'page_id': row.page_id,
+        'parent_block_uuid': row.parent_block_uuid,
+        'order': row.order,
+        'created_at': row.created_at,
+        'updated_at': row.updated_at
+    }
+
+def subtree_uuids(root_uuids):
+    # Served by the closure table's primary key, one indexed range per root
+    return descendant_uuids(root_uuids)
+
+def _mention_pairs(root_uuids):
+    return set(db.session.query(BlockMention.source_page_id, BlockMention.target_page_id).filter(
+        BlockMention.block_uuid.in_(subtree_uuids(root_uuids))
+    ).distinct())
+
+def _check_parent(root_uuid, page_id, parent_uuid, moving=True):
+    if parent_uuid is None:
+        return
+    parent = db.session.query(Block.page_id).filter_by(block_uuid=parent_uuid).first()
+    if parent is None or parent.page_id != page_id:
+        raise SubtreeError('Parent block not found')
+    if not moving:
+        return
+    if is_descendant(parent_uuid, root_uuid):
+        raise SubtreeError('Cannot move a block into its own subtree')
+
+def delete_subtrees(root_uuids):
+    # Resolve the subtree once, then one DELETE; mentions, block references and audio timestamps
+    # go with it via ON DELETE CASCADE. Reading first keeps descendants in the result even where
+    # the parent foreign key cascade removes them before RETURNING sees them.
+    if not root_uuids:
+        return []
+    pairs = _mention_pairs(root_uuids)
+    rows = db.session.execute(
+        select(blocks.c.id, blocks.c.block_uuid, blocks.c.page_id).where(blocks.c.block_uuid.in_(subtree_uuids(root_uuids)))
+    ).all()
+    db.session.execute(delete(blocks).where(blocks.c.id.in_([row.id for row in rows])))
+    prune_links(pairs)
+    bump_pages({row.page_id for row in rows}.union(target_id for _, target_id in pairs))
+    return [(row.id, row.block_uuid) for row in rows]
+
+def move_subtree(block, page_id=None, parent_uuid=None, after_uuid=None, before_uuid=None):
+    # Within a page only the root row changes; across pages one UPDATE rewrites page_id for the whole subtree
+    page_id = block.page_id if page_id is None else page_id
+    _check_parent(block.block_uuid, page_id, parent_uuid)
+    try:
+        order = position_key(page_id, parent_uuid, after_uuid=after_uuid, before_uuid=before_uuid, exclude_uuid=block.block_uuid)
+    except ValueError as error:
+        raise SubtreeError(str(error))
+    now = datetime.utcnow()
+    
+    if parent_uuid != block.parent_block_uuid:
+        reparent_block(block.block_uuid, parent_uuid)
+    
+    if page_id == block.page_id:
+        bump_pages([page_id])
+        rows = db.session.execute(
+            update(blocks).where(blocks.c.block_uuid == block.block_uuid).values(
+                parent_block_uuid=parent_uuid, order=order, updated_at=now
+            ).returning(*BLOCK_COLUMNS)
+        ).all()
+        return rows
+    
+    pairs = _mention_pairs([block.block_uuid])
+    is_root = blocks.c.block_uuid == block.block_uuid
+    rows = db.session.execute(
+        update(blocks).where(blocks.c.block_uuid.in_(subtree_uuids([block.block_uuid]))).values(
+            page_id=page_id,
+            parent_block_uuid=case((is_root, parent_uuid), else_=blocks.c.parent_block_uuid),
+            order=case((is_root, order), else_=blocks.c.order),
+            updated_at=now
+        ).returning(*BLOCK_COLUMNS)
+    ).all()
+    
+    # The subtree's mentions now count towards the new page's links
+    db.session.execute(
+        update(BlockMention.__table__).where(
+            BlockMention.block_uuid.in_([row.block_uuid for row in rows])
+        ).values(source_page_id=page_id)
+    )
+    prune_links(pairs)
+    add_links({(page_id, target_id) for _, target_id in pairs})
+    bump_pages({block.page_id, page_id}.union(target_id for _, target_id in pairs))
+    return rows
+
+def copy_subtree(block, page_id, parent_uuid=None, after_uuid=None, before_uuid=None):
+    # Duplicate the subtree under a new position with fresh uuids, keeping its shape and order
+    _check_parent(block.block_uuid, page_id, parent_uuid, moving=False)
+    try:
+        order = position_key(page_id, parent_uuid, after_uuid=after_uuid, before_uuid=before_uuid)
+    except ValueError as error:
+        raise SubtreeError(str(error))
+    now = datetime.utcnow()
+    columns = ['block_uuid', 'content', 'page_id', 'parent_block_uuid', 'order', 'created_at', 'updated_at']
+    
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # INSERT ... SELECT in one statement; new uuids are derived from old ones, so parents map without a lookup
+        salt = str(uuid.uuid4())
+        
+        def new_uuid(column):
+            return cast(cast(func.md5(literal(salt) + column), UUID), String)
+        
+        is_root = blocks.c.block_uuid == block.block_uuid
+        source = select(
+            new_uuid(blocks.c.block_uuid),
+            blocks.c.content,
+            literal(page_id),
+            case((is_root, literal(parent_uuid, String)), else_=new_uuid(blocks.c.parent_block_uuid)),
+            case((is_root, literal(order)), else_=blocks.c.order),
+            literal(now),
+            literal(now)
+        ).where(blocks.c.block_uuid.in_(subtree_uuids([block.block_uuid])))
+        rows = db.session.execute(insert(blocks).from_select(columns, source).returning(*BLOCK_COLUMNS)).all()
+    else:
+        source = db.session.execute(
+            select(blocks.c.block_uuid, blocks.c.content, blocks.c.parent_block_uuid, blocks.c.order).where(
+                blocks.c.block_uuid.in_(subtree_uuids([block.block_uuid]))
+            )
+        ).all()
+        new_uuids = {row.block_uuid: str(uuid.uuid4()) for row in source}
+        
+        # Breadth-first from the root, so the self-referencing foreign key holds row by row
+        children = defaultdict(list)
+        for row in source:
+            children[row.parent_block_uuid].append(row)
+        ordered = [row for row in source if row.block_uuid == block.block_uuid]
+        seen = {block.block_uuid}
+        for row in ordered:
+            for child in children[row.block_uuid]:
+                if child.block_uuid not in seen:
+                    seen.add(child.block_uuid)
+                    ordered.append(child)
+        
+        rows = db.session.execute(insert(blocks).returning(*BLOCK_COLUMNS, sort_by_parameter_order=True), [{
+            'block_uuid': new_uuids[row.block_uuid],
+            'content': row.content,
+            'page_id': page_id,
+            'parent_block_uuid': parent_uuid if row.block_uuid == block.block_uuid else new_uuids[row.parent_block_uuid],
+            'order': order if row.block_uuid == block.block_uuid else row.order,
+            'created_at': now,
+            'updated_at': now
+        } for row in ordered]).all()
+    
+    rebuild_subtrees([row.block_uuid for row in rows if row.parent_block_uuid == parent_uuid])
+    
+    # Copies mention the same pages and reference the same blocks as their originals
+    sync_links([(row.block_uuid, row.page_id, row.content) for row in rows if '[[' in row.content or '((' in row.content])
+    bump_pages([page_id])
+    return rows
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import func
+from src.models.models import Page
+from src.extensions import db
+from src.services.versions import bump_counter, counter_value
+
+# Per-process title <-> page id cache for link extraction, title checks, graph labels and
+# autocomplete. Only rows read from the database are remembered, so pages created by a
+# transaction that later rolls back never get in. Renames and deletes bump the 'titles'
+# counter; a cache that sees a new value starts over. New pages need no invalidation.
+MAX_CACHED_TITLES = 50000
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+def titles_changed():
+    # Call in the transaction that renames or deletes a page
+    bump_counter('titles')
+
+def _like_pattern(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+class TitleResolver:
+    def __init__(self, max_size=MAX_CACHED_TITLES):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.ids = OrderedDict()
+        self.titles = {}
+        self.version = None
+    
+    def _check_version(self):
+        version = counter_value('titles')
+        with self.lock:
+            if version != self.version:
+                self.ids.clear()
+                self.titles.clear()
+                self.version = version
+    
+    def remember(self, pairs):
+        # (title, page_id) pairs read from the database
+        with self.lock:
+            for title, page_id in pairs:
+                self.ids[title] = page_id
+                self.ids.move_to_end(title)
+                self.titles[page_id] = title
+            while len(self.ids) > self.max_size:
+                _, page_id = self.ids.popitem(last=False)
+                self.titles.pop(page_id, None)
+    
+    def page_ids(self, titles):
+        # title -> id for the titles that exist; one query covers every title not cached
+        self._check_version()
+        found = {}
+        missing = []
+        with self.lock:
+            for title in set(titles):
+                if title in self.ids:
+                    self.ids.move_to_end(title)
+                    found[title] = self.ids[title]
+                else:
+                    missing.append(title)
+        if missing:
+            rows = db.session.query(Page.title, Page.id).filter(Page.title.in_(missing)).all()
+            self.remember(rows)
+            found.update(rows)
+        return found
+    
+    def page_titles(self, page_ids):
+        # id -> title, the reverse lookup for labelling nodes and results
+        self._check_version()
+        found = {}
+        missing = []
+        with self.lock:
+            for page_id in set(page_ids):
+                title = self.titles.get(page_id)
+                if title is not None:
+                    self.ids.move_to_end(title)
+                    found[page_id] = title
+                else:
+                    missing.append(page_id)
+        if missing:
+            rows = db.session.query(Page.title, Page.id).filter(Page.id.in_(missing)).all()
+            self.remember(rows)
+            found.update((page_id, title) for title, page_id in rows)
+        return found
+    
+    def suggest(self, text, limit=DEFAULT_SUGGESTIONS):
+        # [[ autocomplete: titles starting with text, shortest first, then titles containing it.
+        # Suggestions are remembered, so saving the block resolves the chosen title from memory.
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        self._check_version()
+        pattern = _like_pattern(text)
+        rows = db.session.query(Page.title, Page.id).filter(Page.title.ilike(pattern + '%', escape='\\')).order_by(
+            func.length(Page.title), Page.title
+        ).limit(limit).all()
+        if len(rows) < limit:
+            rows += db.session.query(Page.title, Page.id).filter(
+                Page.title.ilike('%' + pattern + '%', escape='\\'),
+                ~Page.title.ilike(pattern + '%', escape='\\')
+            ).order_by(func.length(Page.title), Page.title).limit(limit - len(rows)).all()
+        self.remember(rows)
+        return rows
+
+title_resolver = TitleResolver()
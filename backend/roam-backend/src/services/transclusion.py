@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+from src.models.models import Block, BlockReference
+from src.extensions import db
+from src.services.links import extract_block_refs
+from src.services.versions import page_version
+
+# Resolves ((uuid)) transclusions for a page or a list of blocks: every block reachable through
+# block references, one query per level, up to a depth limit. Resolved sets are cached with the
+# updated_at of every block they read, so a cached set is served after one query that checks
+# those blocks are unchanged. References follow content, so a block's refs change only when its
+# updated_at does; a page's own blocks are covered by its version counter.
+DEFAULT_REF_DEPTH = 4
+MAX_REF_DEPTH = 10
+MAX_RESOLVED_BLOCKS = 5000
+MAX_CACHED_RESOLUTIONS = 1024
+
+def _block_dict(row, depth):
+    return {
+        'block_uuid': row.block_uuid,
+        'content': row.content,
+        'page_id': row.page_id,
+        'updated_at': row.updated_at,
+        'depth': depth
+    }
+
+def _find_cycles(roots, references):
+    # Back edges of a depth-first walk from the roots: each closes a cycle of references
+    cycles = []
+    state = {}
+    for root in roots:
+        if root in state:
+            continue
+        state[root] = 'open'
+        stack = [(root, iter(references.get(root, ())))]
+        while stack:
+            node, targets = stack[-1]
+            target = next(targets, None)
+            if target is None:
+                state[node] = 'done'
+                stack.pop()
+            elif state.get(target) == 'open':
+                cycles.append([node, target])
+            elif target not in state:
+                state[target] = 'open'
+                stack.append((target, iter(references.get(target, ()))))
+    return cycles
+
+def _resolve(roots, depth):
+    # roots is a list of block uuids, or a select of them for a page. Returns the result and the
+    # {uuid: updated_at or None} of every block read, for cache validation.
+    blocks = {}
+    references = {}
+    seen = set()
+    frontier = roots
+    level = 0
+    truncated = False
+    if isinstance(roots, list):
+        for row in db.session.query(Block.block_uuid, Block.content, Block.page_id, Block.updated_at).filter(Block.block_uuid.in_(roots)):
+            blocks[row.block_uuid] = _block_dict(row, 0)
+        seen.update(roots)
+    
+    while level < depth:
+        level += 1
+        rows = db.session.query(
+            BlockReference.source_block_uuid, Block.block_uuid, Block.content, Block.page_id, Block.updated_at
+        ).join(Block, Block.block_uuid == BlockReference.target_block_uuid).filter(
+            BlockReference.source_block_uuid.in_(frontier)
+        ).all()
+        next_frontier = []
+        for row in rows:
+            references.setdefault(row.source_block_uuid, []).append(row.block_uuid)
+            if row.block_uuid in seen:
+                continue
+            if len(blocks) >= MAX_RESOLVED_BLOCKS:
+                truncated = True
+                continue
+            seen.add(row.block_uuid)
+            blocks[row.block_uuid] = _block_dict(row, level)
+            next_frontier.append(row.block_uuid)
+        if not next_frontier:
+            break
+        frontier = next_frontier
+    else:
+        # Stopped by the depth limit: say whether the last level has references of its own
+        truncated = truncated or db.session.query(
+            select(BlockReference.id).where(BlockReference.source_block_uuid.in_(frontier)).exists()
+        ).scalar()
+    
+    # ((uuid)) in content without a stored reference points at a block that does not exist
+    missing = sorted({
+        target for block in blocks.values() for target in extract_block_refs(block['content'])
+    } - set(blocks) - {target for targets in references.values() for target in targets})
+    missing += [block_uuid for block_uuid in roots if block_uuid not in blocks] if isinstance(roots, list) else []
+    
+    for targets in references.values():
+        targets.sort()
+    sources = sorted(references) if not isinstance(roots, list) else roots
+    result = {
+        'blocks': sorted(blocks.values(), key=lambda block: (block['depth'], block['block_uuid'])),
+        'references': references,
+        'missing': missing,
+        'cycles': _find_cycles(sources, references),
+        'truncated': bool(truncated)
+    }
+    dependencies = {block_uuid: block['updated_at'] for block_uuid, block in blocks.items()}
+    dependencies.update((block_uuid, None) for block_uuid in missing)
+    return result, dependencies
+
+class TransclusionCache:
+    def __init__(self, max_size=MAX_CACHED_RESOLUTIONS):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.entries = OrderedDict()
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+transclusion_cache = TransclusionCache()
+
+def _unchanged(dependencies):
+    if not dependencies:
+        return True
+    current = dict(db.session.query(Block.block_uuid, Block.updated_at).filter(Block.block_uuid.in_(list(dependencies))))
+    return all(current.get(block_uuid) == updated_at for block_uuid, updated_at in dependencies.items())
+
+def resolve_transclusions(page_id=None, block_uuids=None, depth=DEFAULT_REF_DEPTH):
+    depth = max(1, min(depth, MAX_REF_DEPTH))
+    if page_id is not None:
+        key = ('page', page_id, page_version(page_id), depth)
+        roots = select(Block.block_uuid).where(Block.page_id == page_id)
+    else:
+        roots = list(dict.fromkeys(block_uuids))
+        key = ('blocks', tuple(roots), depth)
+    
+    entry = transclusion_cache.get(key)
+    if entry is not None and _unchanged(entry[1]):
+        return entry[0]
+    result, dependencies = _resolve(roots, depth)
+    transclusion_cache.put(key, (result, dependencies))
+    return result
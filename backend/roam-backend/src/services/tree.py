@@ -0,0 +1,71 @@
+from sqlalchemy import select, func, literal
+from sqlalchemy.orm import aliased
+from src.models.models import Block
+from src.extensions import db
+
+# Hard stop for the recursive walk, so a parent cycle cannot recurse forever
+MAX_TREE_DEPTH = 1000
+
+def serialize_node(row, child_count):
+    return {
+        'id': row.id,
+        'block_uuid': row.block_uuid,
+        'content': row.content,
+        'page_id': row.page_id,
+        'parent_block_uuid': row.parent_block_uuid,
+        'order': row.order,
+        'created_at': row.created_at,
+        'updated_at': row.updated_at,
+        'child_count': child_count,
+        'children': []
+    }
+
+def fetch_tree(page_id=None, root_uuid=None, max_depth=None, collapsed=()):
+    # One recursive CTE walks idx_block_hierarchy from the page roots (or a single block) down.
+    # Children of collapsed blocks and of blocks at max_depth are not loaded, only counted.
+    # max_depth=0 loads the roots alone
+    depth_limit = MAX_TREE_DEPTH if max_depth is None else min(max_depth, MAX_TREE_DEPTH)
+    collapsed = list(collapsed)
+    
+    anchor = select(Block.block_uuid, Block.page_id, literal(0).label('depth'))
+    if root_uuid is not None:
+        anchor = anchor.where(Block.block_uuid == root_uuid)
+    else:
+        anchor = anchor.where(Block.page_id == page_id, Block.parent_block_uuid.is_(None))
+    tree = anchor.cte('tree', recursive=True)
+    
+    child = aliased(Block)
+    step = select(child.block_uuid, child.page_id, (tree.c.depth + 1).label('depth')).join(
+        tree, (child.page_id == tree.c.page_id) & (child.parent_block_uuid == tree.c.block_uuid)
+    ).where(tree.c.depth < depth_limit)
+    if collapsed:
+        step = step.where(tree.c.block_uuid.notin_(collapsed))
+    tree = tree.union_all(step)
+    
+    counts = select(
+        Block.parent_block_uuid.label('parent_uuid'),
+        func.count().label('child_count')
+    ).where(Block.parent_block_uuid.in_(select(tree.c.block_uuid))).group_by(Block.parent_block_uuid).subquery()
+    
+    rows = db.session.query(
+        Block.id, Block.block_uuid, Block.content, Block.page_id, Block.parent_block_uuid,
+        Block.order, Block.created_at, Block.updated_at,
+        tree.c.depth, func.coalesce(counts.c.child_count, 0).label('child_count')
+    ).join(
+        tree, tree.c.block_uuid == Block.block_uuid
+    ).outerjoin(
+        counts, counts.c.parent_uuid == Block.block_uuid
+    ).order_by(tree.c.depth, Block.order, Block.id).all()
+    
+    # Rows arrive level by level in sibling order, so appending keeps every children list ordered
+    nodes = {}
+    roots = []
+    for row in rows:
+        node = serialize_node(row, row.child_count)
+        nodes[row.block_uuid] = node
+        parent = nodes.get(row.parent_block_uuid) if row.depth > 0 else None
+        if parent is not None:
+            parent['children'].append(node)
+        else:
+            roots.append(node)
+    return roots
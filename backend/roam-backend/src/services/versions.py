@@ -0,0 +1,54 @@
+from sqlalchemy import select, update, func
+from src.models.models import Page, PageVersion, Counter, BlockMention
+from src.extensions import db, dialect_insert
+
+# Per-page version counters. Writes bump every page whose own blocks, title, backlinks or
+# links they change, in the same transaction; page reads tag their responses with the counter.
+# Named counters version things that are not pages, such as the set of page titles.
+
+def _increment(model, key, keys):
+    # +1 on model.version for each key, creating rows on first write; keys sorted so concurrent
+    # writers take the row locks in the same order
+    keys = sorted({value for value in keys if value is not None})
+    if not keys:
+        return
+    key_column = getattr(model, key)
+    rows = [{key: value, 'version': 1} for value in keys]
+    
+    statement = dialect_insert(model)
+    if statement is not None:
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={'version': model.version + 1}
+        ), rows)
+        return
+    
+    existing = {value for (value,) in db.session.query(key_column).filter(key_column.in_(keys))}
+    if existing:
+        db.session.execute(update(model).where(key_column.in_(list(existing))).values(version=model.version + 1))
+    missing = [row for row in rows if row[key] not in existing]
+    if missing:
+        db.session.bulk_insert_mappings(model, missing)
+
+def bump_pages(page_ids):
+    _increment(PageVersion, 'page_id', page_ids)
+
+def bump_counter(name):
+    _increment(Counter, 'name', [name])
+
+def counter_value(name):
+    return db.session.query(Counter.version).filter(Counter.name == name).scalar() or 0
+
+def bump_mentioned_by(page_id):
+    # Pages whose linked references show blocks or the title of page_id
+    bump_pages([page_id] + [target_id for (target_id,) in db.session.query(BlockMention.target_page_id).filter(
+        BlockMention.source_page_id == page_id
+    ).distinct()])
+
+def page_version(page_id):
+    return db.session.query(PageVersion.version).filter(PageVersion.page_id == page_id).scalar() or 0
+
+def titles_version():
+    # Changes whenever a title does; the latest update is one read of idx_page_updated_at
+    latest = db.session.execute(select(func.max(Page.updated_at))).scalar()
+    return latest.isoformat() if latest is not None else ''
@@ -0,0 +1,162 @@
+import mmap
+import os
+import struct
+import numpy as np
+from src.services.audio_decode import open_blocks
+from src.services.jobs import register_job, enqueue, latest_job, PermanentJobError, ACTIVE_STATUSES
+
+# Waveform peaks for recordings, precomputed once per file into a sidecar so players can draw
+# any stretch of a long recording at any zoom without touching the audio. The PCM is streamed
+# in blocks (see audio_decode). The finest level holds the min and max of every BASE_PEAK_MS of
+# audio as int8; each coarser level folds PEAK_FACTOR peaks of the one below into one.
+#
+# Sidecar layout (little-endian): a header of magic, version, level count, factor, sample rate,
+# samples per finest peak and total frames; then (offset, peak count) per level, finest first;
+# then each level's interleaved min/max bytes. Reads mmap the file and slice it.
+BASE_PEAK_MS = 10
+PEAK_FACTOR = 4
+MIN_TOP_PEAKS = 1024
+MAX_LEVELS = 12
+DEFAULT_PEAK_POINTS = 1000
+MAX_PEAK_POINTS = 20000
+DECODE_SAMPLE_RATE = 16000
+HEADER = struct.Struct('<4sHHHHIIQ')
+LEVEL = struct.Struct('<QQ')
+MAGIC = b'PEAK'
+VERSION = 1
+
+def peaks_path(file_path):
+    folder, name = os.path.split(file_path)
+    return os.path.join(folder, 'peaks', name + '.peaks')
+
+def _base_peaks(blocks, samples_per_peak):
+    # Streaming min/max over fixed windows; the tail of each block carries over to the next
+    lows, highs = [], []
+    carry_low = np.zeros(0, dtype=np.float32)
+    carry_high = np.zeros(0, dtype=np.float32)
+    frames = 0
+    for block in blocks:
+        frames += block.shape[0]
+        # Channels are folded column by column; min(axis=1) over a handful of channels is far slower
+        block_low = block_high = block[:, 0]
+        for channel in range(1, block.shape[1]):
+            block_low = np.minimum(block_low, block[:, channel])
+            block_high = np.maximum(block_high, block[:, channel])
+        low = np.concatenate([carry_low, block_low])
+        high = np.concatenate([carry_high, block_high])
+        whole = low.size - low.size % samples_per_peak
+        if whole:
+            lows.append(low[:whole].reshape(-1, samples_per_peak).min(axis=1))
+            highs.append(high[:whole].reshape(-1, samples_per_peak).max(axis=1))
+        carry_low, carry_high = low[whole:], high[whole:]
+    if carry_low.size:
+        lows.append(carry_low.min(keepdims=True))
+        highs.append(carry_high.max(keepdims=True))
+    if not lows:
+        return np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int8), frames
+    to_int8 = lambda values: np.clip(np.round(np.concatenate(values) * 127), -128, 127).astype(np.int8)
+    return to_int8(lows), to_int8(highs), frames
+
+def _pyramid(lows, highs):
+    levels = [(lows, highs)]
+    while levels[-1][0].size > MIN_TOP_PEAKS and len(levels) < MAX_LEVELS:
+        low, high = levels[-1]
+        pad = -low.size % PEAK_FACTOR
+        # Padding repeats the edge value so it never widens the last peak
+        low = np.concatenate([low, np.repeat(low[-1:], pad)]).reshape(-1, PEAK_FACTOR).min(axis=1)
+        high = np.concatenate([high, np.repeat(high[-1:], pad)]).reshape(-1, PEAK_FACTOR).max(axis=1)
+        levels.append((low, high))
+    return levels
+
+def compute_peaks(audio_path, output_path, decoder=None):
+    # Runs in a worker process. Returns False when no decoder can read the file.
+    decoded = open_blocks(audio_path, decoder, DECODE_SAMPLE_RATE)
+    if decoded is None:
+        return False
+    sample_rate, blocks = decoded
+    samples_per_peak = max(1, round(sample_rate * BASE_PEAK_MS / 1000))
+    lows, highs, frames = _base_peaks(blocks, samples_per_peak)
+    levels = _pyramid(lows, highs)
+    
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temporary = f'{output_path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(levels), PEAK_FACTOR, 0, sample_rate, samples_per_peak, frames))
+        offset = HEADER.size + LEVEL.size * len(levels)
+        for low, _ in levels:
+            file.write(LEVEL.pack(offset, low.size))
+            offset += 2 * low.size
+        for low, high in levels:
+            file.write(np.column_stack([low, high]).tobytes())
+    os.replace(temporary, output_path)
+    # The recording may have been deleted while this ran
+    if not os.path.exists(audio_path):
+        os.remove(output_path)
+        return False
+    return True
+
+class Peaks:
+    # A read-only view of a sidecar; zoom 0 is the coarsest level
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, factor, _, self.sample_rate, self.samples_per_peak, self.frames = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a peaks file')
+        self.factor = factor
+        self.levels = [LEVEL.unpack_from(self.map, HEADER.size + LEVEL.size * i) for i in range(count)][::-1]
+    
+    def close(self):
+        self.map.close()
+    
+    @property
+    def zoom_levels(self):
+        return len(self.levels)
+    
+    @property
+    def duration_ms(self):
+        return self.frames * 1000 / self.sample_rate if self.sample_rate else 0
+    
+    def ms_per_peak(self, zoom):
+        return self.samples_per_peak * self.factor ** (self.zoom_levels - 1 - zoom) * 1000 / self.sample_rate
+    
+    def zoom_for(self, start_ms, end_ms, points):
+        # The most detailed level that covers the span in at most points peaks
+        for zoom in range(self.zoom_levels - 1, 0, -1):
+            if (end_ms - start_ms) / self.ms_per_peak(zoom) <= points:
+                return zoom
+        return 0
+    
+    def slice(self, zoom, start_ms, end_ms):
+        # (index of the first peak, interleaved min/max bytes) for the peaks overlapping the span
+        offset, count = self.levels[zoom]
+        width = self.ms_per_peak(zoom)
+        first = min(count, max(0, int(start_ms // width)))
+        last = min(count, max(first, int(-(-end_ms // width))))
+        return first, self.map[offset + 2 * first:offset + 2 * last]
+
+def _run_peaks(payload, config):
+    if not compute_peaks(payload['file_path'], peaks_path(payload['file_path']), config['AUDIO_DECODER']):
+        raise PermanentJobError('No decoder could read this recording')
+    return {}
+
+register_job('peaks', _run_peaks, config=('AUDIO_DECODER',))
+
+def schedule_peaks(file_path, recording_id=None):
+    # Queue the sidecar for a finished recording file; the caller commits
+    enqueue('peaks', {'file_path': file_path}, key=f'peaks:{file_path}', recording_id=recording_id)
+
+def peaks_status(file_path):
+    # 'ready', 'computing', 'failed' or None when nothing was ever scheduled
+    job = latest_job(f'peaks:{file_path}')
+    if job is not None and job.status in ACTIVE_STATUSES:
+        return 'computing'
+    if job is not None and job.status == 'failed':
+        return 'failed'
+    return 'ready' if os.path.exists(peaks_path(file_path)) else None
+
+def remove_peaks(file_path):
+    try:
+        os.remove(peaks_path(file_path))
+    except FileNotFoundError:
+        pass
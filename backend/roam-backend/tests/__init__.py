@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# Every run gets its own SQLite database and audio store; set before the app is imported
+TEST_FOLDER = tempfile.mkdtemp(prefix='roam-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEST_FOLDER, 'test.db')
+os.environ['AUDIO_FOLDER'] = os.path.join(TEST_FOLDER, 'audio')
+
+JOB_TIMEOUT_SECONDS = 30
+
+class AppTestCase(unittest.TestCase):
+    # A clean schema, audio store and set of in-process caches for every test
+    def setUp(self):
+        from src.main import app
+        from src.extensions import db, create_missing_indexes
+        from src.services import layout, link_graph
+        from src.services.audio_storage import AUDIO_FOLDER
+        from src.services.http_cache import response_cache
+        from src.services.search import inverted_index
+        from src.services.titles import title_resolver
+        from src.services.transclusion import transclusion_cache
+        
+        self.app = app
+        self.db = db
+        app.config['AUDIO_DECODER'] = None
+        app.config['AUDIO_TRANSCODE'] = None
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            create_missing_indexes()
+        shutil.rmtree(AUDIO_FOLDER, ignore_errors=True)
+        os.makedirs(AUDIO_FOLDER)
+        
+        with response_cache.lock:
+            response_cache.entries.clear()
+            response_cache.size = 0
+        with transclusion_cache.lock:
+            transclusion_cache.entries.clear()
+        with title_resolver.lock:
+            title_resolver.ids.clear()
+            title_resolver.titles.clear()
+            title_resolver.version = None
+        inverted_index.invalidate()
+        link_graph._graph = None
+        layout._layouts.clear()
+        layout._pending = None
+        
+        self.client = app.test_client()
+        self.context = app.app_context()
+        self.context.push()
+    
+    def tearDown(self):
+        self.wait_for_jobs()
+        self.db.session.remove()
+        self.context.pop()
+    
+    def wait_for_jobs(self):
+        from src.models.models import Job
+        from src.services.jobs import ACTIVE_STATUSES
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        while True:
+            self.db.session.rollback()
+            if not Job.query.filter(Job.status.in_(ACTIVE_STATUSES)).count():
+                return
+            if time.monotonic() > deadline:
+                self.fail('Background jobs did not finish')
+            time.sleep(0.05)
+    
+    def create_page(self, title):
+        response = self.client.post('/api/pages/', json={'title': title})
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json
+    
+    def create_block(self, page_id, content='', **fields):
+        response = self.client.post('/api/blocks/', json={'page_id': page_id, 'content': content, **fields})
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json
@@ -0,0 +1,58 @@
+import unittest
+from tests import AppTestCase
+from src.models.models import BlockClosure
+from src.services.ancestry import rebuild_closure
+
+class AncestryTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Ancestry')['id']
+        self.root = self.create_block(self.page_id, 'root')['block_uuid']
+        self.middle = self.create_block(self.page_id, 'middle', parent_block_uuid=self.root)['block_uuid']
+        self.leaf = self.create_block(self.page_id, 'leaf', parent_block_uuid=self.middle)['block_uuid']
+        self.other = self.create_block(self.page_id, 'other')['block_uuid']
+    
+    def ancestors(self, block_uuid):
+        return [(block['block_uuid'], block['depth']) for block in self.client.get(f'/api/blocks/{block_uuid}/ancestors').json]
+    
+    def descendants(self, block_uuid, **params):
+        response = self.client.get(f'/api/blocks/{block_uuid}/descendants', query_string=params)
+        return [(block['block_uuid'], block['depth']) for block in response.json]
+    
+    def closure(self):
+        self.db.session.expire_all()
+        return {(row.ancestor_uuid, row.descendant_uuid, row.depth) for row in BlockClosure.query}
+    
+    def assert_closure_matches_parents(self):
+        maintained = self.closure()
+        rebuild_closure()
+        self.assertEqual(maintained, self.closure())
+    
+    def test_ancestors_and_descendants_at_any_depth(self):
+        self.assertEqual(self.ancestors(self.leaf), [(self.root, 2), (self.middle, 1)])
+        self.assertEqual(self.descendants(self.root), [(self.middle, 1), (self.leaf, 2)])
+        self.assertEqual(self.descendants(self.root, max_depth=1), [(self.middle, 1)])
+        self.assertEqual(self.ancestors(self.root), [])
+    
+    def test_moves_keep_the_index_in_step_with_the_parents(self):
+        self.client.put(f'/api/blocks/{self.root}/move', json={'parent_block_uuid': self.other})
+        self.assertEqual(self.ancestors(self.leaf), [(self.other, 3), (self.root, 2), (self.middle, 1)])
+        self.client.put(f'/api/blocks/{self.leaf}/outdent')
+        self.client.put(f'/api/blocks/{self.middle}/outdent')
+        self.assertEqual(self.ancestors(self.leaf), [(self.other, 2), (self.root, 1)])
+        self.assert_closure_matches_parents()
+    
+    def test_batches_copies_and_deletes_keep_the_index_in_step(self):
+        response = self.client.post('/api/blocks/batch', json={'operations': [
+            {'op': 'create', 'page_id': self.page_id, 'parent_block_uuid': self.leaf, 'content': 'deep'},
+            {'op': 'update', 'block_uuid': self.middle, 'parent_block_uuid': self.other}
+        ]})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(len(self.descendants(self.other)), 3)
+        self.client.post(f'/api/blocks/{self.other}/copy', json={})
+        self.client.delete(f'/api/blocks/{self.leaf}')
+        self.assertEqual(self.descendants(self.other), [(self.middle, 1)])
+        self.assert_closure_matches_parents()
+
+if __name__ == '__main__':
+    unittest.main()
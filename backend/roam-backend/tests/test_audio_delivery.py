@@ -0,0 +1,55 @@
+import io
+import unittest
+from tests import AppTestCase
+
+AUDIO = bytes(range(256)) * 4
+
+class AudioDeliveryTest(AppTestCase):
+    def upload(self, data=AUDIO, name='take.mp3'):
+        response = self.client.post('/api/audio/recordings', data={'file': (io.BytesIO(data), name), 'page_id': ''},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json
+    
+    def test_ranges_are_answered_with_just_those_bytes(self):
+        url = f"/api/audio/files/{self.upload()['file_name']}"
+        response = self.client.get(url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.get_data(), AUDIO[100:200])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 100-199/{len(AUDIO)}')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.mimetype, 'audio/mpeg')
+        
+        self.assertEqual(self.client.get(url, headers={'Range': 'bytes=-10'}).get_data(), AUDIO[-10:])
+        self.assertEqual(self.client.get(url, headers={'Range': f'bytes={len(AUDIO)}-'}).status_code, 416)
+    
+    def test_stored_files_are_immutable_and_uploads_are_revalidated(self):
+        url = f"/api/audio/files/{self.upload()['file_name']}"
+        response = self.client.get(url)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 60 * 60)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code, 304)
+        
+        recording = self.client.post('/api/audio/recordings/uploads', json={'file_name': 'live.webm'}).json
+        self.client.put(f"/api/audio/recordings/{recording['id']}/chunks/0", data=b'live', headers={'Upload-Offset': '0'})
+        response = self.client.get(f"/api/audio/files/{recording['file_name']}")
+        self.assertEqual(response.get_data(), b'live')
+        self.assertTrue(response.cache_control.no_cache)
+        self.assertFalse(response.cache_control.immutable)
+    
+    def test_the_web_server_can_send_the_bytes(self):
+        file_name = self.upload()['file_name']
+        self.app.config['AUDIO_SENDFILE_MODE'] = 'x-accel-redirect'
+        try:
+            response = self.client.get(f'/api/audio/files/{file_name}')
+        finally:
+            self.app.config['AUDIO_SENDFILE_MODE'] = None
+        self.assertEqual(response.headers['X-Accel-Redirect'], f'/protected-audio/{file_name}')
+        self.assertEqual(response.get_data(), b'')
+    
+    def test_missing_and_escaping_paths_are_not_found(self):
+        self.assertEqual(self.client.get('/api/audio/files/ab/cd/missing.mp3').status_code, 404)
+        self.assertEqual(self.client.get('/api/audio/files/../../main.py').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
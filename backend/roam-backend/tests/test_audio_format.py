@@ -0,0 +1,98 @@
+import io
+import mmap
+import struct
+import unittest
+from tests import AppTestCase
+from src.services.audio_format import (
+    CLUSTER, CLUSTER_TIMECODE, DURATION, EBML_HEADER, INFO, SEGMENT, SIMPLE_BLOCK, TIMECODE_SCALE, TRACKS,
+    UNKNOWN_SIZE_BYTES, _element, clip_pieces
+)
+
+def mapped(payload):
+    data = mmap.mmap(-1, len(payload))
+    data.write(payload)
+    data.seek(0)
+    return data
+
+def webm(clusters, frames, spacing):
+    # Millisecond ticks, one track, frames blocks per cluster spaced spacing ticks apart
+    body = b''
+    for index in range(clusters):
+        blocks = b''.join(_element(SIMPLE_BLOCK, b'\x81' + struct.pack('>h', frame * spacing) + b'\x80' + b'\0' * 16)
+                          for frame in range(frames))
+        body += _element(CLUSTER, _element(CLUSTER_TIMECODE, (index * frames * spacing).to_bytes(4, 'big')) + blocks)
+    info = _element(INFO, _element(TIMECODE_SCALE, (1000000).to_bytes(4, 'big')))
+    return _element(EBML_HEADER, b'') + SEGMENT.to_bytes(4, 'big') + UNKNOWN_SIZE_BYTES + info + _element(TRACKS, b'') + body
+
+def wav(rate, block_align, frames):
+    fmt = struct.pack('<HHIIHH', 1, 1, rate, rate * block_align, block_align, 8 * block_align)
+    samples = b'\0' * (frames * block_align)
+    return b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(samples)) + b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(samples)) + samples
+
+def declared_duration(data, pieces):
+    header = b''.join(data[piece[0]:piece[1]] if isinstance(piece, tuple) else piece for piece in pieces[:2])
+    offset = header.index(DURATION.to_bytes(2, 'big')) + 10
+    return struct.unpack('>d', header[offset:offset + 8])[0]
+
+class WebmClipTest(unittest.TestCase):
+    def test_duration_runs_until_the_block_after_the_clip(self):
+        data = mapped(webm(3, 50, 20))
+        mimetype, pieces, duration = clip_pieces(data, 500, 1500)
+        self.assertEqual(mimetype, 'audio/webm')
+        self.assertEqual(duration, 1020)
+        self.assertEqual(declared_duration(data, pieces), 1020)
+    
+    def test_duration_at_the_end_of_the_data_counts_the_last_block(self):
+        data = mapped(webm(3, 50, 20))
+        _, pieces, duration = clip_pieces(data, 2500, 5000)
+        self.assertEqual(duration, 500)
+        self.assertEqual(declared_duration(data, pieces), 500)
+    
+    def test_windows_past_the_end_are_empty(self):
+        self.assertEqual(clip_pieces(mapped(webm(1, 10, 20)), 5000, 6000), ('audio/webm', [], 0))
+
+class WavClipTest(unittest.TestCase):
+    def test_clips_are_cut_on_frame_boundaries(self):
+        mimetype, pieces, duration = clip_pieces(mapped(wav(8000, 2, 8000)), 250, 500)
+        self.assertEqual((mimetype, duration), ('audio/wav', 250))
+        self.assertEqual(pieces[1][1] - pieces[1][0], 2000 * 2)
+    
+    def test_headers_without_a_frame_size_cannot_be_clipped(self):
+        self.assertIsNone(clip_pieces(mapped(wav(8000, 0, 100)), 0, 10))
+
+class BlockClipTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        page_id = self.create_page('Clips')['id']
+        self.block_uuid = self.create_block(page_id, 'said at two seconds')['block_uuid']
+    
+    def record(self, data, name, at_ms):
+        recording = self.client.post('/api/audio/recordings', data={'file': (io.BytesIO(data), name), 'page_id': ''},
+                                     content_type='multipart/form-data').json
+        self.client.post('/api/audio/timestamps', json={
+            'recording_id': recording['id'], 'block_uuid': self.block_uuid, 'timestamp_in_audio_ms': at_ms
+        })
+        return recording
+    
+    def clip(self, **params):
+        return self.client.get(f'/api/blocks/{self.block_uuid}/audio_clip', query_string=params)
+    
+    def test_the_clip_is_cut_around_the_block(self):
+        self.record(wav(8000, 2, 8000 * 10), 'take.wav', 2000)
+        response = self.clip(before=1000, after=500)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.mimetype, response.headers['X-Clip-Duration-Ms']), ('audio/wav', '1500'))
+        body = response.get_data()
+        self.assertEqual((body[:4], len(body)), (b'RIFF', 44 + 1500 * 8 * 2))
+        self.assertEqual(self.clip(before=1000, after=500, recording_id=999).status_code, 404)
+        self.assertEqual(self.clip(before=0, after=0).status_code, 400)
+    
+    def test_windows_outside_the_recording_and_other_formats(self):
+        recording = self.record(wav(8000, 2, 8000), 'take.wav', 5000)
+        self.assertEqual(self.clip(before=0, after=1000).status_code, 416)
+        self.record(b'not audio', 'take.mp3', 0)
+        self.assertEqual(self.clip().status_code, 415)
+        self.assertEqual(self.clip(recording_id=recording['id'], before=5000).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
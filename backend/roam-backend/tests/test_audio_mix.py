@@ -0,0 +1,56 @@
+import io
+import unittest
+import numpy as np
+from tests import AppTestCase
+from tests.test_waveform import wav_bytes, loud_then_quiet
+from src.services.audio_mix import _shifted
+
+def blocks(total, size):
+    samples = np.arange(total, dtype=np.float32)
+    return [samples[start:start + size] for start in range(0, total, size)]
+
+class ShiftedTest(unittest.TestCase):
+    def test_positive_offset_delays_the_whole_track(self):
+        out = np.concatenate(list(_shifted(iter(blocks(1000, 300)), 250)))
+        self.assertEqual(out.size, 1250)
+        self.assertTrue((out[:250] == 0).all())
+        np.testing.assert_array_equal(out[250:], np.arange(1000, dtype=np.float32))
+    
+    def test_negative_offset_drops_the_start(self):
+        out = np.concatenate(list(_shifted(iter(blocks(1000, 300)), -450)))
+        np.testing.assert_array_equal(out, np.arange(450, 1000, dtype=np.float32))
+    
+    def test_zero_offset_keeps_the_track(self):
+        out = np.concatenate(list(_shifted(iter(blocks(1000, 300)), 0)))
+        np.testing.assert_array_equal(out, np.arange(1000, dtype=np.float32))
+
+class MixEndpointTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/audio/recordings', data={
+            'file': (io.BytesIO(wav_bytes(loud_then_quiet(2))), 'mic.wav'), 'page_id': ''
+        }, content_type='multipart/form-data')
+        self.recording = response.json
+        self.wait_for_jobs()
+    
+    def mix(self, data, **query):
+        url = f"/api/audio/recordings/{self.recording['id']}"
+        response = self.client.put(f'{url}/system_track', data=data, query_string=query)
+        self.assertEqual(response.status_code, 202, response.json)
+        self.wait_for_jobs()
+        return self.client.get(f'{url}/mix').json, self.client.get(url).json
+    
+    def test_the_mix_replaces_the_recording_file(self):
+        mix, recording = self.mix(wav_bytes(loud_then_quiet(1)), file_name='system.wav', offset_ms=1500)
+        self.assertEqual((mix['status'], mix['progress'], mix['system_offset_ms']), ('done', 1, 1500))
+        self.assertEqual((recording['duration_ms'], recording['mime_type']), (2500, 'audio/wav'))
+        self.assertNotEqual(recording['file_path'], self.recording['file_path'])
+    
+    def test_undecodable_tracks_fail_the_mix(self):
+        mix, recording = self.mix(b'not audio', file_name='system.webm')
+        self.assertEqual(mix['status'], 'failed')
+        self.assertTrue(mix['error'])
+        self.assertEqual(recording['file_path'], self.recording['file_path'])
+
+if __name__ == '__main__':
+    unittest.main()
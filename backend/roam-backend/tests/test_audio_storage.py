@@ -0,0 +1,90 @@
+import io
+import os
+import time
+import unittest
+from tests import AppTestCase
+from src.models.models import AudioBlob, AudioRecording
+from src.services.audio_storage import AUDIO_FOLDER, INCOMING_FOLDER, collect_garbage, incoming_path, migrate_storage
+
+class AudioStorageTest(AppTestCase):
+    def upload(self, data, name='take.mp3', page_id=''):
+        response = self.client.post('/api/audio/recordings', data={'file': (io.BytesIO(data), name), 'page_id': page_id},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json
+    
+    def ref_count(self, recording):
+        self.db.session.expire_all()
+        blob = AudioBlob.query.filter_by(file_name=recording['file_name']).first()
+        return blob.ref_count if blob is not None else None
+    
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(b'same bytes', 'a.mp3')
+        second = self.upload(b'same bytes', 'b.mp3')
+        self.assertEqual(first['file_path'], second['file_path'])
+        self.assertRegex(first['file_name'], r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.mp3$')
+        self.assertEqual(self.ref_count(first), 2)
+        self.assertEqual(os.listdir(INCOMING_FOLDER), [])
+    
+    def test_blobs_are_collected_after_the_last_reference_goes(self):
+        first = self.upload(b'shared')
+        second = self.upload(b'shared')
+        self.wait_for_jobs()
+        self.client.delete(f"/api/audio/recordings/{first['id']}")
+        self.assertEqual(self.ref_count(first), 1)
+        collect_garbage(grace_seconds=0)
+        self.assertTrue(os.path.exists(second['file_path']))
+        
+        self.client.delete(f"/api/audio/recordings/{second['id']}")
+        self.assertEqual(self.ref_count(second), 0)
+        self.assertEqual(collect_garbage()['blobs'], 0)
+        stats = collect_garbage(grace_seconds=0)
+        self.assertEqual((stats['blobs'], stats['bytes']), (1, len(b'shared')))
+        self.assertFalse(os.path.exists(second['file_path']))
+        self.assertIsNone(self.ref_count(second))
+    
+    def test_replacing_or_deleting_the_page_releases_the_file(self):
+        page_id = self.create_page('Recorded')['id']
+        recording = self.upload(b'old take', page_id=page_id)
+        kept = self.upload(b'new take')
+        response = self.client.put(f"/api/audio/recordings/{recording['id']}", data={'file': (io.BytesIO(b'new take'), 'c.mp3'), 'page_id': page_id},
+                                   content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json['file_path'], kept['file_path'])
+        self.assertEqual((self.ref_count(recording), self.ref_count(kept)), (0, 2))
+        self.client.delete(f'/api/pages/{page_id}')
+        self.assertEqual(self.ref_count(kept), 1)
+    
+    def test_files_no_row_knows_about_are_collected(self):
+        orphan = os.path.join(AUDIO_FOLDER, 'ab', 'cd', 'abcd' + '0' * 60 + '.mp3')
+        os.makedirs(os.path.dirname(orphan))
+        leftover = incoming_path('crashed.mp3')
+        for path in (orphan, leftover):
+            open(path, 'wb').close()
+        self.assertEqual(collect_garbage(grace_seconds=0)['orphans'], 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(leftover))
+        past = time.time() - 2 * 24 * 60 * 60
+        os.utime(leftover, (past, past))
+        self.assertEqual(collect_garbage(grace_seconds=0)['incoming'], 1)
+        self.assertFalse(os.path.exists(leftover))
+    
+    def test_files_from_before_the_store_are_moved_in(self):
+        legacy = os.path.join(AUDIO_FOLDER, 'legacy.mp3')
+        with open(legacy, 'wb') as file:
+            file.write(b'legacy bytes')
+        recording = AudioRecording(file_name='legacy.mp3', file_path=legacy)
+        duplicate = AudioRecording(file_name='legacy.mp3', file_path=legacy)
+        self.db.session.add_all([recording, duplicate])
+        self.db.session.commit()
+        
+        self.assertEqual(migrate_storage(), {'files': 1, 'duplicates': 0, 'missing': 0})
+        self.assertFalse(os.path.exists(legacy))
+        stored = self.client.get(f'/api/audio/recordings/{recording.id}').json
+        with open(stored['file_path'], 'rb') as file:
+            self.assertEqual(file.read(), b'legacy bytes')
+        self.assertEqual(self.ref_count(stored), 2)
+        self.assertEqual(migrate_storage()['files'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import io
+import os
+import unittest
+from tests import AppTestCase
+
+class ChunkedUploadTest(AppTestCase):
+    def start(self):
+        response = self.client.post('/api/audio/recordings/uploads', json={'file_name': 'take.webm'})
+        self.assertEqual(response.status_code, 201)
+        return response.json['id']
+    
+    def put_chunk(self, recording_id, index, offset, data):
+        return self.client.put(f'/api/audio/recordings/{recording_id}/chunks/{index}', data=data,
+                               headers={'Upload-Offset': str(offset)})
+    
+    def test_chunks_resume_and_retries_are_ignored(self):
+        recording_id = self.start()
+        self.assertEqual(self.put_chunk(recording_id, 0, 0, b'abcd').json['stored'], True)
+        self.assertEqual(self.put_chunk(recording_id, 0, 0, b'abcd').json['stored'], False)
+        self.assertEqual(self.put_chunk(recording_id, 2, 8, b'ijkl').status_code, 409)
+        self.assertEqual(self.put_chunk(recording_id, 1, 4, b'efgh').json['received_bytes'], 8)
+        
+        response = self.client.post(f'/api/audio/recordings/{recording_id}/upload/complete', json={})
+        self.assertTrue(response.json['upload']['complete'])
+        with open(response.json['file_path'], 'rb') as file:
+            self.assertEqual(file.read(), b'abcdefgh')
+        self.assertEqual(self.put_chunk(recording_id, 2, 8, b'ijkl').status_code, 409)
+    
+    def test_replacing_the_file_waits_for_the_upload(self):
+        stored = self.client.post('/api/audio/recordings', data={'file': (io.BytesIO(b'shared'), 'a.webm'), 'page_id': ''},
+                                  content_type='multipart/form-data').json
+        recording_id = self.start()
+        self.put_chunk(recording_id, 0, 0, b'sha')
+        
+        response = self.client.put(f'/api/audio/recordings/{recording_id}', data={
+            'file': (io.BytesIO(b'shared'), 'b.webm'), 'audio_quality': 'high'
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.put_chunk(recording_id, 1, 3, b'red').status_code, 200)
+        with open(stored['file_path'], 'rb') as file:
+            self.assertEqual(file.read(), b'shared')
+    
+    def test_chunks_are_never_written_into_the_store(self):
+        recording_id = self.start()
+        stored = self.client.post('/api/audio/recordings', data={'file': (io.BytesIO(b'shared'), 'a.webm'), 'page_id': ''},
+                                  content_type='multipart/form-data').json
+        from src.models.models import AudioRecording
+        recording = self.db.session.get(AudioRecording, recording_id)
+        recording.file_path = stored['file_path']
+        self.db.session.commit()
+        
+        self.assertEqual(self.put_chunk(recording_id, 0, 0, b'XXXX').status_code, 409)
+        self.assertEqual(self.client.post(f'/api/audio/recordings/{recording_id}/upload/complete', json={}).status_code, 409)
+        with open(stored['file_path'], 'rb') as file:
+            self.assertEqual(file.read(), b'shared')
+        self.assertTrue(os.path.exists(stored['file_path']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from tests import AppTestCase
+
+class BlockBatchTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Batch')['id']
+        self.parent = self.create_block(self.page_id, 'parent')['block_uuid']
+        self.child = self.create_block(self.page_id, 'child', parent_block_uuid=self.parent)['block_uuid']
+        self.other = self.create_block(self.page_id, 'other')['block_uuid']
+    
+    def batch(self, *operations):
+        return self.client.post('/api/blocks/batch', json={'operations': list(operations)})
+    
+    def uuids(self):
+        return {block['block_uuid'] for block in self.client.get(f'/api/pages/{self.page_id}/blocks').json}
+    
+    def test_operations_apply_in_order(self):
+        response = self.batch(
+            {'op': 'create', 'page_id': self.page_id, 'content': 'new', 'after_block_uuid': self.other},
+            {'op': 'update', 'block_uuid': self.child, 'content': 'renamed'},
+            {'op': 'indent', 'block_uuid': self.other}
+        )
+        self.assertEqual(response.status_code, 200, response.json)
+        created, updated, indented = (result['block'] for result in response.json)
+        self.assertIsNone(created['parent_block_uuid'])
+        self.assertEqual(updated['content'], 'renamed')
+        self.assertEqual(indented['parent_block_uuid'], self.parent)
+    
+    def test_a_failing_operation_rolls_back_the_batch(self):
+        response = self.batch(
+            {'op': 'update', 'block_uuid': self.child, 'content': 'lost'},
+            {'op': 'update', 'block_uuid': 'missing', 'content': 'x'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['index'], 1)
+        self.assertEqual(self.client.get(f'/api/blocks/{self.child}').json['content'], 'child')
+    
+    def test_moving_a_block_into_its_own_subtree_fails(self):
+        response = self.batch({'op': 'update', 'block_uuid': self.parent, 'parent_block_uuid': self.child})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['error'], 'Cannot move a block into its own subtree')
+    
+    def test_descendants_of_a_deleted_block_are_gone_for_later_operations(self):
+        response = self.batch(
+            {'op': 'delete', 'block_uuid': self.parent},
+            {'op': 'update', 'block_uuid': self.child, 'parent_block_uuid': self.other}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.json['index'], response.json['error']), (1, 'Block not found'))
+        self.assertEqual(self.uuids(), {self.parent, self.child, self.other})
+    
+    def test_blocks_moved_out_before_the_delete_survive_it(self):
+        response = self.batch(
+            {'op': 'update', 'block_uuid': self.child, 'parent_block_uuid': self.other},
+            {'op': 'delete', 'block_uuid': self.parent}
+        )
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.uuids(), {self.child, self.other})
+    
+    def test_blocks_created_under_a_deleted_block_go_with_it(self):
+        response = self.batch(
+            {'op': 'create', 'page_id': self.page_id, 'block_uuid': '8a1b3f7e-5d2c-4e6f-9a0b-1c2d3e4f5a6b',
+             'parent_block_uuid': self.child, 'content': 'grandchild'},
+            {'op': 'delete', 'block_uuid': self.parent}
+        )
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.uuids(), {self.other})
+
+if __name__ == '__main__':
+    unittest.main()
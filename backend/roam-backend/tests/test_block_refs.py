@@ -0,0 +1,57 @@
+import unittest
+from sqlalchemy import text
+from tests import AppTestCase
+
+class BlockReferenceTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Refs')['id']
+        self.target = self.create_block(self.page_id, 'target')['block_uuid']
+        self.other = self.create_block(self.page_id, 'other')['block_uuid']
+    
+    def references(self):
+        return {(ref['source_block_uuid'], ref['target_block_uuid'], ref['ref_type'])
+                for ref in self.client.get('/api/block_references/').json}
+    
+    def edit(self, block_uuid, content):
+        response = self.client.put(f'/api/blocks/{block_uuid}', json={'content': content})
+        self.assertEqual(response.status_code, 200, response.json)
+    
+    def test_content_refs_follow_the_text(self):
+        source = self.create_block(self.page_id, f'see (({self.target})) and ((missing))')['block_uuid']
+        self.assertEqual(self.references(), {(source, self.target, 'content')})
+        self.edit(source, f'now (({self.other}))')
+        self.assertEqual(self.references(), {(source, self.other, 'content')})
+        self.edit(source, 'nothing')
+        self.assertEqual(self.references(), set())
+    
+    def test_manual_refs_survive_edits(self):
+        source = self.create_block(self.page_id, f'(({self.target}))')['block_uuid']
+        response = self.client.post('/api/block_references/', json={'source_block_uuid': source, 'target_block_uuid': self.other})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['ref_type'], 'explicit')
+        
+        self.edit(source, 'no refs left')
+        self.assertEqual(self.references(), {(source, self.other, 'explicit')})
+        self.edit(source, f'(({self.other}))')
+        self.edit(source, 'gone again')
+        self.assertEqual(self.references(), {(source, self.other, 'explicit')})
+    
+    def test_transclusions_resolve_nested_refs(self):
+        middle = self.create_block(self.page_id, f'middle (({self.target}))')['block_uuid']
+        source = self.create_block(self.page_id, f'top (({middle}))')['block_uuid']
+        resolved = self.client.post('/api/block_references/resolve', json={'block_uuids': [source]}).json
+        self.assertIn(middle, str(resolved))
+        self.assertIn(self.target, str(resolved))
+    
+    def test_existing_tables_gain_the_ref_type_column(self):
+        from src.extensions import create_missing_columns
+        source = self.create_block(self.page_id, 'manual')['block_uuid']
+        self.client.post('/api/block_references/', json={'source_block_uuid': source, 'target_block_uuid': self.target})
+        with self.db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE block_references DROP COLUMN ref_type'))
+        create_missing_columns()
+        self.assertEqual(self.references(), {(source, self.target, 'explicit')})
+
+if __name__ == '__main__':
+    unittest.main()
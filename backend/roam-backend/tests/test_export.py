@@ -0,0 +1,49 @@
+import gzip
+import json
+import unittest
+from tests import AppTestCase
+
+class ExportTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Export')['id']
+        self.first = self.create_block(self.page_id, 'first [[Other]]')['block_uuid']
+        self.child = self.create_block(self.page_id, 'child', parent_block_uuid=self.first)['block_uuid']
+        self.second = self.create_block(self.page_id, f'second (({self.child}))')['block_uuid']
+    
+    def export(self, **params):
+        response = self.client.get('/api/export/', query_string=params)
+        self.assertEqual(response.status_code, 200)
+        return response
+    
+    def test_ndjson_holds_page_trees_then_links_and_references(self):
+        response = self.export()
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(records[0]['type'], 'export')
+        
+        page = next(record for record in records if record['type'] == 'page' and record['id'] == self.page_id)
+        self.assertEqual([(block['block_uuid'], [child['block_uuid'] for child in block['children']]) for block in page['children']],
+                         [(self.first, [self.child]), (self.second, [])])
+        self.assertEqual([record['type'] for record in records].count('page'), 2)
+        self.assertEqual([(record['source_block_uuid'], record['target_block_uuid'], record['ref_type'])
+                          for record in records if record['type'] == 'block_reference'], [(self.second, self.child, 'content')])
+        self.assertEqual(len([record for record in records if record['type'] == 'link']), 1)
+    
+    def test_roam_format_nests_children_by_uid(self):
+        pages = {page['title']: page for page in self.export(format='roam').json}
+        self.assertEqual(set(pages), {'Export', 'Other'})
+        self.assertNotIn('children', pages['Other'])
+        first, second = pages['Export']['children']
+        self.assertEqual((first['uid'], first['string'], first['children'][0]['uid']), (self.first, 'first [[Other]]', self.child))
+        self.assertNotIn('children', second)
+    
+    def test_gzip_and_unknown_formats(self):
+        response = self.export(format='roam', gzip='1')
+        self.assertEqual(response.mimetype, 'application/gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.get_data()))), 2)
+        self.assertIn('graph-export.json.gz', response.headers['Content-Disposition'])
+        self.assertEqual(self.client.get('/api/export/?format=csv').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import time
+import unittest
+from tests import AppTestCase
+
+class GraphLayoutTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_ids = [self.create_page(title)['id'] for title in ('A', 'B', 'C')]
+        self.create_block(self.page_ids[0], '[[B]] and [[C]]')
+        self.create_block(self.page_ids[1], '[[C]]')
+    
+    def wait_for_layout(self):
+        for _ in range(200):
+            response = self.client.get('/api/graph/layout')
+            if response.status_code == 200 and response.json['status'] == 'ready':
+                return response.json
+            time.sleep(0.05)
+        self.fail('Layout was not computed')
+    
+    def test_layout_is_computed_in_the_background(self):
+        layout = self.wait_for_layout()
+        self.assertEqual((layout['pages'], layout['links']), (3, 3))
+        tile = self.client.get(f"/api/graph/layout/tiles/0/0/0?version={layout['version']}").json
+        self.assertEqual(sorted(node['id'] for node in tile['nodes']), self.page_ids)
+        for node in tile['nodes']:
+            self.assertTrue(0 <= node['x'] <= 1 and 0 <= node['y'] <= 1)
+
+class NeighbourhoodTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = {title: self.create_page(title)['id'] for title in 'ABCDE'}
+        self.create_block(self.ids['A'], '[[B]]')
+        self.create_block(self.ids['B'], '[[C]]')
+        self.create_block(self.ids['C'], '[[D]]')
+        self.create_block(self.ids['E'], '[[A]]')
+    
+    def graph(self, **params):
+        response = self.client.get(f"/api/pages/{self.ids['A']}/graph", query_string=params)
+        self.assertEqual(response.status_code, 200, response.json)
+        return response.json
+    
+    def test_direct_neighbours_are_labelled_by_direction(self):
+        graph = self.graph()
+        self.assertEqual({node['title']: (node['type'], node['depth']) for node in graph['nodes']}, {
+            'A': ('current', 0), 'B': ('outgoing', 1), 'E': ('incoming', 1)
+        })
+        self.assertEqual(sorted((link['source'], link['target'], link['type']) for link in graph['links']), sorted([
+            (self.ids['A'], self.ids['B'], 'outgoing'), (self.ids['E'], self.ids['A'], 'incoming')
+        ]))
+        degrees = {node['title']: (node['in_degree'], node['out_degree']) for node in graph['nodes']}
+        self.assertEqual(degrees, {'A': (1, 1), 'B': (1, 1), 'E': (0, 1)})
+    
+    def test_more_hops_reach_further_up_to_the_limit(self):
+        nodes = {node['title']: (node['type'], node['depth']) for node in self.graph(depth=3)['nodes']}
+        self.assertEqual((nodes['C'], nodes['D']), (('indirect', 2), ('indirect', 3)))
+        self.assertEqual(len(self.graph(depth=3, limit=2)['nodes']), 2)
+    
+    def test_new_links_change_the_etag(self):
+        etag = self.client.get(f"/api/pages/{self.ids['A']}/graph").headers['ETag']
+        self.assertEqual(self.client.get(f"/api/pages/{self.ids['A']}/graph", headers={'If-None-Match': etag}).status_code, 304)
+        self.create_block(self.ids['A'], '[[D]]')
+        self.assertEqual(self.client.get(f"/api/pages/{self.ids['A']}/graph", headers={'If-None-Match': etag}).status_code, 200)
+
+class LinkGraphTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = {title: self.create_page(title)['id'] for title in ('Hub', 'A', 'B', 'C', 'Island')}
+        for title in 'ABC':
+            self.create_block(self.ids[title], '[[Hub]]')
+        self.create_block(self.ids['Hub'], '[[A]]')
+    
+    def stats(self):
+        stats = self.client.get('/api/graph/stats').json
+        return stats['pages'], stats['links'], stats['components']
+    
+    def path(self, source, target, **params):
+        return self.client.get('/api/graph/path', query_string={'from': self.ids[source], 'to': self.ids[target], **params})
+    
+    def test_stats_rank_and_page_metrics(self):
+        self.assertEqual(self.stats(), (5, 4, 2))
+        top = self.client.get('/api/graph/rank', query_string={'by': 'in_degree', 'limit': 2}).json
+        self.assertEqual([(page['title'], page['in_degree']) for page in top], [('Hub', 3), ('A', 1)])
+        self.assertEqual(self.client.get('/api/graph/rank').json[0]['title'], 'Hub')
+        self.assertEqual(self.client.get('/api/graph/rank?by=title').status_code, 400)
+        
+        hub = self.client.get(f"/api/graph/pages/{self.ids['Hub']}").json
+        self.assertEqual((hub['in_degree'], hub['out_degree'], hub['component_size']), (3, 1, 4))
+        sizes = [component['size'] for component in self.client.get('/api/graph/components').json]
+        self.assertEqual(sizes, [4, 1])
+    
+    def test_shortest_paths_follow_or_ignore_direction(self):
+        self.assertEqual([page['title'] for page in self.path('C', 'A', directed='1').json['path']], ['C', 'Hub', 'A'])
+        self.assertEqual(self.path('A', 'C', directed='1').status_code, 404)
+        self.assertEqual(self.path('A', 'C').json['length'], 2)
+        self.assertEqual(self.path('A', 'Island').status_code, 404)
+    
+    def test_the_snapshot_follows_link_writes(self):
+        self.assertEqual(self.stats(), (5, 4, 2))
+        self.create_block(self.ids['Island'], '[[A]]')
+        self.assertEqual(self.stats(), (5, 5, 1))
+        self.client.delete(f"/api/pages/{self.ids['C']}")
+        self.assertEqual(self.stats(), (4, 4, 1))
+        self.assertEqual(self.path('Island', 'Hub', directed='1').json['length'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
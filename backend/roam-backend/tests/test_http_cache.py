@@ -0,0 +1,70 @@
+import unittest
+from sqlalchemy import text
+from tests import AppTestCase
+from src.services.http_cache import ResponseCache, response_cache
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted_first(self):
+        cache = ResponseCache()
+        cache.put('a', (b'x' * 4, 'text/plain', []), 10)
+        cache.put('b', (b'x' * 4, 'text/plain', []), 10)
+        cache.get('a')
+        cache.put('c', (b'x' * 4, 'text/plain', []), 10)
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.size, 8)
+        cache.put('d', (b'x' * 11, 'text/plain', []), 10)
+        self.assertNotIn('d', cache.entries)
+
+class ConditionalGetTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Cached')['id']
+        self.block_uuid = self.create_block(self.page_id, 'first')['block_uuid']
+    
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cache_control.no_cache)
+        return response.headers['ETag']
+    
+    def revalidate(self, url, etag):
+        return self.client.get(url, headers={'If-None-Match': etag}).status_code
+    
+    def test_unchanged_reads_are_answered_with_304(self):
+        url = f'/api/pages/{self.page_id}/blocks'
+        etag = self.etag(url)
+        self.assertEqual(self.revalidate(url, etag), 304)
+        self.client.put(f'/api/blocks/{self.block_uuid}', json={'content': 'edited'})
+        self.assertEqual(self.revalidate(url, etag), 200)
+        self.assertEqual(self.client.get(url).json[0]['content'], 'edited')
+    
+    def test_backlinks_change_with_blocks_on_other_pages(self):
+        url = f'/api/pages/{self.page_id}/linked_references'
+        etag = self.etag(url)
+        other = self.create_page('Other')['id']
+        self.assertEqual(self.revalidate(url, etag), 304)
+        block_uuid = self.create_block(other, 'see [[Cached]]')['block_uuid']
+        self.assertEqual(self.revalidate(url, etag), 200)
+        etag = self.etag(url)
+        self.client.put(f'/api/pages/{other}', json={'title': 'Renamed'})
+        self.assertEqual(self.revalidate(url, etag), 200)
+        self.assertEqual(self.client.get(url).json[0]['source_page']['title'], 'Renamed')
+        etag = self.etag(url)
+        self.client.delete(f'/api/blocks/{block_uuid}')
+        self.assertEqual(self.revalidate(url, etag), 200)
+        self.assertEqual(self.client.get(url).json, [])
+    
+    def test_repeated_reads_are_served_from_the_cache(self):
+        url = f'/api/pages/{self.page_id}/tree'
+        first = self.client.get(url)
+        self.assertEqual(len(response_cache.entries), 1)
+        # A write that skips the version bump shows the body comes from the cache
+        with self.db.engine.begin() as connection:
+            connection.execute(text("UPDATE blocks SET content = 'unversioned'"))
+        second = self.client.get(url)
+        self.assertEqual((second.get_data(), second.headers['ETag']), (first.get_data(), first.headers['ETag']))
+        self.client.put(f'/api/blocks/{self.block_uuid}', json={'content': 'edited'})
+        self.assertEqual(self.client.get(url).json[0]['content'], 'edited')
+
+if __name__ == '__main__':
+    unittest.main()
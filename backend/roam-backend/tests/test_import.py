@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+from tests import AppTestCase
+
+ROAM_EXPORT = [
+    {'title': 'Roam Page', 'children': [
+        {'uid': 'roam-parent', 'string': 'parent [[Linked]]', 'children': [
+            {'uid': 'roam-child', 'string': 'child'}
+        ]},
+        {'uid': 'roam-ref', 'string': 'see ((roam-child))'}
+    ]},
+    {'title': 'Linked'}
+]
+
+MARKDOWN = '''---
+tags: notes
+---
+- top [[Linked|alias]]
+    - nested
+- second
+'''
+
+class ImportTest(AppTestCase):
+    def upload(self, *files):
+        return self.client.post('/api/import/', data={'files': [(io.BytesIO(body), name) for name, body in files]},
+                                content_type='multipart/form-data')
+    
+    def page(self, title):
+        page_id = self.client.get('/api/pages/lookup', query_string={'title': title}).json['id']
+        return page_id, self.client.get(f'/api/pages/{page_id}/tree').json
+    
+    def test_roam_exports_keep_uids_links_and_references(self):
+        response = self.upload(('graph.json', json.dumps(ROAM_EXPORT).encode()))
+        self.assertEqual(response.status_code, 201, response.json)
+        self.assertEqual((response.json['pages'], response.json['blocks'], response.json['block_references']), (2, 3, 1))
+        
+        page_id, tree = self.page('Roam Page')
+        self.assertEqual([(node['block_uuid'], [child['block_uuid'] for child in node['children']]) for node in tree],
+                         [('roam-parent', ['roam-child']), ('roam-ref', [])])
+        linked_id, _ = self.page('Linked')
+        self.assertEqual([(link['source_page_id'], link['target_page_id']) for link in self.client.get('/api/links/').json],
+                         [(page_id, linked_id)])
+        descendants = self.client.get('/api/blocks/roam-parent/descendants').json
+        self.assertEqual([block['block_uuid'] for block in descendants], ['roam-child'])
+    
+    def test_reimported_uids_get_fresh_ones_and_refs_follow(self):
+        self.upload(('graph.json', json.dumps(ROAM_EXPORT).encode()))
+        response = self.upload(('graph.json', json.dumps(ROAM_EXPORT).encode()))
+        self.assertEqual(response.status_code, 201, response.json)
+        _, tree = self.page('Roam Page')
+        self.assertEqual(len(tree), 4)
+        copy_child = tree[2]['children'][0]['block_uuid']
+        self.assertNotEqual(copy_child, 'roam-child')
+        self.assertEqual(tree[3]['content'], f'see (({copy_child}))')
+    
+    def test_markdown_files_become_pages_named_after_the_file(self):
+        response = self.upload(('Meeting Notes.md', MARKDOWN.encode()))
+        self.assertEqual(response.status_code, 201, response.json)
+        _, tree = self.page('Meeting Notes')
+        self.assertEqual([(node['content'], [child['content'] for child in node['children']]) for node in tree],
+                         [('top [alias]([[Linked]])', ['nested']), ('second', [])])
+        self.assertEqual(self.client.get('/api/pages/lookup', query_string={'title': 'Linked'}).status_code, 200)
+    
+    def test_unsupported_and_malformed_files_are_rejected(self):
+        self.assertEqual(self.upload(('notes.txt', b'hello')).status_code, 400)
+        self.assertEqual(self.upload(('graph.json', b'{not json')).status_code, 400)
+        self.assertEqual(self.client.get('/api/pages/').json, [])
+
+if __name__ == '__main__':
+    unittest.main()
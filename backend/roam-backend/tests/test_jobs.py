@@ -0,0 +1,92 @@
+import io
+import time
+import unittest
+from datetime import datetime
+from tests import AppTestCase, JOB_TIMEOUT_SECONDS
+from tests.test_waveform import wav_bytes, loud_then_quiet
+from src.models.models import Job
+from src.services.jobs import enqueue, register_job, PermanentJobError
+
+# Run in the spawned workers, which import them from this module
+def echo(payload, config):
+    return {'echo': payload['value'], 'workers': config['JOB_WORKERS']}
+
+def reject(payload, config):
+    raise PermanentJobError('Rejected')
+
+def flaky(payload, config):
+    raise RuntimeError('Try again')
+
+register_job('test_echo', echo, config=('JOB_WORKERS',))
+register_job('test_reject', reject)
+register_job('test_flaky', flaky, max_attempts=2)
+
+class JobQueueTest(AppTestCase):
+    def enqueue(self, kind, payload=None, key=None):
+        job = enqueue(kind, payload or {}, key=key)
+        self.db.session.commit()
+        return job.id
+    
+    def wait_for(self, job_id, *statuses):
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        while True:
+            job = self.client.get(f'/api/jobs/{job_id}').json
+            if job['status'] in statuses:
+                return job
+            if time.monotonic() > deadline:
+                self.fail(f"Job stayed {job['status']}")
+            time.sleep(0.05)
+    
+    def test_jobs_run_in_the_pool_and_store_their_result(self):
+        job = self.wait_for(self.enqueue('test_echo', {'value': 42}), 'done')
+        self.assertEqual(job['result'], {'echo': 42, 'workers': self.app.config['JOB_WORKERS']})
+        self.assertEqual((job['attempts'], job['error']), (1, None))
+        self.assertIsNotNone(job['finished_at'])
+    
+    def test_work_under_a_key_is_queued_once(self):
+        first = self.enqueue('test_echo', {'value': 1}, key='same')
+        self.assertEqual(self.enqueue('test_echo', {'value': 2}, key='same'), first)
+        self.wait_for(first, 'done')
+        self.assertNotEqual(self.enqueue('test_echo', {'value': 3}, key='same'), first)
+    
+    def test_permanent_failures_stop_at_once_and_can_be_retried(self):
+        job_id = self.enqueue('test_reject')
+        job = self.wait_for(job_id, 'failed')
+        self.assertEqual((job['attempts'], job['error']), (1, 'Rejected'))
+        response = self.client.post(f'/api/jobs/{job_id}/retry')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.wait_for(job_id, 'failed')['attempts'], 1)
+        done = self.enqueue('test_echo', {'value': 0})
+        self.wait_for(done, 'done')
+        self.assertEqual(self.client.post(f'/api/jobs/{done}/retry').status_code, 409)
+    
+    def test_other_failures_are_retried_later(self):
+        job_id = self.enqueue('test_flaky')
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        while True:
+            self.db.session.rollback()
+            job = self.db.session.get(Job, job_id)
+            if job.status == 'queued' and job.attempts == 1:
+                break
+            if time.monotonic() > deadline:
+                self.fail('Job was not requeued')
+            time.sleep(0.05)
+        self.assertEqual(job.error, 'Try again')
+        self.assertGreater(job.run_after, datetime.utcnow())
+        # Not worth waiting out the backoff
+        job.status = 'failed'
+        self.db.session.commit()
+    
+    def test_uploads_are_probed_in_the_background(self):
+        response = self.client.post('/api/audio/recordings', data={
+            'file': (io.BytesIO(wav_bytes(loud_then_quiet(3))), 'take.wav'), 'page_id': ''
+        }, content_type='multipart/form-data')
+        recording_id = response.json['id']
+        self.assertIsNone(response.json['duration_ms'])
+        self.wait_for_jobs()
+        self.assertEqual(self.client.get(f'/api/audio/recordings/{recording_id}').json['duration_ms'], 3000)
+        jobs = self.client.get('/api/jobs/', query_string={'recording_id': recording_id}).json
+        self.assertEqual(sorted((job['kind'], job['status']) for job in jobs), [('peaks', 'done'), ('probe', 'done')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from tests import AppTestCase
+
+class LinkedReferencesTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.target = self.create_page('Target')['id']
+        self.first = self.create_page('First')['id']
+        self.second = self.create_page('Second')['id']
+    
+    def linked_references(self, **params):
+        response = self.client.get(f'/api/pages/{self.target}/linked_references', query_string=params)
+        self.assertEqual(response.status_code, 200, response.json)
+        return response
+    
+    def test_mentioning_blocks_are_grouped_by_source_page(self):
+        one = self.create_block(self.first, 'see [[Target]]')['block_uuid']
+        two = self.create_block(self.first, 'and [[Target]] again')['block_uuid']
+        three = self.create_block(self.second, '[[Target]] too')['block_uuid']
+        self.create_block(self.second, 'no mention of target')
+        self.create_block(self.target, 'self [[Target]]')
+        
+        groups = {group['source_page']['title']: {block['block_uuid'] for block in group['blocks']}
+                  for group in self.linked_references().json}
+        self.assertEqual(groups, {'First': {one, two}, 'Second': {three}})
+    
+    def test_edits_move_blocks_in_and_out_of_the_references(self):
+        block_uuid = self.create_block(self.first, 'nothing yet')['block_uuid']
+        self.assertEqual(self.linked_references().json, [])
+        self.client.put(f'/api/blocks/{block_uuid}', json={'content': 'now [[Target]]'})
+        self.assertEqual(len(self.linked_references().json), 1)
+        self.client.delete(f'/api/blocks/{block_uuid}')
+        self.assertEqual(self.linked_references().json, [])
+    
+    def test_references_are_paged_by_block(self):
+        expected = {self.create_block(page_id, f'[[Target]] {index}')['block_uuid']
+                    for page_id in (self.first, self.second) for index in range(3)}
+        seen = []
+        cursor = None
+        while True:
+            response = self.linked_references(limit=2, **({'cursor': cursor} if cursor else {}))
+            seen.extend(block['block_uuid'] for group in response.json for block in group['blocks'])
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+
+class LinkSyncTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = self.create_page('Source')['id']
+    
+    def links(self):
+        return {(link['source_page_id'], link['target_page_id'], link['link_type'])
+                for link in self.client.get('/api/links/').json}
+    
+    def page_id(self, title):
+        return self.client.get('/api/pages/lookup', query_string={'title': title}).json['id']
+    
+    def edit(self, block_uuid, content):
+        response = self.client.put(f'/api/blocks/{block_uuid}', json={'content': content})
+        self.assertEqual(response.status_code, 200, response.json)
+    
+    def link_id(self, source_id, target_id):
+        return next(link['id'] for link in self.client.get('/api/links/').json
+                    if (link['source_page_id'], link['target_page_id']) == (source_id, target_id))
+    
+    def test_mentions_create_missing_pages_and_links(self):
+        self.create_block(self.source, '[[Alpha]] and [[Beta]] and [[Source]]')
+        self.assertEqual(self.links(), {
+            (self.source, self.page_id('Alpha'), 'mention'),
+            (self.source, self.page_id('Beta'), 'mention')
+        })
+    
+    def test_a_link_stays_while_any_block_on_the_page_mentions_the_target(self):
+        first = self.create_block(self.source, '[[Alpha]]')['block_uuid']
+        second = self.create_block(self.source, '[[Alpha]] [[Beta]]')['block_uuid']
+        alpha, beta = self.page_id('Alpha'), self.page_id('Beta')
+        
+        self.edit(first, 'nothing')
+        self.assertEqual(self.links(), {(self.source, alpha, 'mention'), (self.source, beta, 'mention')})
+        self.edit(second, '[[Beta]]')
+        self.assertEqual(self.links(), {(self.source, beta, 'mention')})
+        self.client.delete(f'/api/blocks/{second}')
+        self.assertEqual(self.links(), set())
+    
+    def test_pruning_leaves_other_pages_and_manual_links_alone(self):
+        other = self.create_page('Other')['id']
+        target = self.create_page('Target')['id']
+        self.create_block(other, '[[Target]]')
+        block_uuid = self.create_block(self.source, '[[Target]] [[Manual]]')['block_uuid']
+        manual = self.page_id('Manual')
+        self.client.delete(f"/api/links/{self.link_id(self.source, manual)}")
+        response = self.client.post('/api/links/', json={'source_page_id': self.source, 'target_page_id': manual})
+        self.assertEqual(response.status_code, 201)
+        
+        self.edit(block_uuid, 'nothing')
+        self.assertEqual(self.links(), {(other, target, 'mention'), (self.source, manual, 'explicit')})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import random
+import unittest
+from tests import AppTestCase
+from src.services.ordering import key_between, keys_between, validate_key, rebalance_siblings
+
+class KeyTest(unittest.TestCase):
+    def test_keys_sort_between_their_neighbours(self):
+        keys = [key_between(None, None)]
+        generator = random.Random(7)
+        for _ in range(500):
+            index = generator.randrange(len(keys) + 1)
+            lower = keys[index - 1] if index > 0 else None
+            upper = keys[index] if index < len(keys) else None
+            key = key_between(lower, upper)
+            validate_key(key)
+            keys.insert(index, key)
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(keys), len(set(keys)))
+    
+    def test_repeated_inserts_at_one_spot_stay_short(self):
+        lower, upper = 'a0', 'a1'
+        for _ in range(100):
+            upper = key_between(lower, upper)
+        self.assertLess(len(upper), 30)
+    
+    def test_spread_keys_are_ordered_and_short(self):
+        keys = keys_between(None, None, 1000)
+        self.assertEqual(keys, sorted(keys))
+        self.assertLessEqual(max(len(key) for key in keys), 3)
+    
+    def test_invalid_keys_are_rejected(self):
+        for key in ('', 'a', 'a10', 'a0!', 1):
+            with self.assertRaises(ValueError):
+                validate_key(key)
+        with self.assertRaises(ValueError):
+            key_between('a1', 'a0')
+
+class BlockOrderTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Order')['id']
+        self.blocks = [self.create_block(self.page_id, str(index)) for index in range(3)]
+    
+    def orders(self):
+        return {block['content']: block['order'] for block in self.client.get(f'/api/pages/{self.page_id}/blocks').json}
+    
+    def test_inserting_between_siblings_leaves_them_untouched(self):
+        before = self.orders()
+        self.create_block(self.page_id, 'middle', after_block_uuid=self.blocks[0]['block_uuid'])
+        self.create_block(self.page_id, 'start', before_block_uuid=self.blocks[0]['block_uuid'])
+        after = self.orders()
+        self.assertEqual({content: after[content] for content in before}, before)
+        self.assertEqual(sorted(after, key=after.get), ['start', '0', 'middle', '1', '2'])
+    
+    def test_unknown_neighbours_and_bad_keys_are_rejected(self):
+        response = self.client.post('/api/blocks/', json={'page_id': self.page_id, 'after_block_uuid': 'missing'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/blocks/', json={'page_id': self.page_id, 'order': 'a10'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_rebalancing_keeps_the_order(self):
+        for _ in range(20):
+            self.create_block(self.page_id, 'squeezed', after_block_uuid=self.blocks[0]['block_uuid'])
+        before = [block['block_uuid'] for block in self.client.get(f'/api/pages/{self.page_id}/blocks').json]
+        rebalance_siblings(self.page_id, None)
+        self.db.session.commit()
+        blocks = self.client.get(f'/api/pages/{self.page_id}/blocks').json
+        self.assertEqual([block['block_uuid'] for block in blocks], before)
+        self.assertLessEqual(max(len(block['order']) for block in blocks), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import unittest
+from tests import AppTestCase
+
+class PaginationTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_ids = [self.create_page(f'Page {index}')['id'] for index in range(5)]
+    
+    def test_following_the_cursor_returns_every_row_once(self):
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get('/api/pages/', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})})
+            self.assertLessEqual(len(response.json), 2)
+            seen.extend(page['id'] for page in response.json)
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), self.page_ids)
+        self.assertEqual(len(seen), len(set(seen)))
+    
+    def test_rows_written_between_pages_do_not_shift_the_cursor(self):
+        first = self.client.get('/api/pages/', query_string={'limit': 3})
+        self.create_page('Newest')
+        rest = self.client.get('/api/pages/', query_string={'limit': 3, 'cursor': first.headers['X-Next-Cursor']})
+        self.assertEqual(len(first.json) + len(rest.json), 5)
+    
+    def test_ndjson_streams_every_row(self):
+        response = self.client.get('/api/pages/', query_string={'format': 'ndjson'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), self.page_ids)
+    
+    def test_malformed_cursors_are_rejected(self):
+        self.assertEqual(self.client.get('/api/pages/', query_string={'cursor': 'not-a-cursor'}).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
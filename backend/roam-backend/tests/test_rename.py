@@ -0,0 +1,48 @@
+import unittest
+from tests import AppTestCase
+
+class RenameTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = self.create_page('Old')['id']
+        self.notes = self.create_page('Notes')['id']
+        self.mention = self.create_block(self.notes, 'see [[Old]] and [[Old]], not [[Older]]')['block_uuid']
+        self.create_block(self.old, 'old body')
+    
+    def rename(self, page_id, title, **fields):
+        return self.client.put(f'/api/pages/{page_id}', json={'title': title, **fields})
+    
+    def content(self, block_uuid):
+        return self.client.get(f'/api/blocks/{block_uuid}').json['content']
+    
+    def page_id(self, title):
+        return self.client.get('/api/pages/lookup', query_string={'title': title}).json['id']
+    
+    def test_renames_rewrite_every_reference(self):
+        response = self.rename(self.old, 'New')
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual((response.json['rewritten_blocks'], response.json['merged_page_id']), (1, None))
+        self.assertEqual(self.content(self.mention), 'see [[New]] and [[New]], not [[Older]]')
+        references = self.client.get(f'/api/pages/{self.old}/linked_references').json
+        self.assertEqual([block['block_uuid'] for block in references[0]['blocks']], [self.mention])
+        self.assertEqual(self.client.get('/api/search/', query_string={'q': 'new'}).json[0]['page_id'], self.old)
+    
+    def test_taken_titles_conflict_unless_merged(self):
+        target = self.create_page('Target')['id']
+        self.create_block(target, 'target body')
+        self.create_block(self.notes, '[[Target]]')
+        self.assertEqual(self.rename(self.old, 'Target').status_code, 409)
+        self.assertEqual(self.rename(self.old, 'Bad [[title]]').status_code, 400)
+        
+        response = self.rename(self.old, 'Target', merge=True)
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual((response.json['id'], response.json['merged_page_id']), (target, self.old))
+        self.assertEqual(self.client.get(f'/api/pages/{self.old}').status_code, 404)
+        blocks = [block['content'] for block in self.client.get(f'/api/pages/{target}/tree').json]
+        self.assertEqual(blocks, ['target body', 'old body'])
+        self.assertEqual(self.content(self.mention), 'see [[Target]] and [[Target]], not [[Older]]')
+        links = [(link['source_page_id'], link['target_page_id']) for link in self.client.get('/api/links/').json]
+        self.assertEqual(sorted(links), sorted([(self.notes, target), (self.notes, self.page_id('Older'))]))
+
+if __name__ == '__main__':
+    unittest.main()
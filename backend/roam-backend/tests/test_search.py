@@ -0,0 +1,52 @@
+import unittest
+from tests import AppTestCase
+from src.services.search import make_snippet, plain_text
+
+class SnippetTest(unittest.TestCase):
+    def test_matches_are_marked_and_the_rest_escaped(self):
+        self.assertEqual(make_snippet('Tom & Jerry <3', ['jerry']), 'Tom &amp; <mark>Jerry</mark> &lt;3')
+    
+    def test_long_values_are_cut_around_the_first_match(self):
+        snippet = make_snippet('a' * 200 + ' needle ' + 'b' * 200, ['needle'])
+        self.assertTrue(snippet.startswith('…') and snippet.endswith('…'))
+        self.assertIn('<mark>needle</mark>', snippet)
+    
+    def test_plain_text_drops_tags_and_decodes_entities(self):
+        self.assertEqual(plain_text('<p>fish &amp; <b>chips</b></p>').split(), ['fish', '&', 'chips'])
+
+class SearchTest(AppTestCase):
+    def search(self, query):
+        response = self.client.get('/api/search/', query_string={'q': query})
+        self.assertEqual(response.status_code, 200, response.json)
+        return response.json
+    
+    def test_titles_and_blocks_are_ranked_together(self):
+        page_id = self.create_page('Gardening')['id']
+        self.create_block(page_id, 'Planting tomatoes in spring')
+        results = self.search('gardening')
+        self.assertEqual([(result['type'], result['page_id']) for result in results], [('page', page_id)])
+        self.assertEqual(self.search('tomat')[0]['snippet'], 'Planting <mark>tomat</mark>oes in spring')
+    
+    def test_snippets_of_html_content_are_well_formed(self):
+        page_id = self.create_page('Links')['id']
+        self.create_block(page_id, '<p>Read <a href="https://example.com/term">the term sheet</a> &amp; sign</p>')
+        snippet = self.search('term')[0]['snippet']
+        self.assertEqual(snippet.split(), ['Read', 'the', '<mark>term</mark>', 'sheet', '&amp;', 'sign'])
+    
+    def test_markup_is_not_searchable(self):
+        page_id = self.create_page('Markup')['id']
+        self.create_block(page_id, '<span class="highlight">plain words</span>')
+        self.assertEqual(self.search('highlight'), [])
+        self.assertEqual(len(self.search('plain')), 1)
+    
+    def test_edits_and_deletes_update_the_index(self):
+        page_id = self.create_page('Index')['id']
+        block_uuid = self.create_block(page_id, 'alpha')['block_uuid']
+        self.assertEqual(len(self.search('alpha')), 1)
+        self.client.put(f'/api/blocks/{block_uuid}', json={'content': 'beta'})
+        self.assertEqual(self.search('alpha'), [])
+        self.client.delete(f'/api/blocks/{block_uuid}')
+        self.assertEqual(self.search('beta'), [])
+
+if __name__ == '__main__':
+    unittest.main()
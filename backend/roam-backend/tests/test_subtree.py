@@ -0,0 +1,58 @@
+import unittest
+from tests import AppTestCase
+
+class SubtreeTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = self.create_page('Source')['id']
+        self.destination = self.create_page('Destination')['id']
+        self.root = self.create_block(self.source, 'root')['block_uuid']
+        self.child = self.create_block(self.source, 'child [[Target]]', parent_block_uuid=self.root)['block_uuid']
+        self.grandchild = self.create_block(self.source, 'grandchild', parent_block_uuid=self.child)['block_uuid']
+    
+    def blocks(self, page_id):
+        return {block['block_uuid']: block for block in self.client.get(f'/api/pages/{page_id}/blocks').json}
+    
+    def link_pairs(self):
+        return {(link['source_page_id'], link['target_page_id']) for link in self.client.get('/api/links/').json}
+    
+    def target(self):
+        return self.client.get('/api/pages/lookup', query_string={'title': 'Target'}).json['id']
+    
+    def test_moving_to_another_page_takes_the_subtree_and_its_links(self):
+        response = self.client.put(f'/api/blocks/{self.root}/move', json={'page_id': self.destination})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.blocks(self.source), {})
+        moved = self.blocks(self.destination)
+        self.assertEqual(set(moved), {self.root, self.child, self.grandchild})
+        self.assertEqual(moved[self.grandchild]['parent_block_uuid'], self.child)
+        self.assertEqual(self.link_pairs(), {(self.destination, self.target())})
+    
+    def test_copies_get_new_ids_under_the_same_shape(self):
+        response = self.client.post(f'/api/blocks/{self.root}/copy', json={'page_id': self.destination})
+        self.assertEqual(response.status_code, 201, response.json)
+        copied = {block['content']: block for block in self.blocks(self.destination).values()}
+        self.assertEqual(set(copied), {'root', 'child [[Target]]', 'grandchild'})
+        self.assertTrue(set(block['block_uuid'] for block in copied.values()).isdisjoint({self.root, self.child, self.grandchild}))
+        self.assertEqual(copied['grandchild']['parent_block_uuid'], copied['child [[Target]]']['block_uuid'])
+        self.assertIsNone(copied['root']['parent_block_uuid'])
+        self.assertEqual(len(self.blocks(self.source)), 3)
+        self.assertEqual(self.link_pairs(), {(self.source, self.target()), (self.destination, self.target())})
+    
+    def test_deleting_a_block_deletes_its_subtree_and_prunes_links(self):
+        response = self.client.delete(f'/api/blocks/{self.root}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json['deleted']), {self.root, self.child, self.grandchild})
+        self.assertEqual(self.blocks(self.source), {})
+        self.assertEqual(self.link_pairs(), set())
+    
+    def test_invalid_destinations_are_rejected(self):
+        response = self.client.put(f'/api/blocks/{self.root}/move', json={'page_id': 999})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.put(f'/api/blocks/{self.root}/move', json={'parent_block_uuid': self.grandchild})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['error'], 'Cannot move a block into its own subtree')
+        self.assertEqual(self.client.post(f'/api/blocks/{self.root}/copy', json={'page_id': 999}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
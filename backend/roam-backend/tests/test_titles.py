@@ -0,0 +1,48 @@
+import unittest
+from tests import AppTestCase
+from src.services.titles import TitleResolver
+
+class TitleResolverTest(AppTestCase):
+    def lookup(self, title):
+        response = self.client.get('/api/pages/lookup', query_string={'title': title})
+        return response.json['id'] if response.status_code == 200 else None
+    
+    def suggest(self, text):
+        return [page['title'] for page in self.client.get('/api/pages/autocomplete', query_string={'q': text}).json]
+    
+    def test_lookups_follow_renames_and_deletes(self):
+        page_id = self.create_page('Daily')['id']
+        self.assertEqual(self.lookup('Daily'), page_id)
+        self.client.put(f'/api/pages/{page_id}', json={'title': 'Weekly'})
+        self.assertEqual((self.lookup('Daily'), self.lookup('Weekly')), (None, page_id))
+        self.client.delete(f'/api/pages/{page_id}')
+        self.assertIsNone(self.lookup('Weekly'))
+    
+    def test_links_to_a_deleted_title_make_a_new_page(self):
+        old_id = self.create_page('Topic')['id']
+        self.client.delete(f'/api/pages/{old_id}')
+        source_id = self.create_page('Source')['id']
+        self.create_block(source_id, '[[Topic]]')
+        new_id = self.lookup('Topic')
+        self.assertIsNotNone(new_id)
+        self.assertNotEqual(new_id, source_id)
+        self.assertEqual(self.client.get('/api/links/').json[0]['target_page_id'], new_id)
+    
+    def test_duplicate_titles_are_rejected(self):
+        self.create_page('Unique')
+        self.assertEqual(self.client.post('/api/pages/', json={'title': 'Unique'}).status_code, 409)
+    
+    def test_suggestions_put_prefix_matches_first(self):
+        for title in ('Project plan', 'Old project', 'Projects', 'Unrelated', '100% done'):
+            self.create_page(title)
+        self.assertEqual(self.suggest('proj'), ['Projects', 'Project plan', 'Old project'])
+        self.assertEqual(self.suggest('%'), ['100% done'])
+    
+    def test_the_cache_is_bounded(self):
+        resolver = TitleResolver(max_size=2)
+        resolver.remember([('a', 1), ('b', 2)])
+        resolver.remember([('c', 3)])
+        self.assertEqual((list(resolver.ids), resolver.titles), (['b', 'c'], {2: 'b', 3: 'c'}))
+
+if __name__ == '__main__':
+    unittest.main()
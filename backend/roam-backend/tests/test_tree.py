@@ -0,0 +1,43 @@
+import unittest
+from tests import AppTestCase
+
+class BlockTreeTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page_id = self.create_page('Tree')['id']
+        self.first = self.create_block(self.page_id, 'first')['block_uuid']
+        self.second = self.create_block(self.page_id, 'second')['block_uuid']
+        self.child = self.create_block(self.page_id, 'child', parent_block_uuid=self.first)['block_uuid']
+        self.grandchild = self.create_block(self.page_id, 'grandchild', parent_block_uuid=self.child)['block_uuid']
+        self.sibling = self.create_block(self.page_id, 'sibling', parent_block_uuid=self.first)['block_uuid']
+    
+    def tree(self, **params):
+        response = self.client.get(f'/api/pages/{self.page_id}/tree', query_string=params)
+        self.assertEqual(response.status_code, 200, response.json)
+        return response.json
+    
+    def shape(self, nodes):
+        return [(node['content'], node['child_count'], self.shape(node['children'])) for node in nodes]
+    
+    def test_the_whole_page_nests_in_sibling_order(self):
+        self.assertEqual(self.shape(self.tree()), [
+            ('first', 2, [('child', 1, [('grandchild', 0, [])]), ('sibling', 0, [])]),
+            ('second', 0, [])
+        ])
+    
+    def test_max_depth_counts_the_children_it_does_not_load(self):
+        self.assertEqual(self.shape(self.tree(max_depth=0)), [('first', 2, []), ('second', 0, [])])
+        self.assertEqual(self.shape(self.tree(max_depth=1)), [
+            ('first', 2, [('child', 1, []), ('sibling', 0, [])]),
+            ('second', 0, [])
+        ])
+        self.assertEqual(self.client.get(f'/api/pages/{self.page_id}/tree?max_depth=-1').status_code, 400)
+    
+    def test_collapsed_blocks_are_expanded_one_subtree_at_a_time(self):
+        collapsed = self.tree(collapsed=self.first)[0]
+        self.assertEqual((collapsed['child_count'], collapsed['children']), (2, []))
+        subtree = self.client.get(f'/api/blocks/{self.first}/tree').json
+        self.assertEqual(self.shape([subtree]), self.shape(self.tree())[:1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+import numpy as np
+from tests import AppTestCase
+from src.services.waveform import Peaks, compute_peaks, BASE_PEAK_MS, PEAK_FACTOR
+
+RATE = 8000
+
+def wav_bytes(samples):
+    # 16-bit mono
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes((np.asarray(samples) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+def loud_then_quiet(seconds):
+    # Full scale for the first half, a quarter of it for the second
+    samples = np.where(np.arange(seconds * RATE) % 2, 1.0, -1.0)
+    samples[len(samples) // 2:] *= 0.25
+    return samples
+
+class PeakPyramidTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.audio = os.path.join(self.folder, 'take.wav')
+        self.output = os.path.join(self.folder, 'take.wav.peaks')
+        with open(self.audio, 'wb') as file:
+            file.write(wav_bytes(loud_then_quiet(30)))
+        self.assertTrue(compute_peaks(self.audio, self.output))
+        self.peaks = Peaks(self.output)
+    
+    def tearDown(self):
+        self.peaks.close()
+        shutil.rmtree(self.folder)
+    
+    def test_each_level_folds_the_one_below(self):
+        self.assertEqual(self.peaks.duration_ms, 30000)
+        finest = self.peaks.zoom_levels - 1
+        self.assertEqual(self.peaks.ms_per_peak(finest), BASE_PEAK_MS)
+        self.assertEqual(self.peaks.ms_per_peak(finest - 1), BASE_PEAK_MS * PEAK_FACTOR)
+        _, data = self.peaks.slice(finest, 0, 30000)
+        self.assertEqual(len(data), 2 * 30000 // BASE_PEAK_MS)
+    
+    def test_slices_cover_the_requested_span(self):
+        zoom = self.peaks.zoom_levels - 1
+        first, data = self.peaks.slice(zoom, 1000, 1100)
+        self.assertEqual((first, len(data)), (100, 20))
+        self.assertEqual(np.frombuffer(data, dtype=np.int8).tolist()[:2], [-127, 127])
+        _, data = self.peaks.slice(zoom, 20000, 20010)
+        self.assertEqual(np.frombuffer(data, dtype=np.int8).tolist(), [-32, 32])
+    
+    def test_the_zoom_for_a_span_fits_the_points(self):
+        zoom = self.peaks.zoom_for(0, 30000, 1000)
+        self.assertLessEqual(30000 / self.peaks.ms_per_peak(zoom), 1000)
+        self.assertEqual(self.peaks.zoom_for(0, 1000, 1000), self.peaks.zoom_levels - 1)
+
+class PeaksEndpointTest(AppTestCase):
+    def upload(self, data, name):
+        response = self.client.post('/api/audio/recordings', data={'file': (io.BytesIO(data), name), 'page_id': ''},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json['id']
+    
+    def test_peaks_are_served_once_computed(self):
+        url = f"/api/audio/recordings/{self.upload(wav_bytes(loud_then_quiet(4)), 'take.wav')}/peaks"
+        self.wait_for_jobs()
+        response = self.client.get(url, query_string={'start': 0, 'end': 100})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual((response.json['ms_per_peak'], response.json['duration_ms']), (BASE_PEAK_MS, 4000))
+        self.assertEqual(response.json['peaks'][:2], [-127, 127])
+        self.assertEqual(len(response.json['peaks']), 20)
+        
+        binary = self.client.get(url, query_string={'start': 0, 'end': 100, 'format': 'binary'})
+        self.assertEqual(np.frombuffer(binary.get_data(), dtype=np.int8).tolist(), response.json['peaks'])
+        revalidated = self.client.get(url, query_string={'start': 0, 'end': 100}, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.client.get(url, query_string={'zoom': 99}).status_code, 400)
+    
+    def test_undecodable_recordings_fail(self):
+        recording_id = self.upload(b'not audio', 'take.mp3')
+        self.wait_for_jobs()
+        self.assertEqual(self.client.get(f'/api/audio/recordings/{recording_id}/peaks').status_code, 422)
+
+if __name__ == '__main__':
+    unittest.main()
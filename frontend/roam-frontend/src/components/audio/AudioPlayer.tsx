@@ -16,9 +16,13 @@ interface AudioTimestamp {
     file_name: string;
     file_path: string;
     mime_type: string;
+    duration_ms: number | null;
   };
 }
 
+const WAVEFORM_BARS = 100;
+const PEAKS_RETRY_MS = 2000;
+
 const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
   const [isPlaying, setIsPlaying] = useState<boolean>(false);
   const [currentTime, setCurrentTime] = useState<number>(0);
@@ -27,6 +31,8 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
   const [currentRecording, setCurrentRecording] = useState<AudioTimestamp | null>(null);
   const audioRef = useRef<HTMLAudioElement>(null);
   const waveformRef = useRef<HTMLDivElement>(null);
+  const pendingSeekRef = useRef<number | null>(null);
+  const [peaks, setPeaks] = useState<number[]>([]);
 
   useEffect(() => {
     if (blockUuid) {
@@ -50,17 +56,51 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
 
   useEffect(() => {
     if (currentRecording && audioRef.current) {
-      // Set the audio source
-      audioRef.current.src = `http://localhost:5000/api/audio/files/${currentRecording.recording.file_name}`;
-      
-      // Set initial position to the timestamp
-      audioRef.current.currentTime = currentRecording.timestamp_in_audio_ms / 1000;
+      // Seek once metadata is in: load() resets the position, and with preload="metadata" the
+      // browser then fetches only the byte range around the timestamp
+      pendingSeekRef.current = currentRecording.timestamp_in_audio_ms / 1000;
       
-      // Load the audio
+      // Set the audio source and load it
+      audioRef.current.src = `http://localhost:5000/api/audio/files/${currentRecording.recording.file_name}`;
       audioRef.current.load();
     }
   }, [currentRecording]);
 
+  // Waveform peaks are precomputed on the server; 202 means they are still being computed
+  useEffect(() => {
+    if (!currentRecording) return;
+    let cancelled = false;
+    let retry: NodeJS.Timeout | null = null;
+    setPeaks([]);
+    
+    const fetchPeaks = async () => {
+      try {
+        const response = await axios.get(`http://localhost:5000/api/audio/recordings/${currentRecording.recording_id}/peaks`, {
+          params: { points: WAVEFORM_BARS }
+        });
+        if (cancelled) return;
+        if (response.status === 202) {
+          retry = setTimeout(fetchPeaks, PEAKS_RETRY_MS);
+          return;
+        }
+        // Interleaved min/max pairs in -128..127; each bar shows the louder side of its pair
+        const levels: number[] = [];
+        for (let i = 0; i + 1 < response.data.peaks.length; i += 2) {
+          levels.push(Math.max(-response.data.peaks[i], response.data.peaks[i + 1]) / 128);
+        }
+        setPeaks(levels);
+      } catch (error) {
+        console.warn('Waveform peaks unavailable:', error);
+      }
+    };
+    
+    fetchPeaks();
+    return () => {
+      cancelled = true;
+      if (retry) clearTimeout(retry);
+    };
+  }, [currentRecording]);
+
   const handlePlayPause = () => {
     if (audioRef.current) {
       if (isPlaying) {
@@ -80,7 +120,16 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
 
   const handleLoadedMetadata = () => {
     if (audioRef.current) {
-      setDuration(audioRef.current.duration);
+      // Recorded WebM carries no duration header; the server measured it when the upload finished
+      const mediaDuration = audioRef.current.duration;
+      const recordedMs = currentRecording?.recording.duration_ms;
+      setDuration(Number.isFinite(mediaDuration) ? mediaDuration : (recordedMs ? recordedMs / 1000 : 0));
+      
+      if (pendingSeekRef.current !== null) {
+        audioRef.current.currentTime = pendingSeekRef.current;
+        setCurrentTime(pendingSeekRef.current);
+        pendingSeekRef.current = null;
+      }
     }
   };
 
@@ -101,15 +150,13 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
     return `${mins.toString().padStart(2, '0')}:${secs.toString().padStart(2, '0')}`;
   };
 
-  // Generate a simple waveform visualization
+  // Draw the recording's peaks, with a flat line until they arrive
   const generateWaveform = () => {
-    const segments = 50;
+    const segments = peaks.length || 50;
     const bars = [];
     
     for (let i = 0; i < segments; i++) {
-      // Generate random heights for the waveform bars
-      // In a real app, this would use actual audio data
-      const height = 20 + Math.random() * 30;
+      const height = peaks.length ? 4 + peaks[i] * 96 : 4;
       const isActive = (i / segments) * duration <= currentTime;
       
       bars.push(
@@ -132,6 +179,7 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
     <div className="audio-player">
       <audio 
         ref={audioRef}
+        preload="metadata"
         onTimeUpdate={handleTimeUpdate}
         onLoadedMetadata={handleLoadedMetadata}
         onEnded={() => setIsPlaying(false)}
@@ -161,7 +209,7 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ blockUuid }) => {
       </div>
       
       <div className="recording-info">
-        Recording: {currentRecording.recording.file_name.split('_')[1]}
+        Recording #{currentRecording.recording.id}
       </div>
     </div>
   );
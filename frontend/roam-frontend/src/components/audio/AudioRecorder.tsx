@@ -8,6 +8,9 @@ interface AudioRecorderProps {
   onRecordingStop?: () => void;
 }
 
+const API_BASE = 'http://localhost:5000/api/audio/recordings';
+const RETRY_DELAY_MS = 2000;
+
 const AudioRecorder: React.FC<AudioRecorderProps> = ({ 
   pageId, 
   blockUuid, 
@@ -22,14 +25,20 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
   const [availableMics, setAvailableMics] = useState<MediaDeviceInfo[]>([]);
   const [selectedMic, setSelectedMic] = useState<string>('');
   const [audioQuality, setAudioQuality] = useState<string>('medium');
-  const [recordingId, setRecordingId] = useState<number | null>(null);
   
   const micStreamRef = useRef<MediaStream | null>(null);
   const systemStreamRef = useRef<MediaStream | null>(null);
   const micRecorderRef = useRef<MediaRecorder | null>(null);
   const systemRecorderRef = useRef<MediaRecorder | null>(null);
-  const micChunksRef = useRef<Blob[]>([]);
+  // Mic chunks waiting to be uploaded; each is dropped once the server has it
+  const pendingChunksRef = useRef<Blob[]>([]);
+  const nextChunkRef = useRef<number>(0);
+  const uploadOffsetRef = useRef<number>(0);
+  const uploadingRef = useRef<Promise<void> | null>(null);
+  const recordingIdRef = useRef<number | null>(null);
   const systemChunksRef = useRef<Blob[]>([]);
+  // How much later the system recorder started than the mic one, for aligning the two when mixing
+  const systemOffsetRef = useRef<number>(0);
   const timerRef = useRef<NodeJS.Timeout | null>(null);
   const startTimeRef = useRef<Date | null>(null);
   const analyserRef = useRef<AnalyserNode | null>(null);
@@ -106,6 +115,51 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
     };
   }, [isRecording, isPaused]);
   
+  // Re-read the server's position after a failure, so a chunk whose response was lost is not sent twice
+  const syncUploadState = async (id: number) => {
+    const response = await axios.get(`${API_BASE}/${id}/upload`);
+    while (nextChunkRef.current < response.data.next_chunk && pendingChunksRef.current.length > 0) {
+      uploadOffsetRef.current += pendingChunksRef.current.shift()!.size;
+      nextChunkRef.current += 1;
+    }
+    nextChunkRef.current = response.data.next_chunk;
+    uploadOffsetRef.current = response.data.received_bytes;
+  };
+  
+  // Send queued chunks one at a time, in order, retrying until each is stored
+  const uploadPendingChunks = () => {
+    if (uploadingRef.current) return uploadingRef.current;
+    
+    uploadingRef.current = (async () => {
+      const id = recordingIdRef.current;
+      while (id !== null && pendingChunksRef.current.length > 0) {
+        const chunk = pendingChunksRef.current[0];
+        try {
+          await axios.put(`${API_BASE}/${id}/chunks/${nextChunkRef.current}`, chunk, {
+            headers: {
+              'Content-Type': 'application/octet-stream',
+              'Upload-Offset': uploadOffsetRef.current.toString()
+            }
+          });
+          pendingChunksRef.current.shift();
+          nextChunkRef.current += 1;
+          uploadOffsetRef.current += chunk.size;
+        } catch (error) {
+          console.warn('Chunk upload failed, retrying:', error);
+          await new Promise(resolve => setTimeout(resolve, RETRY_DELAY_MS));
+          try {
+            await syncUploadState(id);
+          } catch (syncError) {
+            console.warn('Could not read upload state:', syncError);
+          }
+        }
+      }
+    })().finally(() => {
+      uploadingRef.current = null;
+    });
+    return uploadingRef.current;
+  };
+  
   const startRecording = async () => {
     try {
       // Initialize audio context
@@ -149,6 +203,21 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
         // Continue with just microphone recording
       }
       
+      // Create the recording first; its audio is streamed to it chunk by chunk while recording
+      const response = await axios.post(`${API_BASE}/uploads`, {
+        file_name: `recording_${new Date().toISOString()}.webm`,
+        mime_type: 'audio/webm;codecs=opus',
+        page_id: pageId,
+        block_id_context_start: blockUuid,
+        mic_device_name: availableMics.find(m => m.deviceId === selectedMic)?.label || 'Default Microphone',
+        system_audio_device_name: systemStreamRef.current ? 'System Audio' : 'None',
+        audio_quality: audioQuality
+      });
+      recordingIdRef.current = response.data.id;
+      nextChunkRef.current = 0;
+      uploadOffsetRef.current = 0;
+      pendingChunksRef.current = [];
+      
       // Set up MediaRecorder for microphone
       const micOptions = { mimeType: 'audio/webm;codecs=opus' };
       const micRecorder = new MediaRecorder(micStream, micOptions);
@@ -156,7 +225,8 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
       
       micRecorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
-          micChunksRef.current.push(event.data);
+          pendingChunksRef.current.push(event.data);
+          uploadPendingChunks();
         }
       };
       
@@ -173,29 +243,15 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
         
         systemRecorder.start(1000); // Collect data every second
       }
+      const systemStartedAt = performance.now();
       
       // Start recording
       micRecorder.start(1000); // Collect data every second
+      systemOffsetRef.current = Math.round(systemStartedAt - performance.now());
       setIsRecording(true);
       setIsPaused(false);
       startTimeRef.current = new Date();
       
-      // Create recording entry in database
-      const formData = new FormData();
-      formData.append('file_name', `placeholder_${new Date().toISOString()}.webm`);
-      if (pageId) formData.append('page_id', pageId.toString());
-      if (blockUuid) formData.append('block_id_context_start', blockUuid);
-      formData.append('mic_device_name', availableMics.find(m => m.deviceId === selectedMic)?.label || 'Default Microphone');
-      formData.append('system_audio_device_name', systemStreamRef.current ? 'System Audio' : 'None');
-      formData.append('audio_quality', audioQuality);
-      
-      // Create an empty file for now - we'll update it when recording stops
-      const emptyBlob = new Blob([], { type: 'audio/webm;codecs=opus' });
-      formData.append('file', emptyBlob, `placeholder_${new Date().toISOString()}.webm`);
-      
-      const response = await axios.post('http://localhost:5000/api/audio/recordings', formData);
-      setRecordingId(response.data.id);
-      
       if (onRecordingStart) {
         onRecordingStart(response.data.id);
       }
@@ -225,13 +281,19 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
     if (!isRecording) return;
     
     try {
-      // Stop recorders
-      if (micRecorderRef.current && micRecorderRef.current.state !== 'inactive') {
-        micRecorderRef.current.stop();
+      // Stop recorders; the mic recorder hands over its last chunk before it reports stopped
+      const micRecorder = micRecorderRef.current;
+      if (micRecorder && micRecorder.state !== 'inactive') {
+        const stopped = new Promise(resolve => micRecorder.addEventListener('stop', resolve, { once: true }));
+        micRecorder.stop();
+        await stopped;
       }
       
-      if (systemRecorderRef.current && systemRecorderRef.current.state !== 'inactive') {
-        systemRecorderRef.current.stop();
+      const systemRecorder = systemRecorderRef.current;
+      if (systemRecorder && systemRecorder.state !== 'inactive') {
+        const stopped = new Promise(resolve => systemRecorder.addEventListener('stop', resolve, { once: true }));
+        systemRecorder.stop();
+        await stopped;
       }
       
       // Stop all tracks
@@ -243,35 +305,34 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
         systemStreamRef.current.getTracks().forEach(track => track.stop());
       }
       
-      // Create final audio blob
-      const micBlob = new Blob(micChunksRef.current, { type: 'audio/webm;codecs=opus' });
-      
-      // In a real app, we would mix the mic and system audio here
-      // For now, we'll just use the mic audio
-      
-      // Upload the final audio file
-      if (recordingId) {
-        const formData = new FormData();
-        formData.append('file', micBlob, `recording_${new Date().toISOString()}.webm`);
-        
-        // Update the recording with the final file
-        await axios.put(`http://localhost:5000/api/audio/recordings/${recordingId}`, formData);
-        
-        // Update recording metadata
+      // Finish uploading, then let the server settle the file's size and duration
+      const id = recordingIdRef.current;
+      if (id !== null) {
+        await uploadPendingChunks();
         const endTime = new Date();
         const durationMs = startTimeRef.current ? endTime.getTime() - startTimeRef.current.getTime() : 0;
         
-        await axios.put(`http://localhost:5000/api/audio/recordings/${recordingId}`, {
+        await axios.post(`${API_BASE}/${id}/upload/complete`, {
           end_timestamp: endTime.toISOString(),
           duration_ms: durationMs
         });
+        
+        // The server mixes system audio into the mic track in the background
+        if (systemChunksRef.current.length > 0) {
+          const systemTrack = new Blob(systemChunksRef.current, { type: 'audio/webm' });
+          await axios.put(`${API_BASE}/${id}/system_track`, systemTrack, {
+            params: { offset_ms: systemOffsetRef.current, file_name: 'system.webm' },
+            headers: { 'Content-Type': 'application/octet-stream' }
+          });
+        }
       }
       
       // Reset state
       setIsRecording(false);
       setIsPaused(false);
       setRecordingTime(0);
-      micChunksRef.current = [];
+      pendingChunksRef.current = [];
+      recordingIdRef.current = null;
       systemChunksRef.current = [];
       startTimeRef.current = null;
       
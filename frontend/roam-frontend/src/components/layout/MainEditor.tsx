@@ -12,7 +12,7 @@ interface Block {
   content: string;
   page_id: number;
   parent_block_uuid: string | null;
-  order: number;
+  order: string;
   created_at: string;
   updated_at: string;
 }
@@ -51,18 +51,19 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
     }
   };
   
-  const createBlock = useCallback(async (parentBlockUuid: string | null, order: number, content: string = '') => {
+  const createBlock = useCallback(async (parentBlockUuid: string | null, afterBlockUuid: string | null, content: string = '') => {
     if (!pageId) {
       console.error("pageId is undefined in createBlock");
       return null;
     }
     
     try {
+      // The server picks an order key between the given sibling and the next one
       const newBlockData = {
         content,
         page_id: pageId,
         parent_block_uuid: parentBlockUuid,
-        order
+        after_block_uuid: afterBlockUuid
       };
       
       const response = await axios.post('http://localhost:5000/api/blocks', newBlockData);
@@ -92,10 +93,11 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
   
   const deleteBlock = async (blockUuid: string) => {
     try {
-      await axios.delete(`http://localhost:5000/api/blocks/${blockUuid}`);
+      const response = await axios.delete(`http://localhost:5000/api/blocks/${blockUuid}`);
       
-      // Remove block from state
-      setBlocks(prevBlocks => prevBlocks.filter(block => block.block_uuid !== blockUuid));
+      // Remove the block and its descendants from state
+      const deleted = new Set<string>(response.data.deleted);
+      setBlocks(prevBlocks => prevBlocks.filter(block => !deleted.has(block.block_uuid)));
     } catch (error) {
       console.error('Error deleting block:', error);
       setError('Failed to delete block. Please try again.');
@@ -106,19 +108,8 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
       
-      // Get all blocks at the same level
-      const siblingBlocks = blocks.filter(b => b.parent_block_uuid === block.parent_block_uuid);
-      
-      // Find the current block's position among siblings
-      const siblingIndex = siblingBlocks.findIndex(b => b.block_uuid === block.block_uuid);
-      
-      // Calculate the order for the new block
-      const newOrder = siblingIndex < siblingBlocks.length - 1 
-        ? (block.order + siblingBlocks[siblingIndex + 1].order) / 2 
-        : block.order + 1;
-      
-      // Create new block
-      const newBlock = await createBlock(block.parent_block_uuid, newOrder);
+      // Create new block directly after the current one
+      const newBlock = await createBlock(block.parent_block_uuid, block.block_uuid);
       
       if (newBlock) {
         // Insert the new block after the current one
@@ -141,12 +132,11 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
         const prevBlock = blocks[index - 1];
         if (prevBlock && prevBlock.parent_block_uuid === block.parent_block_uuid) {
           try {
-            await axios.put(`http://localhost:5000/api/blocks/${block.block_uuid}/indent`);
+            const response = await axios.put(`http://localhost:5000/api/blocks/${block.block_uuid}/indent`);
             
             // Update block in state
-            const updatedBlock = { ...block, parent_block_uuid: prevBlock.block_uuid, order: 0 };
             const updatedBlocks = [...blocks];
-            updatedBlocks[index] = updatedBlock;
+            updatedBlocks[index] = response.data;
             setBlocks(updatedBlocks);
           } catch (error) {
             console.error('Error indenting block:', error);
@@ -158,12 +148,11 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
           const parentBlock = blocks.find(b => b.block_uuid === block.parent_block_uuid);
           if (parentBlock) {
             try {
-              await axios.put(`http://localhost:5000/api/blocks/${block.block_uuid}/outdent`);
+              const response = await axios.put(`http://localhost:5000/api/blocks/${block.block_uuid}/outdent`);
               
               // Update block in state
-              const updatedBlock = { ...block, parent_block_uuid: parentBlock.parent_block_uuid };
               const updatedBlocks = [...blocks];
-              updatedBlocks[index] = updatedBlock;
+              updatedBlocks[index] = response.data;
               setBlocks(updatedBlocks);
             } catch (error) {
               console.error('Error outdenting block:', error);
@@ -239,7 +228,7 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
   const renderBlocks = useCallback((parentBlockUuid: string | null = null, level: number = 0) => {
     const filteredBlocks = blocks
       .filter(block => block.parent_block_uuid === parentBlockUuid)
-      .sort((a, b) => a.order - b.order);
+      .sort((a, b) => (a.order < b.order ? -1 : a.order > b.order ? 1 : 0));
     
     return filteredBlocks.map((block, index) => {
       const blockIndex = blocks.findIndex(b => b.block_uuid === block.block_uuid);
@@ -276,7 +265,7 @@ const MainEditor: React.FC<MainEditorProps> = ({ pageId, pageTitle }) => {
   useEffect(() => {
     const initPage = async () => {
       if (pageId && blocks.length === 0 && !loading) {
-        const newInitialBlock = await createBlock(null, 0, ''); // Pass empty string for content
+        const newInitialBlock = await createBlock(null, null, ''); // Pass empty string for content
         if (newInitialBlock) {
           setBlocks([newInitialBlock]);
         }
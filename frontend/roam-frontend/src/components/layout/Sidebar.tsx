@@ -12,6 +12,9 @@ interface Page {
   updated_at: string;
 }
 
+// Largest page size the list endpoint accepts
+const PAGE_LIST_BATCH_SIZE = 1000;
+
 const Sidebar: React.FC<SidebarProps> = ({ onPageSelect }) => {
   const [pages, setPages] = useState<Page[]>([]);
   const [searchQuery, setSearchQuery] = useState('');
@@ -70,10 +73,23 @@ const Sidebar: React.FC<SidebarProps> = ({ onPageSelect }) => {
     return () => clearInterval(interval);
   }, [isRecording]);
 
+  // The page list is paginated; follow X-Next-Cursor until every page is loaded
+  const fetchAllPages = async (search?: string): Promise<Page[]> => {
+    const allPages: Page[] = [];
+    let cursor: string | undefined;
+    do {
+      const response = await axios.get('http://localhost:5000/api/pages', {
+        params: { search: search || undefined, limit: PAGE_LIST_BATCH_SIZE, cursor }
+      });
+      allPages.push(...response.data);
+      cursor = response.headers['x-next-cursor'];
+    } while (cursor);
+    return allPages;
+  };
+
   const fetchPages = async () => {
     try {
-      const response = await axios.get('http://localhost:5000/api/pages');
-      setPages(response.data);
+      setPages(await fetchAllPages());
     } catch (error) {
       console.error('Error fetching pages:', error);
     }
@@ -84,8 +100,7 @@ const Sidebar: React.FC<SidebarProps> = ({ onPageSelect }) => {
     setSearchQuery(query);
     
     try {
-      const response = await axios.get(`http://localhost:5000/api/pages?search=${query}`);
-      setPages(response.data);
+      setPages(await fetchAllPages(query));
     } catch (error) {
       console.error('Error searching pages:', error);
     }
@@ -109,12 +124,14 @@ const Sidebar: React.FC<SidebarProps> = ({ onPageSelect }) => {
     const dateString = today.toISOString().split('T')[0]; // YYYY-MM-DD format
     
     try {
-      // Check if today's daily note already exists
-      const searchResponse = await axios.get(`http://localhost:5000/api/pages?search=${dateString}`);
-      const existingPage = searchResponse.data.find((page: Page) => page.title === dateString);
-      
-      if (existingPage) {
-        onPageSelect(existingPage.id, existingPage.title);
+      // Check if today's daily note already exists (exact title lookup; 404 when it does not)
+      const lookupResponse = await axios.get('http://localhost:5000/api/pages/lookup', {
+        params: { title: dateString },
+        validateStatus: status => status === 200 || status === 404
+      });
+
+      if (lookupResponse.status === 200) {
+        onPageSelect(lookupResponse.data.id, lookupResponse.data.title);
         return;
       }
       